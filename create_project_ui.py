@@ -0,0 +1,244 @@
+#!python
+# coding: utf-8
+
+"""The interactive UI of `invoke create-project`. tasks.py imports it only when the UI is opened, since
+importing textual takes longer than loading all the other tasks."""
+
+from pathlib import Path
+from types import SimpleNamespace
+from textual import on
+from textual.app import App, ComposeResult
+from textual.widgets import Footer, Header, Input, Label, Button, Rule, Select, Checkbox, RichLog
+from textual.containers import HorizontalGroup, Grid, Center
+from textual.validation import Regex, Length, Validator, ValidationResult
+from rich.text import Text
+
+CSS = """
+    Screen {
+        align: center middle;
+    }
+
+    Label {
+        padding: 1 1;
+    }
+
+    Input.-valid {
+        border: tall $success 60%;
+    }
+    Input.-valid:focus {
+        border: tall $success;
+    }
+
+    .item_grid {
+        grid-size: 2;
+        grid-columns: 1fr 4fr;
+        width: 70%;
+        height: auto;
+        margin: 1 1;
+    }
+"""
+
+class FolderDontExistCheck(Validator):
+    """A validator for checking if the folder doesn't exist."""
+
+    def validate(self, value: str) -> ValidationResult:
+        """Check if the folder doesn't exist."""
+        folder = Path(value)
+        if folder.exists():
+            if folder.is_dir():
+                return self.failure("Folder already exists.")
+            else:
+                return self.failure("File with the same name already exists.")
+        return self.success()
+
+class FolderExistCheck(Validator):
+    """A validator for checking if the folder exist."""
+
+    def validate(self, value: str) -> ValidationResult:
+        """Check if the folder doesn't exist."""
+        folder = Path(value)
+        if folder.is_dir():
+            return self.success()
+        elif not folder.exists():
+            return self.failure("Folder doesn't exist.")
+        elif folder.is_file():
+            return self.failure("It's a file, not a folder.")
+        else:
+            return self.failure("Unknown error.")
+
+
+class CreaterProjectUi(App):
+    """The form of a project. create(ns, log) of tasks.py checks the fields and creates the project."""
+    CSS = CSS
+    BINDINGS = [("d", "toggle_dark", "Toggle dark mode"), ("q", "quit", "Quit")]
+
+    def __init__(self, create, defaults, simulators, top_langs):
+        super().__init__()
+        self.create = create
+        self.defaults = defaults
+        self.simulators = simulators
+        self.top_langs = top_langs
+
+    def compose(self) -> ComposeResult:
+        yield Header("Create Project")
+        yield Footer()
+        with Center():
+            with Grid(classes="item_grid"):
+                yield Label("Project Name:")
+                yield Input(
+                    placeholder="Project Name",
+                    id="project_name",
+                    tooltip="Enter the project name",
+                    validators=[
+                        Regex(
+                            r"^[a-zA-Z0-9_]+$",
+                            failure_description="Only alphanumeric characters and underscores are allowed.",
+                        ),
+                        Length(
+                            minimum=1,
+                            maximum=64,
+                            failure_description="Project name must be between 1 and 64 characters.",
+                        ),
+                        FolderDontExistCheck(),
+                    ],
+                )
+                yield Label("Parent Folder:")
+                yield Input(
+                    placeholder="Parent Folder",
+                    id="parent_folder",
+                    tooltip="Enter the parent folder",
+                    value = self.defaults["parent_folder"],
+                    validators=[
+                        Regex(
+                            r"^[a-zA-Z0-9_ /]+$",
+                            failure_description="Only alphanumeric characters and underscores are allowed.",
+                        ),
+                        Length(
+                            minimum=1,
+                            maximum=1024,
+                            failure_description="Project folder must be between 1 and 1024 characters.",
+                        ),
+                        FolderExistCheck(),
+                    ],
+                )
+                yield Label("DUT File:")
+                yield Input(
+                    placeholder="DUT file.",
+                    value=self.defaults["dut_file"],
+                    id="dut_file",
+                    tooltip="Enter the filename of DUT.",
+                )
+                yield Label("Test Proc:")
+                yield Input(
+                    placeholder="Test procedure name.",
+                    value=self.defaults["test_proc"],
+                    id="test_proc",
+                    tooltip="Enter test procedure name.",
+                    validators=[
+                        Regex(
+                            r"^[a-zA-Z0-9_]+$",
+                            failure_description="Only alphanumeric characters and underscores are allowed.",
+                        ),
+                        Length(
+                            minimum=1,
+                            maximum=64,
+                            failure_description="Test procedure name must be between 1 and 64 characters.",
+                        ),
+                    ],
+                )
+                yield Label("DUT module:")
+                yield Input(
+                    placeholder="DUT top module.",
+                    value=self.defaults["dut_module"],
+                    id="dut_module",
+                    tooltip="Enter the top module name of DUT.",
+                    validators=[
+                        Regex(
+                            r"^[a-zA-Z0-9_]+$",
+                            failure_description="Only alphanumeric characters and underscores are allowed.",
+                        ),
+                        Length(
+                            minimum=1,
+                            maximum=64,
+                            failure_description="DUT name must be between 1 and 64 characters.",
+                        ),
+                    ],
+                )
+                yield Label("HW Language:")
+                yield Select(
+                    options=zip(self.top_langs.keys(), self.top_langs.keys()),
+                    allow_blank=False,
+                    id="toplevel_lang",
+                )
+                yield Label("Compile args:")
+                yield Input(
+                    placeholder="Compile arguments. Eg, -D xxx=yyy.",
+                    id="compile_args",
+                    tooltip="Enter the compile arguments",
+                )
+                yield Label("Simulator:")
+                yield Select(
+                    options=zip(self.simulators, self.simulators),
+                    allow_blank=False,
+                    id="simulator",
+                )
+                yield Label("Simulation arguments:")
+                yield Input(
+                    placeholder="Simulator arguments. Eg, --vcd=anyname.vcd.",
+                    id="sim_args",
+                    tooltip="Enter the simulator arguments",
+                )
+                yield Label("Waveform:")
+                yield Checkbox("Enable", value=bool(self.defaults["waves"]), id="waves", tooltip="Enable or disable waveform generation.")
+
+        with HorizontalGroup():
+            yield Rule()
+            yield Button("CREATE", id="btn_ok", variant="primary")
+            yield Button("QUIT", id="btn_cancel", variant="default")
+            yield Rule()
+
+        self._rich_log = RichLog(id="rich_log")
+        yield self._rich_log
+
+    def action_toggle_dark(self) -> None:
+        self.theme = (
+            "textual-dark" if self.theme == "textual-light" else "textual-light"
+        )
+
+    def rich_log(self, *messages, style=None) -> None:
+        if isinstance(messages, str):
+            messages = [messages,]
+        for message in messages:
+            if isinstance(message, str):
+                self._rich_log.write(Text(message, style=style))
+            else:
+                self._rich_log.write(message)
+
+    def action_create_project(self) -> None:
+        ns = SimpleNamespace()
+        ns.project_name = self.get_widget_by_id(f"project_name").value
+        ns.parent_folder = self.get_widget_by_id(f"parent_folder").value
+        ns.dut_file = self.get_widget_by_id("dut_file").value
+        ns.dut_module = self.get_widget_by_id("dut_module").value
+        ns.test_proc = self.get_widget_by_id("test_proc").value
+        ns.toplevel_lang = self.top_langs[self.get_widget_by_id("toplevel_lang").value]
+        ns.compile_args = self.get_widget_by_id("compile_args").value
+        ns.simulator = self.get_widget_by_id("simulator").value
+        ns.sim_args = self.get_widget_by_id("sim_args").value
+        ns.waves = 1 if self.get_widget_by_id("waves").value else 0
+        self.create(ns, self.rich_log)
+
+    @on(Input.Changed)
+    def show_invalid_reasons(self, event: Input.Changed) -> None:
+        if event.validation_result and not event.validation_result.is_valid:
+            self.rich_log(event.validation_result.failure_descriptions, style="magenta")
+        else:
+            self._rich_log.clear()
+
+    @on(Button.Pressed, "#btn_cancel")
+    def on_btn_cancel_pressed(self) -> None:
+        self.exit()
+
+    @on(Button.Pressed, "#btn_ok")
+    def on_btn_ok_pressed(self) -> None:
+        self.action_create_project()
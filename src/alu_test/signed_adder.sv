@@ -22,9 +22,10 @@ module signed_adder #(parameter N = 8) (
     always_comb begin
         extended_sum = {a[N-1], a} + {b[N-1], b};
 
-        // Calculate overflow and underflow flags
-        ov = (extended_sum[N] == 1 && extended_sum[N-1] == 0);
-        uv = (extended_sum[N] == 0 && extended_sum[N-1] == 1);
+        // Calculate overflow and underflow flags. The sign bit of the extended sum is the true sign, so
+        // a positive sum with bit N-1 set overflows and a negative one with bit N-1 clear underflows.
+        ov = (extended_sum[N] == 0 && extended_sum[N-1] == 1);
+        uv = (extended_sum[N] == 1 && extended_sum[N-1] == 0);
 
         // Set output based on flags
         if (ov) begin
@@ -22,7 +22,7 @@ module signed_multiplier #(parameter N = 8) (
 
         // Calculate overflow and underflow flags
         ov = (extended_product[2*N-1] == 0 && extended_product[2*N-2:N-1] != 0); // Overflow check for positive result
-        uv = (extended_product[2*N-1] == 1 && extended_product[2*N-2:N-1] != {N-1{1'b1}}); // Underflow check for negative result
+        uv = (extended_product[2*N-1] == 1 && extended_product[2*N-2:N-1] != {N{1'b1}}); // Underflow check for negative result
 
         // Set output based on flags
         if (ov) begin
@@ -1,77 +1,92 @@
 #!python
 # coding: utf-8
 
+import functools
+import json
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque, namedtuple
 from collections.abc import Sequence
-from cocotb.triggers import FallingEdge, RisingEdge, Edge, ClockCycles, Timer, Combine, First
+from contextlib import contextmanager
+from itertools import islice
+import cocotb
+from cocotb.utils import get_sim_time
+from cocotb.triggers import FallingEdge, RisingEdge, ValueChange, ClockCycles, Timer, Combine, First, ReadOnly, NextTimeStep
 
-class PicoSecond:
-    def __rmatmul__(self, value):
-        return Timer(value, units='ps')
-    def __rmul__(self, value):
-        return Timer(value, units='ps')
-
-class NanoSecond:
-    def __rmatmul__(self, value):
-        return Timer(value, units='ns')
-    def __rmul__(self, value):
-        return Timer(value, units='ns')
-
-class MicroSecond:
-    def __rmatmul__(self, value):
-        return Timer(value, units='us')
-    def __rmul__(self, value):
-        return Timer(value, units='us')
+# The most ClockCycles a Cycles keeps for reuse, so that random cycle counts don't grow its pool without bound.
+# The ones beyond it are made for each await, as without the pool.
+POOL_SIZE = 1024
 
-class MilliSecond:
-    def __rmatmul__(self, value):
-        return Timer(value, units='ms')
-    def __rmul__(self, value):
-        return Timer(value, units='ms')
+class TimeUnit:
+    """value@unit: a Timer of the value in the unit.
 
-class Falling:
+    A Timer is made for each await. The tasks waiting on a Timer are woken up at the time it was first awaited
+    for, and cocotb has no public way to tell whether a Timer is waited on, so it can't be reused safely.
+    """
+    def __init__(self, unit):
+        self.unit = unit
     def __rmatmul__(self, value):
-        return FallingEdge(value)
-    def __rmul__(self, value):
-        return FallingEdge(value)
+        return Timer(value, unit=self.unit)
+    __rmul__ = __rmatmul__
 
-class Rising:
-    def __rmatmul__(self, value):
-        return RisingEdge(value)
-    def __rmul__(self, value):
-        return RisingEdge(value)
-
-class Edge:
-    def __rmatmul__(self, value):
-        return Edge(value)
-    def __rmul__(self, value):
-        return Edge(value)
+class SignalEdge:
+    """signal@edge: the trigger of an edge of the signal. cocotb 2 keeps a single RisingEdge, FallingEdge and
+    ValueChange per signal, so the same trigger is returned for every await."""
+    def __init__(self, trigger):
+        self.trigger = trigger
+    def __rmatmul__(self, signal):
+        return self.trigger(signal)
+    __rmul__ = __rmatmul__
 
 class Cycles:
+    """n@cycles(clk): n cycles of the clock. The ClockCycles are kept per n, and cycles() keeps the Cycles of a
+    clock, so an await in a loop makes no new objects. ClockCycles holds no state between its awaits."""
     def __init__(self, signal, rising=True):
         self.signal = signal
         self.rising = rising
+        self.pool = {}          # n -> ClockCycles
     def __rmatmul__(self, value):
-        return ClockCycles(self.signal, value, rising=self.rising)
-    def __rmul__(self, value):
-        return ClockCycles(self.signal, value, rising=self.rising)
+        trigger = self.pool.get(value)
+        if trigger is None:
+            trigger = ClockCycles(self.signal, value, rising=self.rising)
+            if len(self.pool) < POOL_SIZE:
+                self.pool[value] = trigger
+        return trigger
+    __rmul__ = __rmatmul__
+
+# The Cycles of the clocks, keyed by id(), since the hash of a handle is a Python call. A Cycles keeps its signal
+# alive, so the id isn't reused.
+_cycles = {}                    # (id(signal), rising) -> Cycles
 
-ps = PicoSecond()
-ns = NanoSecond()
-us = MicroSecond()
-ms = MilliSecond()
+# Usage: await (10@cycles(clk))
+def cycles(signal, rising=True):
+    """The Cycles of a clock, made on its first use."""
+    key = (id(signal), rising)
+    counter = _cycles.get(key)
+    if counter is None:
+        counter = _cycles[key] = Cycles(signal, rising)
+    return counter
+
+ps = TimeUnit("ps")
+ns = TimeUnit("ns")
+us = TimeUnit("us")
+ms = TimeUnit("ms")
 
 # Usage: await (clk@falling)
-falling = Falling()
+falling = SignalEdge(FallingEdge)
 # Usage: await (clk@negedge)
-negedge = Falling()
+negedge = falling
 # Usage: await (clk@rising)
-rising = Rising()
+rising = SignalEdge(RisingEdge)
 # Usage: await (clk@posedge)
-posedge = Rising()
+posedge = rising
 # Usage: await (clk@edge)
-edge = Edge()
-# Usage: await (10@cycles(clk))
-cycles = Cycles
+edge = SignalEdge(ValueChange)
 # Usage: await (combine(clk@posedge, 10@us))
 combine = Combine
 # Usage: await (first(clk@posedge, 10@us))
@@ -83,6 +98,30 @@ INT32_MAX = 2**31-1
 UINT32_MIN = 0
 UINT32_MAX = 2**32-1
 
+# The module which switches the dumping on and off. It is compiled in by `invoke run --waves window`.
+WAVES_CTRL = "waves_ctrl"
+
+# The file in the build folder which records the index of the first failed vector and the name of its test.
+# `invoke run --waves on-fail` reads it to run that test again around the failure only, with dumping.
+FAILED_VECTOR_FILE = "failed_vector"
+
+# The file in the build folder which counts the vectors and clock cycles of the test for `invoke bench`.
+BENCH_FILE = "bench.json"
+
+# The file in the build folder in which session_test() records the setup and run time of each test.
+SESSION_FILE = "session.json"
+
+# The file in the build folder which holds the progress of the long tests, for `invoke run --resume`. See Checkpoint.
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Save a checkpoint every this many seconds by default. See checkpoint_interval().
+CHECKPOINT_INTERVAL = 60
+
+# The file in the build folder which holds the functional coverage of the test. See Coverage.
+COVERAGE_FILE = "coverage.cov"
+COVERAGE_MAGIC = b"COVERDB\0"
+COVERAGE_VERSION = 1
+
 def flatten(x):
     """Flatten given parameter recursively."""
     if isinstance(x, Sequence):
@@ -92,10 +131,1114 @@ def flatten(x):
         yield x
 
 async def assign_value(dut_signal, *values, sync=None):
+    """Assign values to a signal with optional synchronization. For long streams, use StreamDriver."""
     assert sync is not None, "sync is required."
-    for v in flatten(values):
-        await (sync)
-        dut_signal.value = v
+    view = buffer_view(values[0]) if len(values) == 1 else None
+    await StreamDriver(dut_signal, sync=sync).send(view if isinstance(view, memoryview) else flatten(values))
+
+def _matcher(expected):
+    """Return a predicate of a signal value. expected is either a predicate or a value to compare with."""
+    return expected if callable(expected) else (lambda value: value == expected)
+
+async def _expire(trigger):
+    await trigger
+
+async def _expire_cycles(clk, cycles):
+    """Wait for `cycles` rising edges of clk with a single Timer after the first two edges.
+
+    The period of the clock is measured on its next two edges, so it must not change during the wait. It is
+    measured for each wait, since the clock of a signal may be stopped or restarted with another period.
+    """
+    edge = RisingEdge(clk)
+    await edge
+    if cycles == 1:
+        return
+    start = get_sim_time("step")
+    await edge
+    if cycles > 2:
+        await Timer((cycles - 2) * (get_sim_time("step") - start), unit="step")
+
+def _start_timeout(clk, timeout, unit):
+    """Start a task which finishes when the timeout expires, or return None if there is no timeout.
+
+    The timeout is in clock cycles of clk if unit is "cycles", otherwise it's a sim time in the unit. unit
+    defaults to "cycles" if clk is provided, otherwise to "ns". Either ends with a single Timer, so the timeout
+    doesn't wake Python up on every clock. A timeout in cycles waits for two edges of clk first, see
+    _expire_cycles().
+    """
+    if not timeout:
+        return None
+    if unit is None:
+        unit = "cycles" if clk is not None else "ns"
+    if unit == "cycles":
+        assert clk is not None, "A timeout in cycles requires clk."
+        return cocotb.start_soon(_expire_cycles(clk, timeout))
+    return cocotb.start_soon(_expire(Timer(timeout, unit=unit)))
+
+async def _wait_conditions(conditions, count, clk, timeout, unit):
+    """Wait until at least count of the (signal, value or predicate) conditions hold.
+
+    Python only wakes up when one of the signals changes. If clk is provided, the conditions are sampled in
+    the ReadOnly phase of the time step of a change, once all the signals have settled, so a register which
+    changes at an edge of clk is seen at that edge. The wait then returns in the next time step, where the
+    signals can be written again and are sampled by the DUT at the next edge, as after a rising edge of the
+    polling loop. Without clk, the conditions are checked at every change. Return the indexes of the
+    conditions which hold.
+    """
+    signals = [signal for signal, _ in conditions]
+    matchers = [_matcher(expected) for _, expected in conditions]
+
+    def matched():
+        return [i for i, (signal, match) in enumerate(zip(signals, matchers)) if match(signal.value)]
+
+    indexes = matched()
+    if len(indexes) >= count:
+        return indexes
+    timer = _start_timeout(clk, timeout, unit)
+    triggers = [signal.value_change for signal in signals]
+    if timer is not None:
+        triggers.append(timer.complete)
+    change = triggers[0] if len(triggers) == 1 else First(*triggers)
+
+    def expired():
+        return timer is not None and timer.done()
+
+    try:
+        while True:
+            await change
+            settle = clk is not None and not expired()
+            if settle:
+                await ReadOnly()
+            indexes = matched()
+            if len(indexes) >= count:
+                if settle:
+                    await NextTimeStep()
+                return indexes
+            if expired():
+                expected = ", ".join(f"{signal._path} to match {expected}" for signal, expected in conditions)
+                raise TimeoutError(f"Timeout waiting for {expected}")
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+async def wait_all(*conditions, clk=None, timeout=None, unit=None):
+    """Wait until all the conditions hold. Each condition is a (signal, value) pair, or a (signal, predicate)
+    pair whose predicate is called with the value of the signal.
+
+    Usage: await wait_all((dut.valid, 1), (dut.count, lambda v: v >= 4), clk=dut.clk, timeout=100)
+    """
+    await _wait_conditions(conditions, len(conditions), clk, timeout, unit)
+
+async def wait_any(*conditions, clk=None, timeout=None, unit=None):
+    """Wait until any of the conditions holds and return the index of the first one which holds. The conditions
+    are the same as the ones of wait_all().
+    """
+    return (await _wait_conditions(conditions, 1, clk, timeout, unit))[0]
+
+async def until_match(signal, value=1, clk=None, timeout=None, unit=None):
+    """Wait for a signal to become a specific value. If clk is provided, the value is sampled once the time step
+    of its change has settled, see _wait_conditions().
+
+    The timeout is in clock cycles if clk is provided, otherwise in ns. Pass unit to give it in another time
+    unit, or unit="cycles" for clock cycles. TimeoutError is raised when it expires.
+    """
+    await _wait_conditions(((signal, value),), 1, clk, timeout, unit)
+
+# The cocotb versions whose simulator handles signal_reader() reads directly. The handles are private to cocotb,
+# so other versions read the public handle.value.
+RAW_READ_VERSIONS = ("2.0", "2.1")
+_raw_read = ".".join(cocotb.__version__.split(".")[:2]) in RAW_READ_VERSIONS
+
+def signal_reader(handle):
+    """Return a function which reads a signal as a string of its bits, MSB first, e.g. "01x0".
+
+    With the cocotb versions of RAW_READ_VERSIONS, it reads the string straight from the simulator, so that no
+    LogicArray is built per read. Otherwise it is str(handle.value). An X or Z bit makes int(reader(), 2) raise
+    ValueError.
+    """
+    read = getattr(getattr(handle, "_handle", None), "get_signal_val_binstr", None) if _raw_read else None
+    return read if read is not None else lambda: str(handle.value)
+
+class SignalBundle:
+    """A named set of DUT signals whose handles are resolved only once.
+
+    Usage:
+        inputs = SignalBundle(dut, ("a", "b"))
+        outputs = SignalBundle(dut, ("c", "ov", "uv"))
+        inputs.write((1, 2))
+        c, ov, uv = await outputs.snapshot()
+    """
+    def __init__(self, dut, names):
+        self.names = tuple(names)
+        self.handles = tuple(getattr(dut, name) for name in self.names)
+        self._readers = tuple(signal_reader(handle) for handle in self.handles)
+        self.Record = namedtuple("Record", self.names)
+
+    def read(self):
+        """Read all signals as a tuple of unsigned integers."""
+        return tuple([int(reader(), 2) for reader in self._readers])
+
+    def read_record(self):
+        """Read all signals as a named tuple."""
+        return self.Record._make(self.read())
+
+    async def snapshot(self):
+        """Wait for the ReadOnly phase and read all signals at once."""
+        await ReadOnly()
+        return self.read()
+
+    def write(self, values):
+        """Write all signals, in the order of the names."""
+        for handle, value in zip(self.handles, values):
+            handle.value = value
+
+class VectorPipeline:
+    """Drive one vector per clock and check the outputs when they come out of the pipeline.
+
+    The driver writes a new vector right after every rising edge of clk, and the model's answer of the
+    vector is queued with the clock count. The monitor samples the outputs in the ReadOnly phase of every
+    clock and checks them against the answer of the vector driven `latency` clocks earlier. A registered
+    dut.sv wrapper has a latency of 1.
+
+    drive(vector):                   Write the inputs of a vector.
+    sample():                        Read the outputs.
+    model(vector):                   Return the expected outputs of a vector.
+    check(vector, answer, result):   Compare the outputs. Assert equality if it's not given.
+    checkpoint:                      A Checkpoint which saves the progress of run(), and skips the vectors
+                                     checked before when the run resumes.
+    """
+    # The checked vectors between two looks at the clock of the checkpoint.
+    CHECKPOINT_STRIDE = 4096
+
+    def __init__(self, clk, drive, sample, model, check=None, latency=1, checkpoint=None):
+        assert latency >= 1, "latency must be at least one clock."
+        self.clk = clk
+        self.drive = drive
+        self.sample = sample
+        self.model = model
+        self.check = check or self.assert_equal
+        self.latency = latency
+        self.checkpoint = checkpoint
+        self.pending = deque()
+        self.count = 0
+
+    @staticmethod
+    def assert_equal(vector, answer, result):
+        assert result == answer, f"Result mismatch: {vector=}, {result=} != {answer=}"
+
+    def _check_ready(self, clock):
+        """Check the outputs of the oldest vector if it has come out."""
+        pending = self.pending
+        if pending and clock - pending[0][0] >= self.latency:
+            _, vector, answer = pending.popleft()
+            try:
+                self.check(vector, answer, self.sample())
+            except AssertionError:
+                record_failed_vector(self.count)
+                raise
+            self.count += 1
+            if self.checkpoint is not None and not self.count % self.CHECKPOINT_STRIDE and self.checkpoint.due():
+                self.checkpoint.save(self.count)
+
+    async def run(self, vectors, answers=None):
+        """Drive and check all the vectors. Return the number of checked vectors.
+
+        answers are the expected outputs of the vectors, e.g. from a VectorFile. The model isn't called then.
+        With a resumed checkpoint, the vectors checked before the interruption are skipped, and counted.
+        """
+        clk_edge = RisingEdge(self.clk)
+        read_only = ReadOnly()
+        drive, pending = self.drive, self.pending
+        model = self.model
+        start = self.checkpoint.start if self.checkpoint is not None else 0
+        if start:
+            vectors = vectors[start:] if isinstance(vectors, Sequence) else islice(vectors, start, None)
+            if answers is not None:
+                answers = answers[start:] if isinstance(answers, Sequence) else islice(answers, start, None)
+            self.count += start
+        pairs = ((vector, model(vector)) for vector in vectors) if answers is None else zip(vectors, answers)
+        clock = 0
+        for vector, answer in pairs:
+            await clk_edge
+            clock += 1
+            drive(vector)
+            pending.append((clock, vector, answer))
+            await read_only
+            self._check_ready(clock)
+        # Flush the vectors still in the pipeline. The inputs hold the last vector.
+        while pending:
+            await clk_edge
+            clock += 1
+            await read_only
+            self._check_ready(clock)
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.count)
+        record_bench(vectors=self.count - start, cycles=clock)
+        return self.count
+
+class Scoreboard:
+    """Record the mismatches of a test and go on, so that one run shows the whole failure pattern.
+
+    check() is the check of a VectorPipeline. The first `capacity` mismatches are kept in a fixed-size array,
+    one row per mismatch: the index of the vector, its inputs, the expected and the actual outputs, all of up
+    to 64 bits. Every mismatch is also counted in its class. By default, the class is the mismatched outputs
+    and the operand class (see operand_classes()) of each input, e.g. "c_signed_sat: a=min, b=negative".
+    finish() fails the test with a report of the classes if anything mismatched.
+
+    inputs, outputs:  The SignalBundles of the vectors and the results.
+    max_failures:     Stop the test at this many mismatches. Default to failure_cap(), 0 to run to the end.
+    classify(vector, answer, result): Return the class of a mismatch.
+
+    Usage:
+        scoreboard = Scoreboard(inputs, outputs)
+        pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, model, scoreboard.check)
+        await pipeline.run(vectors)
+        scoreboard.finish()
+    """
+    def __init__(self, inputs, outputs, capacity=1024, max_failures=None, classify=None):
+        self.inputs = inputs.names
+        self.outputs = outputs.names
+        self.capacity = capacity
+        self.max_failures = failure_cap() if max_failures is None else max_failures
+        self.classify = classify or self.operand_class
+        self.row = 1 + len(self.inputs) + 2 * len(self.outputs)
+        self.log = array("Q", bytes(8 * capacity * self.row))
+        self.logged = 0
+        self.checked = 0
+        self.failures = 0
+        self.groups = {}    # class -> [number of mismatches, index of the first vector]
+        self._classes = []
+        for handle in inputs.handles:
+            classes = operand_classes(len(handle))
+            self._classes.append(([low for _, low, _, _ in classes], [name for name, _, _, _ in classes]))
+
+    def operand_class(self, vector, answer, result):
+        """The default class of a mismatch: the mismatched outputs and the operand class of each input."""
+        outputs = ",".join(name for name, x, y in zip(self.outputs, result, answer) if x != y)
+        operands = ", ".join(f"{name}={names[bisect_right(lows, value) - 1]}"
+                             for name, value, (lows, names) in zip(self.inputs, vector, self._classes))
+        return f"{outputs}: {operands}"
+
+    def check(self, vector, answer, result):
+        """Compare the outputs of a vector and record a mismatch. Return True if they match."""
+        index = self.checked
+        self.checked += 1
+        if result == answer:
+            return True
+        if not self.failures:
+            record_failed_vector(index)
+        self.failures += 1
+        if self.logged < self.capacity:
+            start = self.logged * self.row
+            self.log[start:start + self.row] = array("Q", (index, *vector, *answer, *result))
+            self.logged += 1
+        key = self.classify(vector, answer, result)
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = [1, index]
+        else:
+            group[0] += 1
+        if self.max_failures and self.failures >= self.max_failures:
+            raise AssertionError(f"Stopped at {self.failures} mismatches.\n{self.report()}")
+        return False
+
+    def entries(self):
+        """Iterate over the logged mismatches as (index, vector, answer, result)."""
+        inputs, outputs = len(self.inputs), len(self.outputs)
+        for start in range(0, self.logged * self.row, self.row):
+            row = self.log[start:start + self.row]
+            yield row[0], tuple(row[1:1 + inputs]), tuple(row[1 + inputs:1 + inputs + outputs]), tuple(row[1 + inputs + outputs:])
+
+    def report(self, examples=8):
+        """Describe the mismatch classes, the most frequent first, and the first mismatches."""
+        lines = [f"{self.failures} of {self.checked} vectors mismatched, in {len(self.groups)} class(es):",
+                 f"{'Count':>10} {'First':>10}  Class"]
+        for key, (count, first) in sorted(self.groups.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{count:10} {first:10}  {key}")
+        lines.append("The first mismatches:")
+        for index, vector, answer, result in islice(self.entries(), examples):
+            operands = ", ".join(f"{name}={hex(value)}" for name, value in zip(self.inputs, vector))
+            diff = ", ".join(f"{name}({hex(x)}) != answer({hex(y)})" for name, x, y in zip(self.outputs, result, answer) if x != y)
+            lines.append(f"  #{index} {operands}: {diff}")
+        return "\n".join(lines)
+
+    def finish(self):
+        """Fail the test with the report if any vector mismatched."""
+        if self.failures:
+            raise AssertionError(self.report())
+
+    def state(self):
+        """The counts and the logged mismatches, for a Checkpoint."""
+        return {"checked": self.checked, "failures": self.failures, "groups": self.groups,
+                "log": self.log[:self.logged * self.row].tolist()}
+
+    def restore(self, state):
+        """Go on from the state of a Checkpoint."""
+        self.checked = state["checked"]
+        self.failures = state["failures"]
+        self.groups = {key: list(group) for key, group in state["groups"].items()}
+        self.logged = len(state["log"]) // self.row
+        self.log[:len(state["log"])] = array("Q", state["log"])
+        if self.groups:
+            record_failed_vector(min(first for _, first in self.groups.values()))
+
+class Checkpoint:
+    """Save the progress of a long test at intervals, so that an interrupted run goes on from there.
+
+    The checkpoint of a test is the number of its checked vectors and the state of its Scoreboard and Coverage,
+    kept under the name of the test in the checkpoint file of the build folder. The file is a few KB and is
+    replaced at once, so an interruption never leaves half of it. The VectorPipeline which holds the
+    checkpoint saves it every `interval` seconds, default to checkpoint_interval(), and when it is done.
+
+    When the run resumes (see resuming()), the state is restored and the pipeline skips the checked vectors by
+    slicing them, so the DUT is reset and the test goes on without driving them again. The vectors must come
+    in the same order, so the checkpoint is only taken for the same build, shard and random seed.
+
+    Usage:
+        checkpoint = Checkpoint("test_proc", scoreboard, coverage)
+        pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, model, check, checkpoint=checkpoint)
+        await pipeline.run(vectors)
+    """
+    def __init__(self, name, scoreboard=None, coverage=None, interval=None, path=None):
+        self.name = name
+        self.scoreboard = scoreboard
+        self.coverage = coverage
+        self.interval = checkpoint_interval() if interval is None else interval
+        self.path = path or os.path.join(os.environ.get("SIM_BUILD", "sim_build"), CHECKPOINT_FILE)
+        # The run of this session, which a checkpoint must come from to be resumed.
+        self.run = {"build": os.environ.get("BUILD_KEY"), "shard": list(shard_info()),
+                    "seed": os.environ.get("COCOTB_RANDOM_SEED")}
+        self.start = self.restore() if resuming() else 0
+        self.saved = time.monotonic()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def due(self):
+        """Whether the interval has passed since the last save."""
+        return self.interval > 0 and time.monotonic() - self.saved >= self.interval
+
+    def save(self, index):
+        """Save the state after `index` checked vectors."""
+        checkpoint = self._read()
+        if {name: checkpoint.get(name) for name in self.run} != self.run:
+            checkpoint = dict(self.run, tests={})
+        checkpoint["tests"][self.name] = {
+            "index": index,
+            "scoreboard": self.scoreboard.state() if self.scoreboard is not None else None,
+            "coverage": [item.counts.tolist() for item in self.coverage.points + self.coverage.crosses] if self.coverage is not None else None,
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, self.path)
+        self.saved = time.monotonic()
+
+    def restore(self):
+        """Restore the saved state of the test. Return the number of its checked vectors, 0 if it has none."""
+        checkpoint = self._read()
+        saved = checkpoint.get("tests", {}).get(self.name)
+        if saved is None:
+            return 0
+        for name, value in self.run.items():
+            if checkpoint.get(name) != value:
+                raise ValueError(f"The checkpoint of {self.name} in {self.path} was saved with {name} {checkpoint.get(name)}, "
+                                 f"not {value}. Run it again without resuming.")
+        if self.scoreboard is not None and saved["scoreboard"] is not None:
+            self.scoreboard.restore(saved["scoreboard"])
+        if self.coverage is not None and saved["coverage"] is not None:
+            for item, counts in zip(self.coverage.points + self.coverage.crosses, saved["coverage"]):
+                item.counts[:] = array("Q", counts)
+        cocotb.top._log.info(f"Resume {self.name} from its checkpoint after {saved['index']} vectors.")
+        return saved["index"]
+
+# The item formats which memoryview reads as Python numbers.
+NATIVE_FORMATS = set("bBhHiIlLqQnN?efd")
+
+def buffer_view(buffer):
+    """Return a flat view of a bytes, array.array or NumPy array buffer without copying it. Its items are Python
+    integers, which are faster to write to signals than NumPy scalars. Other iterables are returned as they are.
+
+    Two kinds of buffers are copied: arrays of more than one dimension which aren't C-contiguous, e.g. a slice
+    of columns, and arrays of items memoryview can't read, e.g. of the non-native byte order np.dtype(">u2").
+    NumPy copies them into a C-contiguous array of the native byte order. Other arrays whose items still can't
+    be read, like complex ones, are turned into a list.
+    """
+    try:
+        view = memoryview(buffer)
+    except TypeError:
+        return buffer
+    native = view.format.lstrip("@") in NATIVE_FORMATS
+    if not native or (view.ndim > 1 and not view.c_contiguous):
+        if hasattr(buffer, "dtype"):
+            buffer = buffer.astype(buffer.dtype.newbyteorder("="), order="C")
+            view = memoryview(buffer)
+            if view.format.lstrip("@") not in NATIVE_FORMATS:
+                return buffer.ravel().tolist()
+        elif native:
+            view = memoryview(view.tobytes()).cast(view.format)
+        else:
+            return buffer
+    if view.ndim > 1:
+        # Only C-contiguous buffers can be flattened without a copy.
+        view = view.cast("B").cast(view.format)
+    return view
+
+class StreamDriver:
+    """Drive a stream of samples into one or more signals, one sample per sync event.
+
+    The samples come from bytes, array.array or NumPy arrays, which are read in place through buffer_view(),
+    or from any other iterable. With several signals, pass one buffer per signal, or a single 2-D buffer with
+    one row per sample.
+
+    sync:   The trigger of each sample. Default to the rising edge of clk.
+    valid:  Optional. It's set to 1 while a sample is driven and back to 0 after the last one.
+    ready:  Optional backpressure. A sample is held until ready is 1 in the ReadOnly phase before a rising
+            edge of clk, i.e. until the DUT takes it at that edge. The held cycles are counted in `stalls`.
+
+    Usage:
+        driver = StreamDriver((dut.a, dut.b), clk=dut.clk, valid=dut.in_valid, ready=dut.in_ready)
+        await driver.send(np.array([[1, 2], [3, 4]]))
+        await driver.send(a_bytes, b_bytes)
+    """
+    def __init__(self, signals, clk=None, sync=None, valid=None, ready=None):
+        self.handles = tuple(signals) if isinstance(signals, Sequence) else (signals,)
+        assert sync is not None or clk is not None, "clk or sync is required."
+        assert ready is None or clk is not None, "A ready handshake requires clk."
+        self.sync = sync if sync is not None else RisingEdge(clk)
+        self.clk = clk
+        self.valid = valid
+        self.ready = ready
+        self.stalls = 0
+        if len(self.handles) == 1:
+            handle = self.handles[0]
+
+            def write(sample):
+                handle.value = sample
+        else:
+            handles = self.handles
+
+            def write(sample):
+                for handle, value in zip(handles, sample):
+                    handle.value = value
+        self._write = write
+
+    def samples(self, buffers):
+        """Iterate over the samples of the buffers."""
+        views = [buffer_view(buffer) for buffer in buffers]
+        width = len(self.handles)
+        if width == 1:
+            assert len(views) == 1, "Only one buffer can be driven into one signal."
+            return views[0]
+        if len(views) == 1:
+            # One row of the flattened 2-D buffer per sample.
+            return zip(*[iter(views[0])] * width)
+        assert len(views) == width, f"{width} buffers are required, one per signal."
+        return zip(*views)
+
+    async def send(self, *buffers):
+        """Drive all the samples of the buffers. Return the number of driven samples."""
+        samples = self.samples(buffers)
+        if self.ready is not None:
+            return await self._send_ready(samples)
+        sync, write, valid = self.sync, self._write, self.valid
+        count = 0
+        for sample in samples:
+            await sync
+            write(sample)
+            if count == 0 and valid is not None:
+                valid.value = 1
+            count += 1
+        if count and valid is not None:
+            await sync
+            valid.value = 0
+        return count
+
+    async def _send_ready(self, samples):
+        sync, write, valid = self.sync, self._write, self.valid
+        clk_edge, read_only = RisingEdge(self.clk), ReadOnly()
+        ready = signal_reader(self.ready)
+        count = 0
+        for sample in samples:
+            # The first sample waits for sync, the next ones for the edge which takes the previous sample.
+            await (clk_edge if count else sync)
+            write(sample)
+            if count == 0 and valid is not None:
+                valid.value = 1
+            count += 1
+            await read_only
+            while ready() != "1":
+                self.stalls += 1
+                await clk_edge
+                await read_only
+        if count:
+            await clk_edge
+            if valid is not None:
+                valid.value = 0
+        return count
+
+def shard_info():
+    """Return (index, count) of the shard run by this simulation.
+
+    The shard is given by the +shard_index=I and +shard_count=N plusargs, or by the SHARD_INDEX and
+    SHARD_COUNT environment variables which are set by `invoke run --jobs N`. Default to (0, 1).
+    """
+    index = cocotb.plusargs.get("shard_index", os.environ.get("SHARD_INDEX", 0))
+    count = cocotb.plusargs.get("shard_count", os.environ.get("SHARD_COUNT", 1))
+    return int(index), int(count)
+
+def shard_range(total):
+    """Return the (start, stop) range of this shard within `total` vectors."""
+    index, count = shard_info()
+    assert 0 <= index < count, f"Invalid shard {index} of {count}."
+    return total * index // count, total * (index + 1) // count
+
+def vector_range():
+    """Return the slice of the shard's vectors to run.
+
+    It is given by the +vector_range=START:STOP plusarg or the VECTOR_RANGE environment variable, which is
+    set by `invoke run --waves on-fail` when it reruns the vectors before a failure. Default to all vectors.
+    """
+    value = str(cocotb.plusargs.get("vector_range", os.environ.get("VECTOR_RANGE", ":")))
+    start, _, stop = value.partition(":")
+    return slice(int(start) if start else None, int(stop) if stop else None)
+
+class CoverageBitmap:
+    """The hit flags of `count` coverage bins, one bit per bin in a bytearray."""
+    def __init__(self, count):
+        self.count = count
+        self.bits = bytearray((count + 7) // 8)
+        self.covered = 0
+
+    def hit(self, index):
+        """Mark a bin as hit. Return True if it wasn't hit before."""
+        byte, mask = index >> 3, 1 << (index & 7)
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        self.covered += 1
+        return True
+
+    def __contains__(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def ratio(self):
+        """The share of the covered bins."""
+        return self.covered / self.count if self.count else 1.0
+
+def operand_classes(width, near=16):
+    """Split the `width`-bit values into corner-case classes. Return a list of (name, low, high, weight).
+
+    The classes are contiguous ranges of the raw values, in order: zero, one, small, positive, near and at
+    the signed maximum, at and near the signed minimum, negative, near and at -1 (the unsigned maximum).
+    The single-value corners have the largest weights, then the classes near them.
+    """
+    top = (1 << width) - 1
+    max_signed = (1 << (width - 1)) - 1
+    near = max(1, min(near, (1 << width) >> 4))
+    classes = [
+        ("zero", 0, 0, 4),
+        ("one", 1, 1, 4),
+        ("small", 2, near - 1, 2),
+        ("positive", near, max_signed - near, 1),
+        ("near_max", max_signed - near + 1, max_signed - 1, 2),
+        ("max", max_signed, max_signed, 4),
+        ("min", max_signed + 1, max_signed + 1, 4),
+        ("near_min", max_signed + 2, max_signed + near, 2),
+        ("negative", max_signed + near + 1, top - near, 1),
+        ("near_minus_one", top - near + 1, top - 1, 2),
+        ("minus_one", top, top, 4),
+    ]
+    # Narrow operands have fewer classes. The corners which coincide go to the earlier class.
+    disjoint = []
+    for name, low, high, weight in classes:
+        low = max(low, disjoint[-1][2] + 1) if disjoint else low
+        if low <= high:
+            disjoint.append((name, low, high, weight))
+    return disjoint
+
+# The single-value classes of operand_classes(), which make good short tests of their own.
+CORNERS = ("zero", "one", "max", "min", "minus_one")
+
+def corner_values(width, name):
+    """The values of an operand class of operand_classes() and their two neighbours, which wrap around.
+    Empty if the operands are too narrow to have the class."""
+    mask = (1 << width) - 1
+    for cls, low, high, _ in operand_classes(width):
+        if cls == name:
+            return sorted({value & mask for value in range(low - 1, high + 2)})
+    return []
+
+class RandomOperands:
+    """Constrained-random (a, b) operands of `width` bits for adders and multipliers, driven by coverage.
+
+    The coverage bins are the crosses of the operand classes of a and b (see operand_classes()), and the
+    edge bins where the signed or the unsigned result of op ("add" or "mult") is at, or one step beyond,
+    a limit of its range, i.e. where the saturation starts and the overflow and underflow flags switch.
+
+    Most vectors aim at a random uncovered bin. The others, `explore` of them, are random with the corner
+    classes weighted up. vectors() stops when the `goal` share of the bins is covered and at least `minimum`
+    vectors are made, or after `limit` vectors, which defaults to 1000 per bin, in case a bin can't be hit at
+    all. The bins don't grow with the width and are covered after a few hundred vectors, so minimum defaults
+    to `width` vectors per bin, and wider operands get more random vectors after the bins are covered.
+
+    Usage:
+        engine = RandomOperands(16, "add", seed=cocotb.RANDOM_SEED)
+        vectors = list(engine.vectors())
+    """
+    EDGES = ("signed_at_max", "signed_over_max", "signed_at_min", "signed_under_min",
+             "unsigned_at_max", "unsigned_over_max")
+
+    def __init__(self, width, op="add", goal=1.0, explore=0.25, seed=None, limit=None, minimum=None):
+        assert op in ("add", "mult"), f"Unknown operator {op}."
+        self.width = width
+        self.op = op
+        self.goal = goal
+        self.explore = explore
+        self.rng = random.Random(seed)
+        self.classes = operand_classes(width)
+        self._lows = [low for _, low, _, _ in self.classes]
+        self._cum_weights = []
+        for _, _, _, weight in self.classes:
+            self._cum_weights.append(weight + (self._cum_weights[-1] if self._cum_weights else 0))
+        self.mask = (1 << width) - 1
+        self.max_signed = (1 << (width - 1)) - 1
+        self.min_signed = -1 << (width - 1)
+        self.cross_bins = len(self.classes) ** 2
+        self.coverage = CoverageBitmap(self.cross_bins + len(self.EDGES))
+        self.missing = list(range(self.coverage.count))
+        self.limit = limit if limit is not None else 1000 * self.coverage.count
+        self.minimum = min(self.limit, minimum if minimum is not None else width * self.coverage.count)
+
+    def bin_name(self, index):
+        if index >= self.cross_bins:
+            return self.EDGES[index - self.cross_bins]
+        i, j = divmod(index, len(self.classes))
+        return f"a={self.classes[i][0]},b={self.classes[j][0]}"
+
+    def uncovered(self):
+        """The names of the bins which aren't covered yet."""
+        return [self.bin_name(i) for i in range(self.coverage.count) if i not in self.coverage]
+
+    def _signed(self, value):
+        return value - ((value >> (self.width - 1) & 1) << self.width)
+
+    def edges(self, a, b):
+        """Return the indexes of the EDGES hit by a vector."""
+        mult = self.op == "mult"
+        sa, sb = self._signed(a), self._signed(b)
+        hits = []
+        result, step = (sa * sb, max(1, abs(sa))) if mult else (sa + sb, 1)
+        if self.max_signed - step < result <= self.max_signed:
+            hits.append(0)
+        elif self.max_signed < result <= self.max_signed + step:
+            hits.append(1)
+        elif self.min_signed <= result < self.min_signed + step:
+            hits.append(2)
+        elif self.min_signed - step <= result < self.min_signed:
+            hits.append(3)
+        result, step = (a * b, max(1, a)) if mult else (a + b, 1)
+        if self.mask - step < result <= self.mask:
+            hits.append(4)
+        elif self.mask < result <= self.mask + step:
+            hits.append(5)
+        return hits
+
+    def sample(self, a, b):
+        """Count a vector in the coverage bins. Return True if it hit a new bin."""
+        count = len(self.classes)
+        new = self.coverage.hit((bisect_right(self._lows, a) - 1) * count + bisect_right(self._lows, b) - 1)
+        for edge in self.edges(a, b):
+            new |= self.coverage.hit(self.cross_bins + edge)
+        return new
+
+    def _value(self, index):
+        _, low, high, _ = self.classes[index]
+        return self.rng.randint(low, high)
+
+    def _random_vector(self):
+        a, b = self.rng.choices(range(len(self.classes)), cum_weights=self._cum_weights, k=2)
+        return self._value(a), self._value(b)
+
+    def _edge_vector(self, edge, tries=16):
+        """Solve b for a random a so that the vector hits the edge. Return None if no b is found."""
+        signed = edge < 4
+        target = (self.max_signed, self.max_signed, self.min_signed, self.min_signed, self.mask, self.mask)[edge]
+        low, high = (self.min_signed, self.max_signed) if signed else (0, self.mask)
+        for _ in range(tries):
+            a = self._random_vector()[0]
+            x = self._signed(a) if signed else a
+            if self.op == "add":
+                candidates = (target - x, target + 1 - x, target - 1 - x)
+            else:
+                candidates = (target // x, target // x + 1) if x else ()
+            for y in candidates:
+                if low <= y <= high and edge in self.edges(a, y & self.mask):
+                    return a, y & self.mask
+        return None
+
+    def next(self):
+        """Generate the next vector, without counting it."""
+        missing = self.missing
+        while missing and self.rng.random() >= self.explore:
+            i = self.rng.randrange(len(missing))
+            index = missing[i]
+            if index in self.coverage:
+                missing[i] = missing[-1]
+                missing.pop()
+                continue
+            if index >= self.cross_bins:
+                vector = self._edge_vector(index - self.cross_bins)
+                if vector is not None:
+                    return vector
+                break
+            i, j = divmod(index, len(self.classes))
+            return self._value(i), self._value(j)
+        return self._random_vector()
+
+    def vectors(self):
+        """Generate and count vectors until the coverage goal and the minimum, or the limit, are reached."""
+        count = 0
+        while (self.coverage.ratio() < self.goal or count < self.minimum) and count < self.limit:
+            vector = self.next()
+            self.sample(*vector)
+            count += 1
+            yield vector
+
+def flag_bins():
+    """The bins of a 1-bit flag."""
+    return {"0": 0, "1": 1}
+
+def sign_bins(width):
+    """The bins of the sign of a `width`-bit two's complement value."""
+    return {"zero": 0, "positive": (1, (1 << (width - 1)) - 1), "negative": (1 << (width - 1), (1 << width) - 1)}
+
+class CoverPoint:
+    """A cover point which counts the hits of each of its bins in an array.
+
+    bins maps the bin names to a value, an inclusive (low, high) range or a predicate of the value. A value
+    hits the first bin which matches it, or none. field is the name of the sampled value, default to name.
+    """
+    def __init__(self, name, bins, field=None):
+        self.name = name
+        self.field = field or name
+        self.bins = tuple(bins)
+        specs = [(spec, spec) if isinstance(spec, int) else spec for spec in bins.values()]
+        self.counts = array("Q", bytes(8 * len(specs)))
+        if not any(callable(spec) for spec in specs) and all(high < low for (_, high), (low, _) in zip(specs, specs[1:])):
+            # Sorted disjoint ranges are searched with bisect.
+            self._lows = [low for low, _ in specs]
+            self._highs = [high for _, high in specs]
+            self.index = self._range_index
+        else:
+            self._specs = specs
+            self.index = self._match_index
+
+    def _range_index(self, value):
+        i = bisect_right(self._lows, value) - 1
+        return i if i >= 0 and value <= self._highs[i] else None
+
+    def _match_index(self, value):
+        for i, spec in enumerate(self._specs):
+            if spec(value) if callable(spec) else spec[0] <= value <= spec[1]:
+                return i
+        return None
+
+    def bin_names(self):
+        return list(self.bins)
+
+class Cross:
+    """The cross of cover points. Its bins are all the combinations of their bins, in an array."""
+    def __init__(self, name, points):
+        self.name = name
+        self.points = tuple(points)
+        size = 1
+        for point in self.points:
+            size *= len(point.bins)
+        self.counts = array("Q", bytes(8 * size))
+
+    def bin_names(self):
+        names = [""]
+        for point in self.points:
+            names = [f"{prefix},{point.name}={bin}" if prefix else f"{point.name}={bin}" for prefix in names for bin in point.bins]
+        return names
+
+class Coverage:
+    """A functional coverage collector of cover points and crosses.
+
+    The hit counts are kept in arrays, so save() writes them to a compact binary file, and the files of
+    many shards and runs are summed by merge_coverage_files() or `invoke coverage-merge`.
+
+    Usage:
+        cov = Coverage()
+        a_sign = cov.point("a_sign", sign_bins(8), field="a")
+        ov = cov.point("ov_signed", flag_bins())
+        cov.cross("a_sign_x_ov", a_sign, ov)
+        cov.sample({"a": 0x80, "ov_signed": 1})
+        cov.save()
+    """
+    def __init__(self):
+        self.points = []
+        self.crosses = []
+
+    def point(self, name, bins, field=None):
+        point = CoverPoint(name, bins, field)
+        self.points.append(point)
+        return point
+
+    def cross(self, name, *points):
+        cross = Cross(name, points)
+        # The positions of the crossed points, to find their bins among the ones of a sample.
+        cross.positions = [(self.points.index(point), len(point.bins)) for point in points]
+        self.crosses.append(cross)
+        return cross
+
+    def sample(self, values):
+        """Count a sample. values maps the fields of the cover points to their values."""
+        indexes = []
+        for point in self.points:
+            i = point.index(values[point.field])
+            indexes.append(i)
+            if i is not None:
+                point.counts[i] += 1
+        for cross in self.crosses:
+            index = 0
+            for position, size in cross.positions:
+                i = indexes[position]
+                if i is None:
+                    break
+                index = index * size + i
+            else:
+                cross.counts[index] += 1
+
+    def items(self):
+        """The description of the cover points and the crosses, which must match for files to be merged."""
+        return [{"name": item.name, "bins": item.bin_names()} for item in self.points + self.crosses]
+
+    def save(self, path=None):
+        """Write the coverage into the coverage file of the build folder, adding the counts already in it."""
+        path = path or os.path.join(os.environ.get("SIM_BUILD", "sim_build"), COVERAGE_FILE)
+        runs, items = 1, self.items()
+        counts = [item.counts for item in self.points + self.crosses]
+        if os.path.exists(path):
+            runs, items, counts = merge_coverage_files([path], items, runs, counts)
+        write_coverage_file(path, runs, items, counts)
+
+def _little_endian(counts):
+    """The counts in the byte order of the coverage files. Swapping is its own inverse, so it reads them too."""
+    if sys.byteorder == "little":
+        return counts
+    counts = array("Q", counts)
+    counts.byteswap()
+    return counts
+
+def write_coverage_file(path, runs, items, counts):
+    """Write a coverage file: a magic, the length of the JSON header, the header with the number of runs and
+    the bins of the items, then the hit counts of the items as little endian 64-bit integers.
+    """
+    header = json.dumps({"version": COVERAGE_VERSION, "runs": runs, "items": items}).encode()
+    with open(path, "wb") as f:
+        f.write(COVERAGE_MAGIC + struct.pack("<I", len(header)) + header)
+        for values in counts:
+            f.write(_little_endian(values).tobytes())
+
+def read_coverage_file(path):
+    """Read a coverage file. Return (runs, items, counts)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(COVERAGE_MAGIC), f"{path} is not a coverage file."
+    offset = len(COVERAGE_MAGIC) + 4
+    (size,) = struct.unpack_from("<I", data, len(COVERAGE_MAGIC))
+    header = json.loads(data[offset:offset + size])
+    assert header["version"] == COVERAGE_VERSION, f"Unsupported version {header['version']} of {path}."
+    offset += size
+    counts = []
+    for item in header["items"]:
+        values = array("Q")
+        values.frombytes(data[offset:offset + 8 * len(item["bins"])])
+        counts.append(_little_endian(values))
+        offset += 8 * len(item["bins"])
+    return header["runs"], header["items"], counts
+
+def merge_coverage_files(paths, items=None, runs=0, counts=None):
+    """Sum the counts of coverage files, and of the given items, runs and counts if any. The files must have
+    the same items. Return (runs, items, counts).
+    """
+    for path in paths:
+        file_runs, file_items, file_counts = read_coverage_file(path)
+        if items is None:
+            items, counts = file_items, file_counts
+        elif file_items != items:
+            raise ValueError(f"The cover points of {path} don't match.")
+        else:
+            counts = [array("Q", map(int.__add__, a, b)) for a, b in zip(counts, file_counts)]
+        runs += file_runs
+    return runs, items, counts
+
+def coverage_report(runs, items, counts, missing=8):
+    """Describe the coverage: the share of the hit bins of each item and some of the missed bins."""
+    lines = [f"Coverage of {runs} test run(s):"]
+    for item, values in zip(items, counts):
+        bins = item["bins"]
+        hit = sum(1 for count in values if count)
+        lines.append(f"  {item['name']:24} {hit:6} / {len(bins):<6} {hit / len(bins):7.1%}  {sum(values)} samples")
+        holes = [bin for bin, count in zip(bins, values) if not count]
+        for bin in holes[:missing]:
+            lines.append(f"      missed {bin}")
+        if len(holes) > missing:
+            lines.append(f"      ... and {len(holes) - missing} more")
+    return "\n".join(lines)
+
+def vector_file():
+    """Return the path of the vector file to run, or None to run the vectors of the test bench.
+
+    It is given by the +vector_file=PATH plusarg or the VECTOR_FILE environment variable, which is set by
+    `invoke run --vectors PATH`. The files are written by `invoke gen-vectors`, see vector_file.py.
+    """
+    return cocotb.plusargs.get("vector_file", os.environ.get("VECTOR_FILE")) or None
+
+def failure_cap():
+    """Return the number of mismatches at which a Scoreboard stops the test, or 0 to run to the end.
+
+    It is given by the +max_failures=N plusarg or the MAX_FAILURES environment variable, which is set by
+    `invoke run --max-failures N`.
+    """
+    return int(cocotb.plusargs.get("max_failures", os.environ.get("MAX_FAILURES", 0)) or 0)
+
+def resuming():
+    """Return True if the tests go on from their checkpoints. See Checkpoint.
+
+    It is given by the +resume plusarg or the RESUME environment variable, which is set by `invoke run --resume`.
+    """
+    return "resume" in cocotb.plusargs or bool(os.environ.get("RESUME"))
+
+def checkpoint_interval():
+    """Return the seconds between the saves of a Checkpoint, 0 to save it only at the end of a test.
+
+    It is given by the +checkpoint_interval=S plusarg or the CHECKPOINT_INTERVAL environment variable.
+    """
+    return float(cocotb.plusargs.get("checkpoint_interval", os.environ.get("CHECKPOINT_INTERVAL", CHECKPOINT_INTERVAL)))
+
+def shard(vectors):
+    """Select the contiguous part of the vectors run by this shard."""
+    if not isinstance(vectors, Sequence):
+        vectors = list(vectors)
+    start, stop = shard_range(len(vectors))
+    return vectors[start:stop][vector_range()]
+
+def current_test_name():
+    """The full name of the running test as COCOTB_TEST_FILTER matches it, e.g. test_proc.test_corner/a=0,
+    or None if it isn't known."""
+    # The regression manager of cocotb 2.0 and 2.1 keeps the running test in private attributes.
+    manager = getattr(getattr(cocotb, "regression", None), "_manager_inst", None)
+    return getattr(getattr(manager, "_test", None), "fullname", None)
+
+def record_failed_vector(index):
+    """Record the index of the first failed vector of the shard and the name of its test in the build folder."""
+    fn = os.path.join(os.environ.get("SIM_BUILD", "sim_build"), FAILED_VECTOR_FILE)
+    if not os.path.exists(fn):
+        with open(fn, "w") as f:
+            f.write(f"{index}\n{current_test_name() or ''}\n")
+
+def record_bench(**counts):
+    """Add counts, like vectors=N and cycles=M, to the bench file of the build folder."""
+    fn = os.path.join(os.environ.get("SIM_BUILD", "sim_build"), BENCH_FILE)
+    totals = {}
+    if os.path.exists(fn):
+        with open(fn) as f:
+            totals = json.load(f)
+    for name, value in counts.items():
+        totals[name] = totals.get(name, 0) + value
+    with open(fn, "w") as f:
+        json.dump(totals, f)
+
+def session_test(setup=None):
+    """Time the setup and the run of a test, so that many short tests can share one simulator session.
+
+    setup(dut) is awaited before the test, e.g. to start the clock and reset the DUT. Every test of the
+    session calls it, so each one starts from reset whatever the test before it did. The wall and sim time of
+    both phases are added to the session file of the build folder, which `invoke run` shows as a table.
+    Put it below @cocotb.test() and @cocotb.parametrize(), which call the test with the parameters.
+
+    Usage:
+        @cocotb.test()
+        @cocotb.parametrize(a=[0, 0x7F, 0x80], b=[0, 0xFF])
+        @session_test(setup=reset)
+        async def test_corner(dut, a, b):
+            ...
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        async def timed_test(dut, *args, **kwargs):
+            name = func.__name__ + "".join(f"/{key}={value!r}" for key, value in kwargs.items())
+            start = (time.perf_counter(), get_sim_time("ns"))
+            ready = None
+            try:
+                if setup is not None:
+                    await setup(dut)
+                ready = (time.perf_counter(), get_sim_time("ns"))
+                await func(dut, *args, **kwargs)
+            finally:
+                end = (time.perf_counter(), get_sim_time("ns"))
+                ready = ready or end
+                record_session({"test": name, "setup_s": ready[0] - start[0], "setup_ns": ready[1] - start[1],
+                                "run_s": end[0] - ready[0], "run_ns": end[1] - ready[1]})
+        return timed_test
+    return decorate
+
+def record_session(record):
+    """Append the record of a test to the session file of the build folder."""
+    fn = os.path.join(os.environ.get("SIM_BUILD", "sim_build"), SESSION_FILE)
+    records = []
+    if os.path.exists(fn):
+        with open(fn) as f:
+            records = json.load(f)
+    records.append(record)
+    with open(fn, "w") as f:
+        json.dump(records, f)
+
+def waves_control():
+    """Return the signal which switches the dumping, or None if the build has no waves_ctrl module."""
+    ctrl = getattr(cocotb, "tops", {}).get(WAVES_CTRL)
+    return None if ctrl is None else ctrl.waves_on
+
+def waves_on():
+    """Start dumping the waveform. The dumping can only be switched with `invoke run --waves window`."""
+    switch_waves(1)
+
+def waves_off():
+    """Stop dumping the waveform."""
+    switch_waves(0)
+
+def switch_waves(value):
+    ctrl = waves_control()
+    if ctrl is None:
+        cocotb.top._log.warning("The dumping can't be switched. Use `invoke run --waves window` with Icarus.")
+        return
+    try:
+        ctrl.value = value
+    except RuntimeError:
+        # Nothing can be written in the ReadOnly phase. Switch it at the next time step.
+        cocotb.start_soon(switch_waves_later(ctrl, value))
+
+async def switch_waves_later(ctrl, value):
+    await NextTimeStep()
+    ctrl.value = value
+
+@contextmanager
+def waves_window():
+    """Dump the waveform only inside the with block. If the block fails, the dumping goes on to the end.
+
+    Usage:
+        with waves_window():
+            await pipeline.run(vectors)
+    """
+    waves_on()
+    yield
+    waves_off()
 
 def period_ns(freq_hz):
     """Convert frequency to period in ns."""
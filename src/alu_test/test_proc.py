@@ -11,28 +11,147 @@ from cocotb.handle import Release, Force
 from cocotb import utils
 
 from sim_utils import *
-from itertools import permutations
+from itertools import permutations, product
+from golden_model import GoldenTable, variant, operand_pairs
+from vector_file import VectorFile
+import numpy as np
 
-@cocotb.test()
-async def test_proc(dut):
-    # Generate clocks and initialization.
+def golden_table(width):
+    """The adder and the multiplier are both signed and saturated. The table is too big to be built
+    at once for N=16, so only the chunks of the driven operands are computed.
+    """
+    return GoldenTable(width, [variant("add", "signed_sat"), variant("mult", "signed_sat")])
+
+def functional_coverage(width):
+    """The operation and the signs of the operands crossed with the overflow and underflow flags."""
+    cov = Coverage()
+    op_sel = cov.point("op_sel", {"add": 0, "mult": 1})
+    a_sign = cov.point("a_sign", sign_bins(width), field="a")
+    b_sign = cov.point("b_sign", sign_bins(width), field="b")
+    ov = cov.point("ov", flag_bins())
+    uv = cov.point("uv", flag_bins())
+    cov.cross("op_x_signs_x_flags", op_sel, a_sign, b_sign, ov, uv)
+    return cov
+
+def vector_source(width, start=0, stop=None):
+    """The fields, and the blocks of vectors and expected outputs of every (a, b, op_sel) vector, for
+    `invoke gen-vectors`. The vectors of a pair are next to each other, op_sel 0 first.
+    """
+    golden = golden_table(width)
+    stop = 2 << (2 * width) if stop is None else stop
+
+    def blocks():
+        row = start - start % 2
+        for a, b in operand_pairs(width, start // 2, (stop + 1) // 2):
+            answers = golden.lookup_many(a, b)
+            block = np.empty((2 * len(a), 6), dtype=np.int64)
+            block[:, 0] = np.repeat(a, 2)
+            block[:, 1] = np.repeat(b, 2)
+            block[:, 2] = np.tile((0, 1), len(a))
+            block[0::2, 3:] = answers[:, 0:3]
+            block[1::2, 3:] = answers[:, 3:6]
+            yield block[max(0, start - row):stop - row]
+            row += len(block)
+
+    return [("a", width), ("b", width), ("op_sel", 1)], [("result", golden.widths[0]), ("ov", 1), ("uv", 1)], blocks()
+
+async def reset(dut):
+    """Start the clock and reset the DUT."""
     clk_freq = 1e6
     cocotb.start_soon(Clock(dut.clk, period_ns(freq_hz=clk_freq), unit="ns").start())
-    # Show the information of DUT.
-    dut._log.info(f"DUT: {dut._name}")
     dut.rst_n.value = 0
     dut.a.value = 0
     dut.b.value = 0
     await (dut.clk@posedge)
     dut.rst_n.value = 1
     await (dut.clk@posedge)
-    for i, j in permutations(range(256), 2):
-        dut.a.value = i
-        dut.b.value = j
-        dut.op_sel.value = 0
-        await (2@cycles(dut.clk, rising=True))
-        result = dut.result.value
-        answer = (i + j) & 0xFF
-        assert result == answer, f"Result mismatch: {dut.a.value=}, {dut.b.value=}, {dut.result.value=}"
-        
-    dut._log.info("TEST DONE!")
\ No newline at end of file
+
+@cocotb.test()
+@session_test(setup=reset)
+async def test_proc(dut):
+    # Show the information of DUT.
+    dut._log.info(f"DUT: {dut._name}")
+    golden = golden_table(len(dut.a))
+    inputs = SignalBundle(dut, ("a", "b", "op_sel"))
+    outputs = SignalBundle(dut, ("result", "ov", "uv"))
+    coverage = functional_coverage(len(dut.a))
+    fields = inputs.names + outputs.names
+    scoreboard = Scoreboard(inputs, outputs)
+
+    def model(vector):
+        i, j, op_sel = vector
+        return golden.lookup(i, j)[3 * op_sel:3 * op_sel + 3]
+
+    def check(vector, answer, result):
+        if scoreboard.check(vector, answer, result):
+            coverage.sample(dict(zip(fields, vector + result)))
+
+    # The progress is saved at intervals, so an interrupted run goes on from there with `invoke run --resume`.
+    checkpoint = Checkpoint("test_proc", scoreboard, coverage)
+    # A new vector every clock. The result register is one clock behind the inputs.
+    pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, model, check, latency=1, checkpoint=checkpoint)
+    if vector_file():
+        # The vectors and their expected outputs come from a file written by `invoke gen-vectors`.
+        vectors = VectorFile(vector_file())
+        vectors.check_ports(dut)
+        count = await pipeline.run(shard(vectors.vectors), answers=shard(vectors.answers))
+    else:
+        vectors = [(i, j, op_sel) for i, j in permutations(range(256), 2) for op_sel in (0, 1)]
+        count = await pipeline.run(shard(vectors))
+    coverage.save()
+    dut._log.info(f"{count} vectors checked.")
+    scoreboard.finish()
+    dut._log.info("TEST DONE!")
+
+@cocotb.test()
+@session_test(setup=reset)
+async def test_random(dut):
+    """Constrained-random operands of the full width for both operations, until all the coverage bins are hit
+    and at least `width` vectors per bin are checked."""
+    width = len(dut.a)
+    golden = golden_table(width)
+    inputs = SignalBundle(dut, ("a", "b", "op_sel"))
+    outputs = SignalBundle(dut, ("result", "ov", "uv"))
+    coverage = functional_coverage(len(dut.a))
+    fields = inputs.names + outputs.names
+    scoreboard = Scoreboard(inputs, outputs)
+
+    def check(vector, answer, result):
+        if scoreboard.check(vector, answer, result):
+            coverage.sample(dict(zip(fields, vector + result)))
+
+    # All the shards of `invoke run` share the seed, so they generate the same vectors and run their own part.
+    adds = RandomOperands(width, "add", seed=cocotb.RANDOM_SEED)
+    mults = RandomOperands(width, "mult", seed=cocotb.RANDOM_SEED + 1)
+    vectors = shard([(i, j, 0) for i, j in adds.vectors()] + [(i, j, 1) for i, j in mults.vectors()])
+    # The operands are scattered over the whole range, so the answers are computed without the table.
+    a, b, op_sel = np.array(vectors, dtype=np.int64).reshape(-1, 3).T
+    expected = golden.compute(a, b)
+    answers = map(tuple, np.where(op_sel[:, None] == 0, expected[:, 0:3], expected[:, 3:6]).tolist())
+    pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, None, check, latency=1)
+    count = await pipeline.run(vectors, answers=answers)
+    coverage.save()
+    covered = adds.coverage.covered + mults.coverage.covered
+    dut._log.info(f"{count} random vectors checked, {covered} of {adds.coverage.count + mults.coverage.count} bins covered.")
+    scoreboard.finish()
+
+@cocotb.test()
+@cocotb.parametrize(op_sel=(0, 1), a_corner=CORNERS, b_corner=CORNERS)
+@session_test(setup=reset)
+async def test_corner(dut, op_sel, a_corner, b_corner):
+    """The operands at and around a corner class each, a short test for every operation and pair of corners.
+
+    All of them run in one simulator session, each from its own reset.
+    """
+    width = len(dut.a)
+    golden = golden_table(width)
+    inputs = SignalBundle(dut, ("a", "b", "op_sel"))
+    outputs = SignalBundle(dut, ("result", "ov", "uv"))
+    scoreboard = Scoreboard(inputs, outputs)
+    vectors = shard([(i, j, op_sel) for i, j in product(corner_values(width, a_corner), corner_values(width, b_corner))])
+    a, b, _ = np.array(vectors, dtype=np.int64).reshape(-1, 3).T
+    answers = map(tuple, golden.compute(a, b)[:, 3 * op_sel:3 * op_sel + 3].tolist())
+    pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, None, scoreboard.check, latency=1)
+    count = await pipeline.run(vectors, answers=answers)
+    dut._log.info(f"{count} vectors around {a_corner} x {b_corner} of op_sel={op_sel} checked.")
+    scoreboard.finish()
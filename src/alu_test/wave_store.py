@@ -0,0 +1,319 @@
+#!python
+# coding: utf-8
+
+"""A columnar store of a VCD or FST waveform dump, for quick queries of the same dump again and again.
+
+A dump is converted once, by streaming it with WaveStream of wave_query.py. The store is a folder next to the
+dump, e.g. sim_build/top.vcd.store, of flat little endian arrays which are memory-mapped when they are read:
+
+    index.json              The signals, their columns and the timescale, and the size and time of the dump
+                            it was converted from. It is written last, so a store without it is incomplete.
+    times.i64               The time index: the time of every time step of the dump with a value change.
+    c<N>.steps.i64          The value changes of column N: the time step of each change, in order,
+    c<N>.values             its value, in the smallest unsigned type of the width for up to 64 bits, or
+                            in ceil(width / 64) words of 64 bits, the least significant first,
+    c<N>.known.u8           and 0 where the value has x or z bits. Their bits are 0 in the value.
+
+The signals with the same code in the dump, e.g. the ports seen from both sides, share one column.
+
+A query finds the time step of a time in the time index, then the change of a column in its steps, both with
+a binary search, so it only reads a few pages of the arrays. The queries of many times or signals work on
+whole arrays with NumPy.
+
+Usage:
+    store = open_store("sim_build/top.vcd")         # Converted now if the store is missing or out of date.
+    store.value_at("grant", 1500000)
+    store.edges("clk", 0, 10**6, kind="rising")
+    times, holds = store.compare("req", "!=", 0)
+"""
+
+import json
+import operator
+import os
+import shutil
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from wave_query import WaveStream, parse_time, time_unit, resolve_signals, Signal
+
+VERSION = 1
+INDEX_FILE = "index.json"
+TIMES_FILE = "times.i64"
+STORE_SUFFIX = ".store"
+
+# The value changes buffered in memory before they are appended to the column files.
+FLUSH_CHANGES = 1 << 20
+
+WORD_MASK = (1 << 64) - 1
+
+COMPARISONS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+def store_folder(dump):
+    """The folder of the store of a dump."""
+    dump = Path(dump)
+    return dump.with_name(dump.name + STORE_SUFFIX)
+
+def is_up_to_date(dump, folder=None):
+    """Whether the store of a dump was converted from the dump as it is now."""
+    index_file = Path(folder or store_folder(dump)) / INDEX_FILE
+    if not index_file.is_file():
+        return False
+    index = json.loads(index_file.read_text())
+    stat = Path(dump).stat()
+    return index.get("version") == VERSION and index["source"] == [stat.st_size, stat.st_mtime_ns]
+
+def _words(width):
+    return max(1, -(-width // 64))
+
+def _value_type(width):
+    """The array typecode and the NumPy type of the value words of a width."""
+    size = next((size for size in (1, 2, 4) if width <= 8 * size), 8)
+    return next(code for code in "BHILQ" if array(code).itemsize == size), np.dtype(f"<u{size}")
+
+def _little_endian(data):
+    """The bytes of an array in the byte order of the store."""
+    if sys.byteorder == "big" and not isinstance(data, bytearray):
+        data = array(data.typecode, data)
+        data.byteswap()
+    return bytes(data) if isinstance(data, bytearray) else data.tobytes()
+
+def convert(dump, folder=None):
+    """Convert a dump into a store. Return the folder of the store.
+
+    The changes are appended to the column files in blocks, so the memory doesn't grow with the dump.
+    The store is written into a temporary folder, which replaces the old store when it is complete.
+    """
+    folder = Path(folder or store_folder(dump))
+    tmp_folder = folder.with_name(f"{folder.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    tmp_folder.mkdir(parents=True)
+    stat = Path(dump).stat()
+    with WaveStream(dump) as wave:
+        column_of = {}                      # code -> index of the column
+        columns = []
+        for signal in wave.signals.values():
+            if signal.code not in column_of:
+                column_of[signal.code] = len(columns)
+                columns.append(Signal(signal.path, signal.code, max(signal.width, 1)))
+        words = [_words(column.width) for column in columns]
+        times = array("q")
+        steps = [array("q") for _ in columns]
+        values = [array(_value_type(column.width)[0]) for column in columns]
+        known = [bytearray() for _ in columns]
+        counts = [0] * len(columns)
+        buffered = 0
+
+        def flush():
+            with open(tmp_folder / TIMES_FILE, "ab") as f:
+                f.write(_little_endian(times))
+            del times[:]
+            for i in range(len(columns)):
+                if steps[i]:
+                    for name, data in (("steps.i64", steps[i]), ("values", values[i]), ("known.u8", known[i])):
+                        with open(tmp_folder / f"c{i}.{name}", "ab") as f:
+                            f.write(_little_endian(data))
+                    counts[i] += len(steps[i])
+                    del steps[i][:], values[i][:], known[i][:]
+
+        for step, (time, changed) in enumerate(wave.steps(columns)):
+            times.append(time)
+            current = wave.values
+            for i in changed:
+                text = current[i]
+                try:
+                    value, ok = int(text, 2), 1
+                except ValueError:
+                    # x or z bits, or a real value, which isn't kept.
+                    value, ok = int("".join(ch if ch in "01" else "0" for ch in text) or "0", 2), 0
+                steps[i].append(step)
+                if words[i] == 1:
+                    values[i].append(value & WORD_MASK)
+                else:
+                    values[i].extend((value >> (64 * w)) & WORD_MASK for w in range(words[i]))
+                known[i].append(ok)
+            buffered += len(changed)
+            if buffered >= FLUSH_CHANGES:
+                flush()
+                buffered = 0
+        flush()
+        index = {
+            "version": VERSION,
+            "source": [stat.st_size, stat.st_mtime_ns],
+            "timescale": list(wave.timescale),
+            "steps": step + 1,
+            "columns": [{"code": c.code, "width": c.width, "changes": n} for c, n in zip(columns, counts)],
+            "signals": {path: column_of[signal.code] for path, signal in wave.signals.items()},
+        }
+    (tmp_folder / INDEX_FILE).write_text(json.dumps(index))
+    shutil.rmtree(folder, ignore_errors=True)
+    tmp_folder.rename(folder)
+    return folder
+
+def _map(path, dtype, count, shape=None):
+    """Memory-map an array file. np.memmap can't map an empty file."""
+    if not count:
+        return np.zeros(shape or (0,), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape or (count,))
+
+class Column:
+    """The value changes of a signal: the time step of each change, its value and whether it is known."""
+    def __init__(self, folder, i, width, changes):
+        self.width = width
+        self.words = _words(width)
+        self.steps = _map(folder / f"c{i}.steps.i64", "<i8", changes)
+        shape = (changes,) if self.words == 1 else (changes, self.words)
+        self.values = _map(folder / f"c{i}.values", _value_type(width)[1], changes, shape)
+        self.known = _map(folder / f"c{i}.known.u8", "u1", changes).view(bool)
+
+    def value(self, change):
+        """The value of a change as an integer, or None if it has x or z bits."""
+        if change < 0 or not self.known[change]:
+            return None
+        if self.words == 1:
+            return int(self.values[change])
+        return sum(int(word) << (64 * w) for w, word in enumerate(self.values[change]))
+
+class WaveStore:
+    """The queries of a store. The times are in the time unit of the dump, or texts with a unit like "1.5us".
+
+    The changes of a signal in a window are the ones after start and at or before end, and a signal holds its
+    value from the time of a change until the next one.
+    """
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        index = json.loads((self.folder / INDEX_FILE).read_text())
+        if index.get("version") != VERSION:
+            raise ValueError(f"{self.folder} is a store of version {index.get('version')}. Convert the dump again.")
+        self.timescale = tuple(index["timescale"])
+        self.times = _map(self.folder / TIMES_FILE, "<i8", index["steps"])
+        self._columns_info = index["columns"]
+        self._column_of = index["signals"]
+        self.signals = {path: Signal(path, self._columns_info[i]["code"], self._columns_info[i]["width"])
+                        for path, i in self._column_of.items()}
+        self._columns = {}                  # name -> Column
+
+    def time_unit(self):
+        return time_unit(self.timescale)
+
+    def parse_time(self, time):
+        return parse_time(time, self.timescale) if isinstance(time, str) else time
+
+    def column(self, name):
+        """The Column of a signal, a path or a dotted suffix of paths like in wave_query.py."""
+        column = self._columns.get(name)
+        if column is None:
+            signal, = resolve_signals(self.signals, [name], self.folder)
+            i = self._column_of[signal.path]
+            info = self._columns_info[i]
+            column = Column(self.folder, i, info["width"], info["changes"])
+            # Aliases and the names of a signal share the Column.
+            for other in [name] + [path for path, j in self._column_of.items() if j == i]:
+                column = self._columns.setdefault(other, column)
+        return column
+
+    def step_at(self, time):
+        """The index of the last time step at or before a time, -1 before the first one."""
+        return int(np.searchsorted(self.times, self.parse_time(time), side="right")) - 1
+
+    def _window(self, column, start, end):
+        """The range of the changes of a column after start and at or before end."""
+        first = 0 if start is None else int(np.searchsorted(column.steps, self.step_at(start), side="right"))
+        last = len(column.steps) if end is None else int(np.searchsorted(column.steps, self.step_at(end), side="right"))
+        return first, last
+
+    def value_at(self, name, time):
+        """The value of a signal at a time, or None if it is unknown or has x or z bits."""
+        column = self.column(name)
+        change = int(np.searchsorted(column.steps, self.step_at(time), side="right")) - 1
+        return column.value(change)
+
+    def values_at(self, name, times):
+        """The values of a signal at an array of times, as (values, known) arrays."""
+        steps = np.searchsorted(self.times, np.asarray(times, dtype=np.int64), side="right") - 1
+        return self._values_at_steps(self.column(name), steps)
+
+    @staticmethod
+    def _values_at_steps(column, steps):
+        changes = np.searchsorted(column.steps, steps, side="right") - 1
+        # The times before the first time step have no value.
+        valid = changes >= 0
+        changes = np.maximum(changes, 0)
+        return column.values[changes], column.known[changes] & valid
+
+    def changes(self, name, start=None, end=None):
+        """The value changes of a signal in a window, as (times, values, known) arrays."""
+        column = self.column(name)
+        first, last = self._window(column, start, end)
+        return self.times[column.steps[first:last]], column.values[first:last], column.known[first:last]
+
+    def edges(self, name, start=None, end=None, kind="any", bit=None):
+        """The times of the edges of a signal in a window, as an array.
+
+        kind is "any" for every change of the value, or "rising" or "falling" for a 1-bit signal or for one
+        bit of a vector. A change from or to x or z is not a rising or falling edge.
+        """
+        column = self.column(name)
+        first, last = self._window(column, start, end)
+        if kind == "any" and bit is None:
+            return self.times[column.steps[first:last]]
+        if column.words > 1:
+            raise ValueError("The edges of a bit are only found for signals of up to 64 bits.")
+        if bit is None:
+            if column.width != 1:
+                raise ValueError(f"{name} has {column.width} bits. Give the bit of its edges.")
+            bit = 0
+        # The change before the window gives the level at its start. Every column has a change at the first
+        # time step, the initial value.
+        before = max(first - 1, 0)
+        levels = (column.values[before:last].astype(np.uint64) >> np.uint64(bit)) & np.uint64(1)
+        known = column.known[before:last]
+        if first == 0:
+            levels = np.concatenate(([0], levels))
+            known = np.concatenate(([False], known))
+        moved = (levels[1:] != levels[:-1]) & known[1:] & known[:-1]
+        if kind == "rising":
+            moved &= levels[1:] == 1
+        elif kind == "falling":
+            moved &= levels[1:] == 0
+        elif kind != "any":
+            raise ValueError(f"Bad kind {kind} of edges. Use any, rising or falling.")
+        return self.times[column.steps[first:last][moved]]
+
+    def compare(self, a, op, b, start=None, end=None):
+        """Compare a signal with another signal or a constant over a window, all the changes at once.
+
+        Return (times, holds): the time step at or before start, then the times at which any of the signals
+        changes, and whether the comparison holds from each of these times until the next one. It doesn't hold
+        while a signal has x or z bits. Signals wider than 64 bits are only compared with each other, with ==
+        and !=.
+        """
+        if op not in COMPARISONS:
+            raise ValueError(f"Bad comparison {op}. Use one of {' '.join(COMPARISONS)}.")
+        columns = [self.column(x) for x in (a, b) if isinstance(x, str)]
+        if any(column.words > 1 for column in columns) and (op not in ("==", "!=") or len(columns) < 2):
+            raise ValueError("Signals wider than 64 bits are only compared with each other, with == and !=.")
+        start_step = max(self.step_at(start if start is not None else 0), 0)
+        steps = np.sort(np.concatenate([[start_step]] + [column.steps[slice(*self._window(column, start, end))] for column in columns]))
+        steps = steps[np.concatenate(([True], steps[1:] != steps[:-1]))]
+        values, known = [], np.ones(len(steps), dtype=bool)
+        for x in (a, b):
+            if isinstance(x, str):
+                value, ok = self._values_at_steps(self.column(x), steps)
+                values.append(value)
+                known &= ok
+            else:
+                values.append(x)
+        holds = COMPARISONS[op](values[0], values[1])
+        if holds.ndim > 1:
+            holds = holds.all(axis=1) if op == "==" else holds.any(axis=1)
+        return self.times[steps], holds & known
+
+def open_store(dump):
+    """The WaveStore of a dump. The dump is converted first if its store is missing or out of date."""
+    folder = store_folder(dump)
+    if not is_up_to_date(dump, folder):
+        convert(dump, folder)
+    return WaveStore(folder)
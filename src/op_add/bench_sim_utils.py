@@ -0,0 +1,107 @@
+#!python
+# coding: utf-8
+
+# Micro-benchmarks of the sim_utils helpers. Run them with:
+#   make -f Makefile results.xml COCOTB_TEST_MODULES=bench_sim_utils
+
+import tracemalloc
+from time import perf_counter
+
+import cocotb
+from cocotb.clock import Clock
+
+from sim_utils import *
+
+LOOPS = 20000
+
+# The awaits of each trigger in bench_triggers.
+AWAITS = 20000
+
+OUTPUTS = ("c_signed", "ov_signed", "uv_signed",
+           "c_unsigned", "ov_unsigned", "uv_unsigned",
+           "c_signed_sat", "ov_signed_sat", "uv_signed_sat",
+           "c_unsigned_sat", "ov_unsigned_sat", "uv_unsigned_sat")
+
+def per_loop_us(func, loops=LOOPS):
+    """Return the average time of func() in microseconds."""
+    start = perf_counter()
+    for _ in range(loops):
+        func()
+    return (perf_counter() - start) / loops * 1e6
+
+async def per_await(make, awaits=AWAITS):
+    """Await make() the number of times. Return the average time of an await in microseconds, and the new
+    trigger objects and the bytes of them which make() allocates per await."""
+    start = perf_counter()
+    for _ in range(awaits):
+        await make()
+    elapsed = (perf_counter() - start) / awaits * 1e6
+    # The triggers are kept, so that the ones made by each call are counted, and not freed and made again.
+    kept = [None] * awaits
+    tracemalloc.start()
+    for i in range(awaits):
+        kept[i] = make()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, len(set(map(id, kept))) / awaits, size / awaits
+
+async def reset(dut):
+    cocotb.start_soon(Clock(dut.clk, period_ns(freq_hz=1e6), unit="ns").start())
+    dut.rst_n.value = 0
+    dut.a.value = 0
+    dut.b.value = 0
+    await (dut.clk@posedge)
+    dut.rst_n.value = 1
+    await (dut.clk@posedge)
+
+@cocotb.test()
+async def bench_signal_bundle(dut):
+    """Compare the per-vector overhead of attribute access with SignalBundle."""
+    await reset(dut)
+
+    def attribute_read():
+        return (dut.c_signed.value.to_unsigned(), int(dut.ov_signed.value), int(dut.uv_signed.value),
+                dut.c_unsigned.value.to_unsigned(), int(dut.ov_unsigned.value), int(dut.uv_unsigned.value),
+                dut.c_signed_sat.value.to_unsigned(), int(dut.ov_signed_sat.value), int(dut.uv_signed_sat.value),
+                dut.c_unsigned_sat.value.to_unsigned(), int(dut.ov_unsigned_sat.value), int(dut.uv_unsigned_sat.value))
+
+    def attribute_write():
+        dut.a.value, dut.b.value = 0x12, 0x34
+
+    inputs = SignalBundle(dut, ("a", "b"))
+    outputs = SignalBundle(dut, OUTPUTS)
+    assert outputs.read() == attribute_read(), "SignalBundle reads different values."
+
+    # Writes are only allowed outside of the ReadOnly phase.
+    write_before = per_loop_us(attribute_write)
+    write_after = per_loop_us(lambda: inputs.write((0x12, 0x34)))
+    await ReadOnly()
+    read_before = per_loop_us(attribute_read)
+    read_after = per_loop_us(outputs.read)
+
+    dut._log.info(f"{'':24} {'before (us)':>12} {'after (us)':>12} {'speedup':>8}")
+    for name, before, after in (("write 2 inputs", write_before, write_after),
+                                ("read 12 outputs", read_before, read_after),
+                                ("per vector", write_before + read_before, write_after + read_after)):
+        dut._log.info(f"{name:24} {before:12.2f} {after:12.2f} {before / after:7.1f}x")
+
+@cocotb.test()
+async def bench_triggers(dut):
+    """Compare the triggers made for every await with the operators of sim_utils. The reuse of the triggers is
+    checked by tests/test_sim_utils.py of the repository."""
+    await reset(dut)
+    clk = dut.clk
+    cases = (("clk@posedge", lambda: RisingEdge(clk), lambda: clk@posedge),
+             ("clk@negedge", lambda: FallingEdge(clk), lambda: clk@negedge),
+             ("2@cycles(clk)", lambda: ClockCycles(clk, 2), lambda: 2@cycles(clk)),
+             ("10@ns", lambda: Timer(10, unit="ns"), lambda: 10@ns))
+
+    # The time of the operator alone, and of the await with it. The await of a trigger itself takes the same time
+    # whether it is new or reused.
+    dut._log.info(f"{'':16} {'make (us)':>10} {'op':>7} {'await (us)':>11} {'op':>7} {'objects':>8} {'op':>7} "
+                  f"{'bytes':>6} {'op':>7}")
+    for name, make, operator in cases:
+        before, before_objects, before_bytes = await per_await(make)
+        after, after_objects, after_bytes = await per_await(operator)
+        dut._log.info(f"{name:16} {per_loop_us(make):10.3f} {per_loop_us(operator):7.3f} {before:11.2f} {after:7.2f} "
+                      f"{before_objects:8.3f} {after_objects:7.3f} {before_bytes:6.0f} {after_bytes:7.0f}")
@@ -0,0 +1,161 @@
+#!python
+# coding: utf-8
+
+"""A profiler for the Python side of cocotb tests. `invoke run --profile` uses it.
+
+cProfile counts every resumption of a coroutine as a new call, and it can't separate the time spent in
+the simulator from the time spent in Python. This profiler follows calls with sys.setprofile() and records:
+
+- The self time of every call stack, including calls into the simulator through GPI. These are written to
+  profile.folded as folded stacks. flamegraph.pl, speedscope and inferno can all read it.
+- The time outside Python, i.e. the time the simulator runs, as the [simulator] stack.
+- How long each coroutine waits at each of its await sites.
+
+A summary is written to profile.txt. Both files go into the build folder. The profiler makes the Python
+side several times slower, so compare the shares, not the absolute times.
+"""
+
+import dis
+import inspect
+import os
+import sys
+from collections import defaultdict
+from time import perf_counter_ns
+import cocotb._shutdown
+
+PROFILE_TEXT = "profile.txt"
+PROFILE_FOLDED = "profile.folded"
+
+# The number of rows of each table in profile.txt.
+REPORT_ROWS = 30
+
+SIMULATOR = "[simulator]"
+GPI_PREFIX = "gpi:"
+
+# The opcodes which end a coroutine. Any other opcode at a return event means that the coroutine is suspended.
+RETURN_OPCODES = {dis.opmap[name] for name in ("RETURN_VALUE", "RETURN_CONST") if name in dis.opmap}
+
+class Profiler:
+    def __init__(self):
+        self.folded = defaultdict(int)      # call stack -> self time in ns
+        self.calls = defaultdict(int)       # function -> number of calls and resumptions
+        self.waits = defaultdict(int)       # await site -> waiting time in ns
+        self.wait_counts = defaultdict(int) # await site -> number of waits
+        self.suspended = {}                 # frame -> (await site, time of suspension)
+        self.labels = {}                    # code object -> function label
+        self.stack = [()]                   # the call stacks, the innermost last
+        self.unwinding = False              # a chain of awaiting coroutines is being suspended
+        self.start_time = self.last = perf_counter_ns()
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self.labels[code] = label
+        return label
+
+    @staticmethod
+    def c_label(func):
+        """Label a built-in function. The ones of cocotb.simulator are calls into the simulator."""
+        name = getattr(func, "__qualname__", None) or repr(func)
+        owner = getattr(func, "__self__", None)
+        module = getattr(func, "__module__", None) or type(owner).__module__
+        return f"{GPI_PREFIX}{name}" if module == "cocotb.simulator" else f"{name} (built-in)"
+
+    def __call__(self, frame, event, arg):
+        now = perf_counter_ns()
+        stack = self.stack
+        self.folded[stack[-1]] += now - self.last
+        if event == "call":
+            self.unwinding = False
+            code = frame.f_code
+            label = self.label(code)
+            stack.append(stack[-1] + (label,))
+            self.calls[label] += 1
+            resumed = self.suspended.pop(frame, None)
+            if resumed is not None:
+                site, since = resumed
+                self.waits[site] += now - since
+                self.wait_counts[site] += 1
+        elif event == "return":
+            # The frames on the stack when profiling started return without a call event.
+            if len(stack) > 1:
+                stack.pop()
+            code = frame.f_code
+            if code.co_flags & inspect.CO_COROUTINE and code.co_code[frame.f_lasti] not in RETURN_OPCODES:
+                # Only the innermost coroutine of the chain records its await site. The outer ones just
+                # wait for it.
+                if not self.unwinding:
+                    site = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    self.suspended[frame] = (site, now)
+                self.unwinding = True
+        elif event == "c_call":
+            self.unwinding = False
+            label = self.c_label(arg)
+            stack.append(stack[-1] + (label,))
+            self.calls[label] += 1
+        else:
+            # c_return and c_exception.
+            self.unwinding = False
+            if len(stack) > 1:
+                stack.pop()
+        self.last = perf_counter_ns()
+
+    def report(self, folder):
+        """Write profile.folded and profile.txt into the folder."""
+        now = perf_counter_ns()
+        self.folded[self.stack[-1]] += now - self.last
+        total = now - self.start_time
+        self_times = defaultdict(int)
+        cumulative = defaultdict(int)
+        with open(os.path.join(folder, PROFILE_FOLDED), "w") as f:
+            for stack, ns in self.folded.items():
+                self_times[stack[-1] if stack else SIMULATOR] += ns
+                for label in set(stack):
+                    cumulative[label] += ns
+                # The counts are in microseconds.
+                if ns >= 1000:
+                    f.write(f"{';'.join(stack) or SIMULATOR} {ns // 1000}\n")
+        simulator = self_times[SIMULATOR]
+        gpi = sum(ns for label, ns in self_times.items() if label.startswith(GPI_PREFIX))
+        python = sum(self.folded.values()) - simulator - gpi
+        overhead = total - simulator - gpi - python
+
+        def percent(ns):
+            return f"{ns / total:7.1%}" if total else "      -"
+
+        lines = [
+            f"Total time:          {total / 1e9:10.3f} s",
+            f"Simulator:           {simulator / 1e9:10.3f} s {percent(simulator)}",
+            f"GPI calls:           {gpi / 1e9:10.3f} s {percent(gpi)}",
+            f"Python:              {python / 1e9:10.3f} s {percent(python)}",
+            f"Profiler overhead:   {overhead / 1e9:10.3f} s {percent(overhead)}",
+            "",
+            f"{'Self (s)':>10} {'Share':>7} {'Cumul. (s)':>10} {'Calls':>10}  Function",
+        ]
+        for label, ns in sorted(self_times.items(), key=lambda item: -item[1])[:REPORT_ROWS]:
+            lines.append(f"{ns / 1e9:10.3f} {percent(ns)} {cumulative.get(label, ns) / 1e9:10.3f} {self.calls.get(label, 0):10}  {label}")
+        lines += ["", f"{'Wait (s)':>10} {'Waits':>10} {'Avg (us)':>10}  Await site"]
+        for site, ns in sorted(self.waits.items(), key=lambda item: -item[1])[:REPORT_ROWS]:
+            count = self.wait_counts[site]
+            lines.append(f"{ns / 1e9:10.3f} {count:10} {ns / count / 1e3:10.2f}  {site}")
+        with open(os.path.join(folder, PROFILE_TEXT), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+def start():
+    """Start profiling, then start cocotb. It's a PYGPI_USERS entry point.
+
+    PYGPI_USERS replaces the entry points of cocotb, so they are run from here with the variable removed.
+    """
+    os.environ.pop("PYGPI_USERS", None)
+    profiler = Profiler()
+    folder = os.environ.get("SIM_BUILD", "sim_build")
+
+    def stop():
+        sys.setprofile(None)
+        profiler.report(folder)
+
+    cocotb._shutdown.register(stop)
+    sys.setprofile(profiler)
+    from pygpi.entry import load_entry
+    load_entry()
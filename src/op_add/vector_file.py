@@ -0,0 +1,128 @@
+#!python
+# coding: utf-8
+
+"""Memory-mapped files of test vectors and their expected outputs.
+
+Vector sets too big for Python lists, like the 4 billion (a, b) pairs of a 16-bit operator, are written
+once by `invoke gen-vectors` and read lazily by the test bench. A file is:
+
+    MAGIC                   8 bytes
+    header length           4 bytes, little endian
+    header                  JSON, padded with spaces so the data is aligned to DATA_ALIGN bytes
+    data                    one row per vector, the input fields then the output fields,
+                            all of the same unsigned integer type
+
+The header records the fields, their widths, the type of the data and the index of the first vector,
+e.g. {"version": 1, "dtype": "<u2", "start": 0, "inputs": [["a", 16], ["b", 16]], "outputs": [["c", 16]]}.
+"""
+
+import json
+import os
+import struct
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"VECTORS\0"
+VERSION = 1
+DATA_ALIGN = 64
+
+# The number of rows converted to Python integers at once when the vectors are iterated.
+ROWS_PER_READ = 1 << 16
+
+def field_dtype(fields):
+    """The smallest unsigned integer type which holds all the fields."""
+    bits = max(width for _, width in fields)
+    return np.dtype(next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(t).bits >= bits)).newbyteorder("<")
+
+def write_vector_file(path, inputs, outputs, blocks, start=0):
+    """Write a vector file. Return the number of vectors.
+
+    inputs, outputs:  The (name, width) pairs of the fields.
+    blocks:           An iterable of 2-D arrays, with one row per vector and one column per field. They are
+                      written one by one, so the vectors never have to fit in memory at once.
+    start:            The index of the first vector in the whole vector set.
+    """
+    fields = list(inputs) + list(outputs)
+    dtype = field_dtype(fields)
+    header = json.dumps({"version": VERSION, "dtype": dtype.str, "start": start,
+                         "inputs": [list(f) for f in inputs], "outputs": [list(f) for f in outputs]}).encode()
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % DATA_ALIGN)
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    count = 0
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for block in blocks:
+            block = np.asarray(block)
+            assert block.ndim == 2 and block.shape[1] == len(fields), f"A block must have {len(fields)} columns."
+            block.astype(dtype, copy=False).tofile(f)
+            count += len(block)
+    os.replace(tmp_path, path)
+    return count
+
+class Rows(Sequence):
+    """The rows of a 2-D array as tuples of integers. Slices are views, so nothing is read until it's used."""
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Rows(self.array[index])
+        return tuple(self.array[index].tolist())
+
+    def __iter__(self):
+        array = self.array
+        for start in range(0, len(array), ROWS_PER_READ):
+            yield from map(tuple, array[start:start + ROWS_PER_READ].tolist())
+
+class VectorFile:
+    """A vector file opened with a memory map.
+
+    `vectors` and `answers` are sequences of the input and the output fields of the vectors. Both can be
+    sliced without reading the file, e.g. by shard() of sim_utils.py.
+
+    Usage:
+        vf = VectorFile("vectors.vec")
+        await pipeline.run(shard(vf.vectors), answers=shard(vf.answers))
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            assert magic == MAGIC, f"{self.path} is not a vector file."
+            (size,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(size))
+        assert header["version"] == VERSION, f"Unsupported version {header['version']} of {self.path}."
+        self.inputs = [tuple(f) for f in header["inputs"]]
+        self.outputs = [tuple(f) for f in header["outputs"]]
+        self.start = header["start"]
+        self.dtype = np.dtype(header["dtype"])
+        offset = len(MAGIC) + 4 + size
+        columns = len(self.inputs) + len(self.outputs)
+        count = (self.path.stat().st_size - offset) // (columns * self.dtype.itemsize)
+        if count:
+            self.data = np.memmap(self.path, dtype=self.dtype, mode="r", offset=offset, shape=(count, columns))
+        else:
+            # A file can't be mapped with zero length.
+            self.data = np.empty((0, columns), dtype=self.dtype)
+        self.vectors = Rows(self.data[:, :len(self.inputs)])
+        self.answers = Rows(self.data[:, len(self.inputs):])
+
+    def __len__(self):
+        return len(self.data)
+
+    def check_ports(self, dut):
+        """Assert that the fields have the widths of the DUT ports of the same names."""
+        for name, width in self.inputs + self.outputs:
+            port = getattr(dut, name, None)
+            assert port is None or len(port) == width, \
+                f"{name} is {width} bits wide in {self.path} but {len(port)} bits in the DUT. Use `invoke gen-vectors --width {len(port)}`."
+
+    @property
+    def fields(self):
+        return tuple(name for name, _ in self.inputs + self.outputs)
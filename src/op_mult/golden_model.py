@@ -0,0 +1,229 @@
+#!python
+# coding: utf-8
+
+"""Vectorized golden models for the arithmetic benches.
+
+Instead of calling a Python reference model several times per vector, the expected result and
+flags of every (a, b) pair are computed with NumPy in one pass and stored in a table. The checker
+then does one lookup per vector. Small tables are cached on disk; tables that are too big to hold
+at once are computed lazily, a chunk of `a` rows at a time.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict, namedtuple
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+
+# Bump it whenever the arithmetic below changes, so that stale cache files are not reused.
+MODEL_VERSION = 1
+
+# The folder of the cached tables in the build folder of the run, so that it is removed by `make clean`.
+GOLDEN_CACHE = "golden"
+
+# A table is cached on disk only when it is not bigger than this (in bytes).
+CACHE_LIMIT = 64 * 1024 * 1024
+
+# The number of table entries computed at once when the table is built lazily.
+CHUNK_BITS = 20
+
+# The number of lazily computed chunks kept in memory.
+CHUNKS_IN_MEMORY = 4
+
+OPERATORS = {
+    "add": np.add,
+    "mult": np.multiply,
+}
+
+# One operator variant of the table.
+#   name:        The suffix of the field names, e.g. "signed_sat" gives c_signed_sat, ov_signed_sat and uv_signed_sat.
+#   op:          "add" or "mult".
+#   signed:      Treat the operands and the result as two's complement numbers.
+#   saturate:    Clamp the result to its range instead of wrapping around.
+#   out_width:   The width of the result. None means the operand width.
+#   merge_flags: Report a single ov flag for both overflow and underflow, like op_mult.sv does.
+Variant = namedtuple("Variant", "name op signed saturate out_width merge_flags", defaults=(None, False))
+
+def variant(op, name, out_width=None, merge_flags=False):
+    """Create a variant from a name like "signed", "unsigned_sat"."""
+    kind, _, sat = name.partition("_")
+    assert kind in ("signed", "unsigned") and sat in ("", "sat"), f"Invalid variant name {name}."
+    return Variant(name, op, kind == "signed", sat == "sat", out_width, merge_flags)
+
+def to_signed(x, width):
+    """Convert raw (unsigned) values to two's complement values. Works on integers and arrays."""
+    return x - ((x >> (width - 1) & 1) << width)
+
+def evaluate(op, a, b, width, signed=False, saturate=False, out_width=None):
+    """Evaluate the operator on arrays of raw operands. Return the (result, ov, uv) arrays."""
+    out_width = out_width or width
+    assert width <= 31 and out_width <= 62, "Operands or result are too wide."
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    if signed:
+        a, b = to_signed(a, width), to_signed(b, width)
+        lo, hi = -(1 << (out_width - 1)), (1 << (out_width - 1)) - 1
+    else:
+        lo, hi = 0, (1 << out_width) - 1
+    full = OPERATORS[op](a, b)
+    ov = full > hi
+    uv = full < lo
+    result = np.clip(full, lo, hi) if saturate else full
+    return result & ((1 << out_width) - 1), ov, uv
+
+def operand_pairs(width, start=0, stop=None, block=1 << CHUNK_BITS):
+    """Iterate over the (a, b) pairs of `width` bits from index start to stop, in arrays of `block` pairs.
+
+    The pairs are in the order of the table, i.e. the index of a pair is (a << width) | b.
+    """
+    total = 1 << (2 * width)
+    stop = total if stop is None else min(stop, total)
+    for first in range(start, stop, block):
+        index = np.arange(first, min(first + block, stop), dtype=np.int64)
+        yield index >> width, index & ((1 << width) - 1)
+
+class OperandPairs(Sequence):
+    """All the (a, b) pairs of `width` bits, in the order of operand_pairs(), as a sequence which is never
+    built. A slice, e.g. the part of a shard taken by shard() of sim_utils.py, is another OperandPairs of a
+    range of indexes, and the pairs are computed when they are read, a block at a time.
+    """
+
+    def __init__(self, width, indexes=None):
+        self.width = width
+        self.indexes = range(1 << (2 * width)) if indexes is None else indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return OperandPairs(self.width, self.indexes[i])
+        index = self.indexes[i]
+        return index >> self.width, index & ((1 << self.width) - 1)
+
+    def __iter__(self):
+        if self.indexes.step != 1:
+            mask = (1 << self.width) - 1
+            yield from ((index >> self.width, index & mask) for index in self.indexes)
+            return
+        for a, b in operand_pairs(self.width, self.indexes.start, self.indexes.stop):
+            yield from zip(a.tolist(), b.tolist())
+
+def golden_cache_dir():
+    """The folder of the cached tables of this run. The build folder is given by SIM_BUILD, which differs
+    between the shards, the sweeps and the projects of `invoke regress`."""
+    return Path(os.environ.get("SIM_BUILD", "sim_build")) / GOLDEN_CACHE
+
+class GoldenTable:
+    """The expected outputs of all operator variants for every (a, b) pair of `width` bits.
+
+    Each row of the table holds the fields listed in `fields`, in that order. The small tables are cached in
+    cache_dir, which defaults to golden_cache_dir(). Pass cache_dir=False to compute them every time.
+    """
+
+    def __init__(self, width, variants, cache_dir=None, chunk_bits=CHUNK_BITS):
+        self.width = width
+        self.variants = tuple(variants)
+        self.fields = []
+        # The bit widths of the fields. The flags are 1 bit wide.
+        self.widths = []
+        for v in self.variants:
+            self.fields.append(f"c_{v.name}")
+            self.fields.append(f"ov_{v.name}")
+            self.widths += [v.out_width or width, 1]
+            if not v.merge_flags:
+                self.fields.append(f"uv_{v.name}")
+                self.widths.append(1)
+        self.fields = tuple(self.fields)
+        self.widths = tuple(self.widths)
+        out_bits = max(v.out_width or width for v in self.variants)
+        self.dtype = np.dtype(next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(t).bits >= out_bits))
+        # Each chunk holds the rows of 2**row_bits consecutive values of a.
+        self.row_bits = min(width, max(0, chunk_bits - width))
+        self.chunk_count = 1 << (width - self.row_bits)
+        table_size = (1 << (2 * width)) * len(self.fields) * self.dtype.itemsize
+        if cache_dir is None:
+            cache_dir = golden_cache_dir()
+        self.cache_dir = Path(cache_dir) if cache_dir and table_size <= CACHE_LIMIT else None
+        key = repr((MODEL_VERSION, width, self.variants, self.row_bits, self.dtype.str))
+        self.key = hashlib.sha1(key.encode()).hexdigest()[:16]
+        self._chunks = OrderedDict()
+        self._last = (None, None)
+
+    def compute(self, a, b):
+        """Compute the expected fields of arrays of operands without the table, one row per (a, b) pair.
+
+        It suits scattered vectors, like random ones of wide operands, which would touch a chunk per vector.
+        """
+        a, b = np.broadcast_arrays(np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64))
+        out = np.empty((a.size, len(self.fields)), dtype=self.dtype)
+        column = 0
+        for v in self.variants:
+            result, ov, uv = evaluate(v.op, a, b, self.width, v.signed, v.saturate, v.out_width)
+            out[:, column] = result.ravel()
+            if v.merge_flags:
+                out[:, column + 1] = (ov | uv).ravel()
+            else:
+                out[:, column + 1] = ov.ravel()
+                out[:, column + 2] = uv.ravel()
+            column += 2 if v.merge_flags else 3
+        return out
+
+    def _compute(self, index):
+        """Compute one chunk of the table."""
+        rows = 1 << self.row_bits
+        a = np.arange(index * rows, (index + 1) * rows, dtype=np.int64)[:, None]
+        b = np.arange(1 << self.width, dtype=np.int64)[None, :]
+        return self.compute(a, b)
+
+    def chunk(self, index):
+        """Get one chunk of the table, from memory, the disk cache or by computing it."""
+        if self._last[0] == index:
+            return self._last[1]
+        chunk = self._chunks.get(index)
+        if chunk is None:
+            if self.cache_dir is not None:
+                fn = self.cache_dir / f"{self.key}_{index}.npy"
+                if fn.is_file():
+                    chunk = np.load(fn, mmap_mode="r")
+                else:
+                    chunk = self._compute(index)
+                    fn.parent.mkdir(parents=True, exist_ok=True)
+                    # Several simulations may share the cache, write to a temporary file first.
+                    tmp_fn = fn.with_name(f"{fn.stem}.{os.getpid()}.tmp.npy")
+                    np.save(tmp_fn, chunk)
+                    os.replace(tmp_fn, fn)
+            else:
+                chunk = self._compute(index)
+            self._chunks[index] = chunk
+            if len(self._chunks) > CHUNKS_IN_MEMORY:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(index)
+        self._last = (index, chunk)
+        return chunk
+
+    def lookup(self, a, b):
+        """Get the expected fields of a single vector as a tuple of integers."""
+        row_mask = (1 << self.row_bits) - 1
+        chunk = self.chunk(a >> self.row_bits)
+        return tuple(chunk[((a & row_mask) << self.width) | b].tolist())
+
+    def lookup_many(self, a, b):
+        """Get the expected fields of arrays of vectors as a 2-D array, one row per vector."""
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        out = np.empty((a.size, len(self.fields)), dtype=self.dtype)
+        index = a >> self.row_bits
+        offset = ((a & ((1 << self.row_bits) - 1)) << self.width) | b
+        for i in np.unique(index):
+            selected = index == i
+            out[selected] = self.chunk(int(i))[offset[selected]]
+        return out
+
+    def diff(self, actual, expected):
+        """Describe the mismatched fields between the actual and the expected values."""
+        return ", ".join(f"{name}({hex(x)}) != answer({hex(y)})"
+                         for name, x, y in zip(self.fields, actual, expected) if x != y)
@@ -11,37 +11,38 @@ from cocotb.handle import Release, Force
 from cocotb import utils
 
 from sim_utils import *
-from itertools import permutations
-
-to_signed = lambda x: x if x < 128 else x - 256
-
-def mult_unsigned(a, b, sat=False):
-    a, b = a & 0xFF, b & 0xFF
-    c = a * b
-    ov = 1 if c > 0xFFFF else 0
-    c = 0xFFFF & c
-    if ov and sat:
-        c = 32767
-    return c, ov
-
-def mult_signed(a, b, sat=False):
-    a_signed, b_signed = to_signed(a), to_signed(b)
-    c = a_signed * b_signed
-    ov = 1 if c > 32767 or c < -32768 else 0
-    if ov and sat:
-        c = 32767 if c > 0 else -32768
-    c = 0xFFFF & c
-    return c, ov
+from itertools import product
+from golden_model import GoldenTable, variant, operand_pairs, OperandPairs
+from vector_file import VectorFile
+import numpy as np
 
-@cocotb.test()
-async def test_proc (dut):
-    # Generate clocks and initialization.
-    clk_freq = 1e6 # The clock frequency in Hz.
-    clk_period_ns = int(1.0 / clk_freq * 1e9)
-    cocotb.start_soon(Clock(dut.clk, period_ns(clk_period_ns), units="ns").start())
+def golden_table(width):
+    """The expected outputs. They are also the names of the output ports.
 
-    # Show the information of DUT.
-    dut._log.info(f"DUT: {dut._name}")
+    The product is twice as wide as the operands, and op_mult.sv has a single overflow flag.
+    """
+    return GoldenTable(width, [variant("mult", name, out_width=2 * width, merge_flags=True)
+                               for name in ("signed", "unsigned", "signed_sat", "unsigned_sat")])
+
+def functional_coverage(width):
+    """The signs of the operands crossed with the overflow flag of the signed product."""
+    cov = Coverage()
+    a_sign = cov.point("a_sign", sign_bins(width), field="a")
+    b_sign = cov.point("b_sign", sign_bins(width), field="b")
+    ov = cov.point("ov_signed", flag_bins())
+    cov.cross("signs_x_ov", a_sign, b_sign, ov)
+    return cov
+
+def vector_source(width, start=0, stop=None):
+    """The fields, and the blocks of vectors and expected outputs of every (a, b) pair, for `invoke gen-vectors`."""
+    golden = golden_table(width)
+    blocks = (np.column_stack((a, b, golden.lookup_many(a, b))) for a, b in operand_pairs(width, start, stop))
+    return [("a", width), ("b", width)], list(zip(golden.fields, golden.widths)), blocks
+
+async def reset(dut):
+    """Start the clock and reset the DUT."""
+    clk_freq = 1e6 # The clock frequency in Hz.
+    cocotb.start_soon(Clock(dut.clk, period_ns(freq_hz=clk_freq), unit="ns").start())
     dut.rst_n.value = 0
     dut.a.value = 0
     dut.b.value = 0
@@ -49,31 +50,89 @@ async def test_proc (dut):
     dut.rst_n.value = 1
     await (dut.clk@posedge)
 
-    for i, j in permutations(range(256), 2):
-        dut.a.value = i
-        dut.b.value = j
-        await (2@cycles(dut.clk, rising=True))
-        c_signed        = dut.c_signed.value.to_unsigned()
-        ov_signed       = int(dut.ov_signed.value)
-        c_unsigned      = dut.c_unsigned.value.to_unsigned()
-        ov_unsigned     = int(dut.ov_unsigned.value)
-        c_signed_sat    = dut.c_signed_sat.value.to_unsigned()
-        ov_signed_sat   = int(dut.ov_signed_sat.value)
-        c_unsigned_sat  = dut.c_unsigned_sat.value.to_unsigned()
-        ov_unsigned_sat = int(dut.ov_unsigned_sat.value)
-
-        answer_unsigned, answer_ov_unsigned = mult_unsigned(i, j, sat=False)
-        answer_unsigned_sat, answer_ov_unsigned_sat = mult_unsigned(i, j, sat=True)
-        answer_signed, answer_ov_signed = mult_signed(i, j, sat=False)
-        answer_signed_sat, answer_ov_signed_sat = mult_signed(i, j, sat=True)
-
-        assert c_signed == answer_signed                , f"Signed multiplication failed for {i} * {j}: got {c_signed}, expected {answer_signed}"
-        assert ov_signed == answer_ov_signed            , f"Signed multiplication overflow flag failed for {i} * {j}: got {ov_signed}, expected {answer_ov_signed}"
-        assert c_unsigned == answer_unsigned            , f"Unsigned multiplication failed for {i} * {j}: got {c_unsigned}, expected {answer_unsigned}"
-        assert ov_unsigned == answer_ov_unsigned        , f"Unsigned multiplication overflow flag failed for {i} * {j}: got {ov_unsigned}, expected {answer_ov_unsigned}"
-        assert c_signed_sat == answer_signed_sat        , f"Signed multiplication with saturation failed for {i} * {j}: got {c_signed_sat}, expected {answer_signed_sat}"
-        assert ov_signed_sat == answer_ov_signed_sat    , f"Signed multiplication with saturation overflow flag failed for {i} * {j}: got {ov_signed_sat}, expected {answer_ov_signed_sat}"
-        assert c_unsigned_sat == answer_unsigned_sat    , f"Unsigned multiplication with saturation failed for {i} * {j}: got {c_unsigned_sat}, expected {answer_unsigned_sat}"
-        assert ov_unsigned_sat == answer_ov_unsigned_sat, f"Unsigned multiplication with saturation overflow flag failed for {i} * {j}: got {ov_unsigned_sat}, expected {answer_ov_unsigned_sat}"
-        
+@cocotb.test()
+@session_test(setup=reset)
+async def test_proc (dut):
+    # Show the information of DUT.
+    dut._log.info(f"DUT: {dut._name}")
+
+    golden = golden_table(len(dut.a))
+
+    inputs = SignalBundle(dut, ("a", "b"))
+    outputs = SignalBundle(dut, golden.fields)
+    coverage = functional_coverage(len(dut.a))
+    fields = inputs.names + outputs.names
+    scoreboard = Scoreboard(inputs, outputs)
+
+    def check(vector, answer, result):
+        if scoreboard.check(vector, answer, result):
+            coverage.sample(dict(zip(fields, vector + result)))
+
+    # The progress is saved at intervals, so an interrupted run goes on from there with `invoke run --resume`.
+    checkpoint = Checkpoint("test_proc", scoreboard, coverage)
+    # A new vector every clock. The outputs come out one clock later, through the op_a/op_b registers.
+    # With `invoke run --jobs N`, each simulator process only runs its own shard of the vectors.
+    pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, lambda v: golden.lookup(*v), check, latency=1, checkpoint=checkpoint)
+    if vector_file():
+        # The vectors and their expected outputs come from a file written by `invoke gen-vectors`.
+        vectors = VectorFile(vector_file())
+        vectors.check_ports(dut)
+        count = await pipeline.run(shard(vectors.vectors), answers=shard(vectors.answers))
+    else:
+        # All the operand pairs of the width of the DUT, which `invoke sweep` may change with N. They are computed
+        # as the shard reads them, so a wide DUT doesn't run out of memory.
+        count = await pipeline.run(shard(OperandPairs(len(dut.a))))
+    coverage.save()
+    dut._log.info(f"{count} vectors checked.")
+    scoreboard.finish()
     dut._log.info("TEST DONE!")
+
+@cocotb.test()
+@session_test(setup=reset)
+async def test_random(dut):
+    """Constrained-random operands of the full width, until all the coverage bins are hit and at least `width`
+    vectors per bin are checked."""
+    width = len(dut.a)
+    golden = golden_table(width)
+    inputs = SignalBundle(dut, ("a", "b"))
+    outputs = SignalBundle(dut, golden.fields)
+    coverage = functional_coverage(len(dut.a))
+    fields = inputs.names + outputs.names
+    scoreboard = Scoreboard(inputs, outputs)
+
+    def check(vector, answer, result):
+        if scoreboard.check(vector, answer, result):
+            coverage.sample(dict(zip(fields, vector + result)))
+
+    # All the shards of `invoke run` share the seed, so they generate the same vectors and run their own part.
+    engine = RandomOperands(width, "mult", seed=cocotb.RANDOM_SEED)
+    vectors = shard(list(engine.vectors()))
+    # The operands are scattered over the whole range, so the answers are computed without the table.
+    a, b = np.array(vectors, dtype=np.int64).reshape(-1, 2).T
+    answers = map(tuple, golden.compute(a, b).tolist())
+    pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, None, check, latency=1)
+    count = await pipeline.run(vectors, answers=answers)
+    coverage.save()
+    dut._log.info(f"{count} random vectors checked, {engine.coverage.covered} of {engine.coverage.count} bins covered.")
+    scoreboard.finish()
+
+@cocotb.test()
+@cocotb.parametrize(a_corner=CORNERS, b_corner=CORNERS)
+@session_test(setup=reset)
+async def test_corner(dut, a_corner, b_corner):
+    """The operands at and around a corner class each, a short test for every pair of corners.
+
+    All of them run in one simulator session, each from its own reset.
+    """
+    width = len(dut.a)
+    golden = golden_table(width)
+    inputs = SignalBundle(dut, ("a", "b"))
+    outputs = SignalBundle(dut, golden.fields)
+    scoreboard = Scoreboard(inputs, outputs)
+    vectors = shard(list(product(corner_values(width, a_corner), corner_values(width, b_corner))))
+    a, b = np.array(vectors, dtype=np.int64).reshape(-1, 2).T
+    answers = map(tuple, golden.compute(a, b).tolist())
+    pipeline = VectorPipeline(dut.clk, inputs.write, outputs.read, None, scoreboard.check, latency=1)
+    count = await pipeline.run(vectors, answers=answers)
+    dut._log.info(f"{count} vectors around {a_corner} x {b_corner} checked.")
+    scoreboard.finish()
@@ -0,0 +1,77 @@
+#!python
+# coding: utf-8
+
+"""A cycle-accurate model of round_robin_queue_arbiter, for checking the RTL in lock-step.
+
+The requests and the grants are N-bit integers, one bit per requester, so every clock is a handful of integer
+operations whatever N is. The entries of request_queue are kept in a deque: the occupied entries of the RTL
+always form a prefix of the queue, so a push, a pop and a quick pop only touch its ends.
+
+Usage:
+    model = QueueArbiterModel(n=4, depth=4)
+    model.reset()
+    grant = model.grant(req)   # The combinational grant output while req is applied.
+    model.clock(req)           # The rising edge of clk with req applied.
+"""
+
+from collections import deque
+
+class QueueArbiterModel:
+    def __init__(self, n=4, depth=4, quick_pop=1):
+        self.n = n
+        self.depth = depth
+        self.quick_pop = quick_pop
+        self.mask = (1 << n) - 1
+        self.last = 1 << (n - 1)
+        self.reset()
+
+    def reset(self):
+        """The state of rst_n low."""
+        self.queue = deque()                # The occupied entries of request_queue, the head first.
+        self.rotate_ptr = self.mask         # The requesters after the last granted one.
+        self.arbiter_grant = 0              # The grant register of round_robin_arbiter.
+
+    def masked_req(self, req):
+        """The requests passed to round_robin_arbiter: the queue head, or req when the queue is empty."""
+        return req & self.queue[0] if self.queue else req
+
+    def grant(self, req):
+        """The grant output while req is applied."""
+        return self.arbiter_grant & req
+
+    def clock(self, req):
+        """Update the registers at a rising edge of clk with req applied."""
+        queue = self.queue
+        masked_req = req & queue[0] if queue else req
+        grant = self.arbiter_grant
+        pop = queue and not (grant & req) and not masked_req
+
+        # round_robin_arbiter: hold the grant while its request stays, otherwise grant the lowest request at
+        # or after the rotate pointer, or the lowest one if there is none. The pointer moves past the granted
+        # requester after that.
+        if not grant & masked_req:
+            mask_req = masked_req & self.rotate_ptr
+            next_grant = mask_req & -mask_req if mask_req else masked_req & -masked_req
+            self.arbiter_grant = next_grant & ~grant
+        if grant:
+            if grant & self.last:
+                self.rotate_ptr = self.mask
+            else:
+                self.rotate_ptr = self.mask & ~((grant & -grant) * 2 - 1)
+
+        # request_queue.
+        if not req:
+            queue.clear()
+        elif pop:
+            tail = queue[-1]
+            queue.popleft()
+            # A quick pop refills the freed entry with req at the tail, unless req is the same as the old tail.
+            if self.quick_pop and req != tail:
+                queue.append(req)
+        elif len(queue) < self.depth and (not queue or req != queue[-1]):
+            queue.append(req)
+
+    @property
+    def occupancy(self):
+        """The number of occupied entries of the request queue."""
+        return len(self.queue)
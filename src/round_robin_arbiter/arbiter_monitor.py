@@ -0,0 +1,191 @@
+#!python
+# coding: utf-8
+
+"""A passive monitor of the fairness and the latency of round_robin_queue_arbiter.
+
+The monitor samples req, grant and the occupancy of the request queue in the falling edge of every clock.
+It never writes a signal, so it can watch any test. For each requester it measures the latency of every
+request, the clocks from the assertion of its req bit to its grant, into a histogram in a fixed-size array.
+A request which is dropped before it is granted is counted as abandoned.
+
+Only the requesters whose bits changed are visited in a clock, so a clock costs a few integer operations
+when nothing happens. At the end of a run, write() saves the summary as metrics.json and metrics.csv into
+the build folder. The CSV rows hold the configuration of the DUT, so the files of several configurations
+can be concatenated and compared.
+
+Usage:
+    monitor = ArbiterMonitor(dut)
+    monitor.start()
+    ...
+    monitor.stop()
+    monitor.write()
+"""
+
+import csv
+import json
+import os
+from array import array
+import cocotb
+from cocotb.triggers import FallingEdge
+from sim_utils import signal_reader
+
+METRICS_JSON = "metrics.json"
+METRICS_CSV = "metrics.csv"
+
+# The bins of the latency histograms. The last bin counts the latencies of LATENCY_BINS - 1 clocks and more.
+LATENCY_BINS = 64
+
+CSV_FIELDS = ("N", "DEPTH", "QUICK_POP", "requester", "requests", "grants", "abandoned",
+              "mean_latency", "p99_latency", "max_latency", "max_wait", "grant_share")
+
+def bits_of(mask):
+    """Iterate over the indexes of the set bits of a mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def percentile(histogram, share):
+    """The smallest bin of a histogram which holds the given share of its counts."""
+    total = sum(histogram)
+    if not total:
+        return 0
+    limit = share * total
+    count = 0
+    for value, hits in enumerate(histogram):
+        count += hits
+        if count >= limit:
+            return value
+    return len(histogram) - 1
+
+class ArbiterMonitor:
+    def __init__(self, dut, latency_bins=LATENCY_BINS):
+        self.n = int(dut.N.value)
+        self.depth = int(dut.DEPTH.value)
+        self.quick_pop = int(dut.QUICK_POP.value)
+        self.clk = dut.clk
+        self._req = signal_reader(dut.req)
+        self._grant = signal_reader(dut.grant)
+        # The occupied entries of the request queue, if the hierarchy of the DUT is visible.
+        occupied = getattr(getattr(getattr(dut, "dut", None), "request_queue_u0", None), "queue_occupied", None)
+        self._occupied = None if occupied is None else signal_reader(occupied)
+        self.bins = latency_bins
+        self.latency = array("Q", bytes(8 * self.n * latency_bins))    # The histograms, one row per requester.
+        self.requests = array("Q", bytes(8 * self.n))
+        self.grants = array("Q", bytes(8 * self.n))
+        self.abandoned = array("Q", bytes(8 * self.n))
+        self.max_latency = array("Q", bytes(8 * self.n))
+        self.max_wait = array("Q", bytes(8 * self.n))                  # Including the abandoned requests.
+        self.occupancy = array("Q", bytes(8 * (self.depth + 1)))       # The clocks of each number of entries.
+        self.start_cycle = [0] * self.n     # The clock of the pending request of each requester.
+        self.waiting = 0                    # The requesters whose request isn't granted yet.
+        self.served = 0                     # The requesters granted since they raised their request.
+        self.cycles = 0
+        self.grant_cycles = 0
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        falling = FallingEdge(self.clk)
+        while True:
+            await falling
+            self.sample(int(self._req(), 2), int(self._grant(), 2))
+            if self._occupied is not None:
+                self.occupancy[self._occupied().count("1")] += 1
+
+    def sample(self, req, grant):
+        """Count a clock with the given req and grant."""
+        cycle = self.cycles
+        self.cycles += 1
+        if grant:
+            self.grant_cycles += 1
+        active = self.waiting | self.served
+        dropped = active & ~req
+        if dropped:
+            for i in bits_of(dropped & self.waiting):
+                self.abandoned[i] += 1
+                self.max_wait[i] = max(self.max_wait[i], cycle - self.start_cycle[i])
+            self.waiting &= ~dropped
+            self.served &= ~dropped
+        raised = req & ~active
+        if raised:
+            for i in bits_of(raised):
+                self.requests[i] += 1
+                self.start_cycle[i] = cycle
+            self.waiting |= raised
+        granted = grant & self.waiting
+        if granted:
+            for i in bits_of(granted):
+                latency = cycle - self.start_cycle[i]
+                self.latency[i * self.bins + min(latency, self.bins - 1)] += 1
+                self.grants[i] += 1
+                if latency > self.max_latency[i]:
+                    self.max_latency[i] = latency
+                    self.max_wait[i] = max(self.max_wait[i], latency)
+            self.waiting &= ~granted
+            self.served |= granted
+
+    def histogram(self, i):
+        return self.latency[i * self.bins:(i + 1) * self.bins]
+
+    def summary(self):
+        """The metrics of the run as a dictionary."""
+        cycles = self.cycles or 1
+        total_grants = sum(self.grants) or 1
+        requesters = []
+        for i in range(self.n):
+            histogram = self.histogram(i)
+            grants = self.grants[i]
+            # A request still waiting at the end has waited at least this long.
+            pending = self.cycles - self.start_cycle[i] if self.waiting >> i & 1 else 0
+            requesters.append({
+                "requester": i,
+                "requests": self.requests[i],
+                "grants": grants,
+                "abandoned": self.abandoned[i],
+                "mean_latency": round(sum(value * hits for value, hits in enumerate(histogram)) / grants, 3) if grants else 0,
+                "p99_latency": percentile(histogram, 0.99),
+                "max_latency": self.max_latency[i],
+                "max_wait": max(self.max_wait[i], pending),
+                "grant_share": round(grants / total_grants, 4),
+                "latency_histogram": histogram.tolist(),
+            })
+        occupied = sum(self.occupancy)
+        shares = [r["grants"] for r in requesters]
+        # Jain's fairness index of the grants: 1 when all the requesters get the same number of grants.
+        fairness = sum(shares) ** 2 / (self.n * sum(x * x for x in shares)) if any(shares) else 1.0
+        return {
+            "N": self.n,
+            "DEPTH": self.depth,
+            "QUICK_POP": self.quick_pop,
+            "cycles": self.cycles,
+            "grants_per_cycle": round(self.grant_cycles / cycles, 4),
+            "fairness": round(fairness, 4),
+            "worst_wait": max((r["max_wait"] for r in requesters), default=0),
+            "queue_occupancy": {
+                "mean": round(sum(k * hits for k, hits in enumerate(self.occupancy)) / occupied, 3) if occupied else None,
+                "max": max((k for k, hits in enumerate(self.occupancy) if hits), default=None),
+                "histogram": self.occupancy.tolist(),
+            },
+            "requesters": requesters,
+        }
+
+    def write(self, folder=None):
+        """Write metrics.json and metrics.csv into the folder, default to the build folder. Return the summary."""
+        folder = folder or os.environ.get("SIM_BUILD", "sim_build")
+        summary = self.summary()
+        with open(os.path.join(folder, METRICS_JSON), "w") as f:
+            json.dump(summary, f, indent=2)
+        with open(os.path.join(folder, METRICS_CSV), "w", newline="") as f:
+            writer = csv.DictWriter(f, CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            for requester in summary["requesters"]:
+                writer.writerow({"N": self.n, "DEPTH": self.depth, "QUICK_POP": self.quick_pop, **requester})
+        return summary
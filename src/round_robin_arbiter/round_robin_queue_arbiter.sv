@@ -1,4 +1,4 @@
-module round_robin_queue_arbiter #(parameter int N = 4, parameter int DEPTH = 4) (
+module round_robin_queue_arbiter #(parameter int N = 4, parameter int DEPTH = 4, parameter int QUICK_POP = 1) (
     input logic rst_n,
     input logic clk,
     input logic [N-1:0] req,
@@ -20,7 +20,7 @@ module round_robin_queue_arbiter #(parameter int N = 4, parameter int DEPTH = 4)
 
     // The request queue can keep the changing order of requests.
     // The first come request will be granted first.
-    request_queue #(.N(N), .DEPTH(DEPTH)) request_queue_u0 (
+    request_queue #(.N(N), .DEPTH(DEPTH), .QUICK_POP(QUICK_POP)) request_queue_u0 (
                         .req(req),
                         .req_o(queued_req),
                         .pop(pop_req_queue),
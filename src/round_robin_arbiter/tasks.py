@@ -1,22 +1,692 @@
 #!/bin/sh
 # coding: utf-8
 
-import sys
+import glob
+import hashlib
+import importlib
+import itertools
+import json
 import os
-from shutil import which
-from invoke import task, Program, Collection
+import re
+import shutil
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from pathlib import Path
+from invoke import task, Program, Collection, Exit
+
+# The build folder and the JUnit report of `run`. `invoke regress` of the repository sets them, so that it
+# runs each project in its own folder under regress_build.
+SIM_BUILD = os.environ.get("SIM_BUILD", "sim_build")
+RESULTS_FILE = os.environ.get("RESULTS_FILE", "results.xml")
+
+# The compiled images of earlier builds, keyed by the hash of everything that affects the build.
+BUILD_CACHE = ".build_cache"
+BUILD_CACHE_SIZE = 8
+BUILD_STAMP = ".build_key"
+
+# The Makefile variables which affect the compiled image.
+BUILD_VARS = ("SIM", "TOPLEVEL", "TOPLEVEL_LANG", "VERILOG_SOURCES", "VHDL_SOURCES", "VERILOG_INCLUDE_DIRS",
+              "COMPILE_ARGS", "EXTRA_ARGS", "BUILD_ARGS", "WAVES", "WAVES_WINDOW")
+
+# The file in which the test bench records the index of the first failed vector (see sim_utils.py).
+FAILED_VECTOR_FILE = "failed_vector"
+
+# The file in which the test bench counts its vectors and clock cycles (see sim_utils.py).
+BENCH_FILE = "bench.json"
+
+# The file in which the test bench records the setup and run time of its tests (see session_test in sim_utils.py).
+SESSION_FILE = "session.json"
+
+# The file in which the long tests save their progress for `run --resume` (see Checkpoint in sim_utils.py).
+CHECKPOINT_FILE = "checkpoint.json"
+
+# The file in which the test bench saves its functional coverage (see Coverage in sim_utils.py).
+COVERAGE_FILE = "coverage.cov"
+
+# The summaries written by monitors of the test bench, e.g. arbiter_monitor.py of round_robin_arbiter.
+METRICS_FILES = ("metrics.json", "metrics.csv")
+
+# The reports of sim_profile.py in the build folder.
+PROFILE_FILES = ("profile.txt", "profile.folded")
+
+# The build folders of `sweep`, one per configuration, and its report in the build folder.
+SWEEP_BUILD = "sweep"
+SWEEP_REPORT = "sweep.json"
+
+# The folders in a build folder which are kept when the build is cleared.
+BUILD_SUBDIRS = ("shard_*", "golden", "waves", SWEEP_BUILD)
+
+# The files in a build folder which are not part of the compiled image.
+BUILD_OUTPUTS = ("results.xml", "run.log", BENCH_FILE, SESSION_FILE, CHECKPOINT_FILE, FAILED_VECTOR_FILE, COVERAGE_FILE, "*.fst", "*.vcd", "*.store") + METRICS_FILES + PROFILE_FILES + BUILD_SUBDIRS
+
+# The waveform modes of `run --waves` and their make variables.
+# The on-fail mode runs without dumping, then reruns the first failed shard with dumping.
+WAVES_MODES = {
+    "off": {"WAVES": 0},
+    "always": {"WAVES": 1},
+    "on-fail": {"WAVES": 0},
+    "window": {"WAVES": 1, "WAVES_WINDOW": 1},
+}
+
+# The build folder of the rerun of `run --waves on-fail`.
+WAVES_BUILD = f"{SIM_BUILD}/waves"
+
+# The rerun dumps this number of vectors before the failed one, if the test bench records it.
+WAVES_MARGIN = 16
+
+# The default vector file of `gen-vectors` and `run --vectors` (see vector_file.py).
+VECTOR_FILE = "vectors.vec"
+
+# The compiled images of the simulators in the build folder. `run --jobs` builds them once for all the shards.
+SIM_IMAGES = {
+    "icarus": "sim.vvp",
+    "verilator": "Vtop",
+}
+
+# The simulators which compile the path of the waveform file into the image when WAVES is 1, like the $dumpfile
+# "$(SIM_BUILD)/top.fst" which cocotb's Makefile.icarus writes into cocotb_iverilog_dump.v. Their images
+# dump into the folder they were built for, so they can't be shared between build folders then.
+DUMP_PATH_SIMULATORS = ("icarus",)
+
+# The commands to get the version of the simulators.
+SIM_VERSION_COMMANDS = {
+    "icarus": "iverilog -V",
+    "verilator": "verilator --version",
+    "ghdl": "ghdl --version",
+    "nvc": "nvc --version",
+}
+
+def which(program):
+    """Check if a program exists in PATH."""
+    import os
+    def is_exe(fpath):
+        return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+
+    fpath, fname = os.path.split(program)
+    if fpath:
+        if is_exe(program):
+            return program
+    else:
+        for path in os.environ["PATH"].split(os.pathsep):
+            path = path.strip('"')
+            exe_file = os.path.join(path, program)
+            if is_exe(exe_file):
+                return exe_file
+    return None
+
+def makefile_var(name, default=None):
+    """Get the value of a simple variable assignment in the Makefile."""
+    m = re.search(rf"^{name}\s*[:?]?=[ \t]*(.*)$", Path("Makefile").read_text(), re.MULTILINE)
+    return m.group(1).strip() if m else default
+
+def make_command(target, **make_vars):
+    """Get the make command line of a target with overridden variables."""
+    return " ".join(["make -f Makefile", str(target)] + [f"{k}={v}" for k, v in make_vars.items()])
+
+def shares_image(sim, waves):
+    """Whether the image of a simulator can be copied into other build folders, see DUMP_PATH_SIMULATORS."""
+    return not (sim in DUMP_PATH_SIMULATORS and str(waves) == "1")
+
+def build_key(c, **make_vars):
+    """Hash the sources, the build variables of the Makefile and the simulator version."""
+    # Let make expand the variables, so that wildcards and the settings of cocotb's makefiles are included.
+    print_vars = "print-build-vars: ; @: $(foreach v,$(BUILD_VARS),$(info $(v)=$($(v))))"
+    cmd = make_command("print-build-vars", BUILD_VARS='"' + " ".join(BUILD_VARS) + '"', **make_vars)
+    values = c.run(f"{cmd} -s --eval='{print_vars}'", hide=True).stdout
+    build_vars = dict(line.split("=", 1) for line in values.splitlines() if "=" in line)
+    if shares_image(build_vars.get("SIM", ""), build_vars.get("WAVES", "")):
+        # The sources generated into the build folder, like waves_ctrl.v, are the same in every build folder,
+        # so the shards and the reruns share the key.
+        values = values.replace(str(make_vars.get("SIM_BUILD", SIM_BUILD)), "$(SIM_BUILD)")
+    h = hashlib.sha256(values.encode())
+    files = build_vars.get("VERILOG_SOURCES", "").split() + build_vars.get("VHDL_SOURCES", "").split()
+    for folder in build_vars.get("VERILOG_INCLUDE_DIRS", "").split():
+        files += sorted(str(fn) for fn in Path(folder).iterdir() if fn.is_file())
+    for fn in files:
+        if Path(fn).is_file():
+            h.update(fn.encode())
+            h.update(Path(fn).read_bytes())
+    version_cmd = SIM_VERSION_COMMANDS.get(build_vars.get("SIM", ""))
+    if version_cmd:
+        h.update(c.run(version_cmd, hide=True, warn=True).stdout.encode())
+    return h.hexdigest()[:16]
+
+def is_build_output(fn):
+    return any(fn.match(pattern) for pattern in BUILD_OUTPUTS)
+
+def touch_tree(folder):
+    """Make the files of a build folder newer than the sources, so make doesn't rebuild them."""
+    now = time.time()
+    for fn in Path(folder).rglob("*"):
+        os.utime(fn, (now, now))
+
+def prepare_build(c, build_dir, **make_vars):
+    """Make sure the build folder holds the image of the current build key. Return the key.
+
+    The image is kept when the key hasn't changed, and restored from the build cache when it was built before.
+    Otherwise the stale build is removed, so make builds it again.
+    """
+    build_dir = Path(build_dir)
+    key = build_key(c, SIM_BUILD=build_dir, **make_vars)
+    stamp = build_dir / BUILD_STAMP
+    if stamp.is_file() and stamp.read_text() == key:
+        touch_tree(build_dir)
+        return key
+    if build_dir.is_dir():
+        for fn in build_dir.iterdir():
+            # Keep the builds of the shards and the reruns, and the cached golden models. An interrupted run
+            # never stored its build, so keep its checkpoint too. The test bench checks its build key.
+            if any(fn.match(pattern) for pattern in BUILD_SUBDIRS) or fn.name == CHECKPOINT_FILE:
+                continue
+            shutil.rmtree(fn) if fn.is_dir() else fn.unlink()
+    cached = Path(BUILD_CACHE) / key
+    if cached.is_dir():
+        print(f"Restore the build of {build_dir} from {cached}.")
+        shutil.copytree(cached, build_dir, dirs_exist_ok=True)
+        touch_tree(build_dir)
+    return key
+
+def store_build(build_dir, key):
+    """Save the image of a build folder into the build cache."""
+    build_dir = Path(build_dir)
+    (build_dir / BUILD_STAMP).write_text(key)
+    cached = Path(BUILD_CACHE) / key
+    if not cached.is_dir():
+        tmp_dir = cached.with_name(f"{key}.{os.getpid()}.tmp")
+        shutil.copytree(build_dir, tmp_dir, ignore=lambda folder, names: [n for n in names if is_build_output(Path(n))])
+        try:
+            tmp_dir.rename(cached)
+        except OSError:
+            # Another shard stored the same build.
+            shutil.rmtree(tmp_dir)
+    os.utime(cached)
+    # Keep the most recently used builds only.
+    builds = sorted((fn for fn in Path(BUILD_CACHE).iterdir() if fn.is_dir() and not fn.name.endswith(".tmp")), key=lambda fn: fn.stat().st_mtime, reverse=True)
+    for fn in builds[BUILD_CACHE_SIZE:]:
+        shutil.rmtree(fn, ignore_errors=True)
+
+def make_value(c, name, **make_vars):
+    """The value of a variable of the Makefile as make expands it, with the settings of cocotb's makefiles."""
+    cmd = make_command("print-value", **make_vars)
+    return c.run(f"{cmd} -s --eval='print-value: ; @: $(info $({name}))'", hide=True).stdout.strip()
+
+def build_image(c, build_dir, **make_vars):
+    """Build only the compiled image into a build folder, through the build cache, and store it in the cache.
+
+    Return the build key, or None if the image of the simulator isn't known or can't be shared with other build
+    folders, in which case the simulation builds it.
+    """
+    sim = make_value(c, "SIM", **make_vars)
+    image = SIM_IMAGES.get(sim)
+    if image is None or not shares_image(sim, make_value(c, "WAVES", **make_vars)):
+        return None
+    key = prepare_build(c, build_dir, **make_vars)
+    result = c.run(make_command(Path(build_dir) / image, SIM_BUILD=build_dir, **make_vars), warn=True, hide=True)
+    if not result.ok:
+        log_file = Path(build_dir) / "run.log"
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        log_file.write_text(result.stdout + result.stderr)
+        raise Exit(f"The build failed. See {log_file}.", code=1)
+    store_build(build_dir, key)
+    return key
 
-@task
-def clean(c):
+def clear_test_records(build_dir):
+    """Remove the files written by the test bench of the last run."""
+    for name in (FAILED_VECTOR_FILE, BENCH_FILE, SESSION_FILE, COVERAGE_FILE) + METRICS_FILES:
+        (Path(build_dir) / name).unlink(missing_ok=True)
+
+def merge_results(result_files, output):
+    """Merge the results.xml files of the shards into one JUnit report. Return the number of failed tests."""
+    merged = ET.Element("testsuites", name="results")
+    failures = 0
+    for i, fn in enumerate(result_files):
+        if not Path(fn).is_file():
+            # The simulator crashed before writing the results.
+            suite = ET.SubElement(merged, "testsuite", name=f"shard_{i}")
+            testcase = ET.SubElement(suite, "testcase", name=f"shard_{i}", classname="shard")
+            ET.SubElement(testcase, "error", message=f"{fn} was not written by the simulation.")
+            failures += 1
+            continue
+        for suite in ET.parse(fn).getroot().iter("testsuite"):
+            suite.set("name", f"{suite.get('name', 'all')}.shard_{i}")
+            failures += sum(1 for t in suite.iter("testcase") if t.find("failure") is not None or t.find("error") is not None)
+            merged.append(suite)
+    ET.indent(merged)
+    ET.ElementTree(merged).write(output, encoding="UTF-8", xml_declaration=True)
+    return failures
+
+@task(help={"cache": "Remove the build cache too."})
+def clean(c, cache=False):
     """Clean the project."""
     c.run("rm -f results.xml")
     c.run("make -f Makefile clean")
+    if cache:
+        c.run(f"rm -rf {BUILD_CACHE}")
+
+def build_and_run(c, build_dir, result_file, env=None, hide=False, **make_vars):
+    """Build with the build cache and run the test into result_file.
+
+    With hide, the output is written to run.log of the build folder instead.
+    """
+    key = prepare_build(c, build_dir, **make_vars)
+    clear_test_records(build_dir)
+    cmd = make_command(result_file, SIM_BUILD=build_dir, COCOTB_RESULTS_FILE=result_file, **make_vars)
+    result = c.run(cmd, env={**(env or {}), "BUILD_KEY": key}, warn=True, hide=hide)
+    if hide:
+        log_file = Path(build_dir) / "run.log"
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        log_file.write_text(result.stdout + result.stderr)
+    # The image is good as long as the simulation ran, even if some tests failed.
+    if Path(result_file).is_file():
+        store_build(build_dir, key)
+    return result
+
+def rerun_with_waves(c, build_dir, env=None, **make_vars):
+    """Run a failed simulation again with dumping, around the first failed vector if it is recorded.
+
+    Only the test of the failed vector is run, since the vector range means nothing to the other tests.
+    """
+    # The rerun starts from the vectors before the failure, not from a checkpoint.
+    env = {name: value for name, value in (env or {}).items() if name != "RESUME"}
+    failed_vector = Path(build_dir) / FAILED_VECTOR_FILE
+    if failed_vector.is_file():
+        index, _, test = failed_vector.read_text().partition("\n")
+        index, test = int(index), test.strip()
+        env["VECTOR_RANGE"] = f"{max(0, index - WAVES_MARGIN)}:{index + 1}"
+        if test:
+            # cocotb searches the full names of the tests with the filter as a regular expression.
+            env["COCOTB_TEST_FILTER"] = f"^{re.escape(test)}$"
+        print(f"Rerun vectors {env['VECTOR_RANGE']} of {test or build_dir} with dumping in {WAVES_BUILD}.")
+    else:
+        print(f"Rerun {build_dir} with dumping in {WAVES_BUILD}.")
+    result_file = (Path(WAVES_BUILD) / "results.xml").absolute()
+    result_file.unlink(missing_ok=True)
+    build_and_run(c, WAVES_BUILD, result_file, env=env, hide=True, **{**make_vars, **WAVES_MODES["always"]})
+    print(f"Show the waveform with `invoke waveform`. The log is in {WAVES_BUILD}/run.log.")
+
+def profile_env():
+    """The environment which starts sim_profile.py before cocotb in the simulation."""
+    python_path = [str(Path.cwd())] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])
+    return {"PYGPI_USERS": "sim_profile:start", "PYTHONPATH": os.pathsep.join(python_path)}
+
+def show_profile(build_dir):
+    """Print the time split of the profile of a build folder."""
+    report = Path(build_dir) / PROFILE_FILES[0]
+    if not report.is_file():
+        print(f"No profile was written in {build_dir}.")
+        return
+    print("\n".join(report.read_text().splitlines()[:5]))
+    print(f"Profile: {report}, flamegraph stacks: {Path(build_dir) / PROFILE_FILES[1]}")
 
-@task
-def run(c):
+def show_session(build_dir, wall_s):
+    """Print the setup and run time of each test of a simulator session, and the time outside the tests."""
+    session_file = Path(build_dir) / SESSION_FILE
+    if not session_file.is_file():
+        return
+    records = json.loads(session_file.read_text())
+    width = max(len("Test"), *(len(r["test"]) for r in records))
+    print(f"{'Test':<{width}}  {'Setup s':>8}  {'Run s':>8}  {'Setup ns':>12}  {'Run ns':>12}")
+    for r in records:
+        print(f"{r['test']:<{width}}  {r['setup_s']:8.3f}  {r['run_s']:8.3f}  {r['setup_ns']:12.0f}  {r['run_ns']:12.0f}")
+    setup_s = sum(r["setup_s"] for r in records)
+    run_s = sum(r["run_s"] for r in records)
+    print(f"{len(records)} tests in one session: {setup_s:.3f} s of setup, {run_s:.3f} s of run, "
+          f"{max(0.0, wall_s - setup_s - run_s):.3f} s outside the tests (build, start-up and elaboration).")
+
+def vector_env(vectors):
+    """The environment which makes the test bench read its vectors from a vector file."""
+    if not vectors:
+        return {}
+    if not Path(vectors).is_file():
+        raise Exit(f"Vector file {vectors} doesn't exist. Write it with `invoke gen-vectors`.", code=1)
+    return {"VECTOR_FILE": str(Path(vectors).absolute())}
+
+def random_seed(seed=0):
+    """The random seed of a run, a new one if seed is 0."""
+    return str(seed or int.from_bytes(os.urandom(4), "little") >> 1)
+
+def checkpoint_files(jobs):
+    """The checkpoint files of the build folders of a run of `jobs` shards."""
+    build_dirs = [Path(SIM_BUILD)] if jobs <= 1 else [Path(SIM_BUILD) / f"shard_{i}" for i in range(jobs)]
+    return [build_dir / CHECKPOINT_FILE for build_dir in build_dirs]
+
+def resume_seed(jobs):
+    """The random seed of the checkpoints of an interrupted run, which the resumed run must use."""
+    seeds = {json.loads(fn.read_text()).get("seed") for fn in checkpoint_files(jobs) if fn.is_file()}
+    if not seeds:
+        raise Exit(f"No checkpoint of a run with {jobs} shard(s) to resume. Run it with the same --jobs.", code=1)
+    if len(seeds) > 1:
+        raise Exit(f"The checkpoints of the shards have different seeds {sorted(seeds)}.", code=1)
+    return seeds.pop()
+
+@task(help={"jobs": "Number of simulator processes. Each one runs a shard of the test vectors.",
+            "waves": "Waveform dumping: off, always, on-fail (rerun the failure with dumping) or window "
+                     "(the test bench switches it with waves_on() and waves_off()).",
+            "sim": "The simulator of this run, e.g. verilator. Default to SIM of the Makefile.",
+            "profile": "Profile the Python side of the test with sim_profile.py.",
+            "vectors": f"Run the vectors of a vector file, e.g. {VECTOR_FILE} written by gen-vectors.",
+            "seed": "The random seed (COCOTB_RANDOM_SEED). Default to a new one, which all the shards and the "
+                    "rerun of a failure share, so that they generate the same random vectors.",
+            "max-failures": "Stop each shard at this many mismatches. Default to checking all the vectors.",
+            "resume": "Go on from the checkpoints of an interrupted run with the same --jobs and build. Its seed is "
+                      "reused, the DUT is reset and the vectors checked before are skipped."})
+def run(c, jobs=1, waves="on-fail", sim="", profile=False, vectors="", seed=0, max_failures=0, resume=False):
     """Run the test."""
-    c.run("rm -f results.xml")
-    c.run("make -f Makefile results.xml")
+    if waves not in WAVES_MODES:
+        raise Exit(f"Unknown waveform mode {waves}. Use one of {', '.join(WAVES_MODES)}.", code=1)
+    if waves == "window" and "WAVES_WINDOW" not in Path("Makefile").read_text():
+        raise Exit("The Makefile has no WAVES_WINDOW block to switch the dumping. Copy it from the project template.", code=1)
+    sim_vars = {"SIM": sim} if sim else {}
+    make_vars = {**WAVES_MODES[waves], **sim_vars}
+    profile_vars = profile_env() if profile else {}
+    if resume:
+        seed = seed or resume_seed(jobs)
+    else:
+        for fn in checkpoint_files(jobs):
+            fn.unlink(missing_ok=True)
+    test_vars = {**vector_env(vectors), "COCOTB_RANDOM_SEED": random_seed(seed), **({"RESUME": "1"} if resume else {})}
+    if max_failures:
+        test_vars["MAX_FAILURES"] = str(max_failures)
+    print(f"Random seed: {test_vars['COCOTB_RANDOM_SEED']}")
+    Path(RESULTS_FILE).unlink(missing_ok=True)
+    if jobs <= 1:
+        start = time.perf_counter()
+        result = build_and_run(c, SIM_BUILD, RESULTS_FILE, env={**test_vars, **profile_vars}, **make_vars)
+        show_session(SIM_BUILD, time.perf_counter() - start)
+        if profile:
+            show_profile(SIM_BUILD)
+        coverage_file = Path(SIM_BUILD) / COVERAGE_FILE
+        if coverage_file.is_file():
+            merge_coverage([coverage_file], coverage_file)
+        if not result.ok:
+            if waves == "on-fail":
+                rerun_with_waves(c, SIM_BUILD, env=test_vars, **sim_vars)
+            raise Exit("The test failed.", code=1)
+        return
+
+    # Each shard has its own build folder and results file. The test gets its shard from the environment.
+    # The image is built once into the build folder and stored in the build cache, so that the shards restore
+    # it instead of all compiling it at the same time. An image which dumps into its own folder is built by each.
+    build_image(c, SIM_BUILD, **make_vars)
+    result_files = []
+    promises = []
+    for i in range(jobs):
+        build_dir = Path(SIM_BUILD) / f"shard_{i}"
+        result_file = (build_dir / "results.xml").absolute()
+        result_file.unlink(missing_ok=True)
+        result_files.append(result_file)
+        key = prepare_build(c, build_dir, **make_vars)
+        clear_test_records(build_dir)
+        cmd = make_command(result_file, SIM_BUILD=build_dir, COCOTB_RESULTS_FILE=result_file, **make_vars)
+        env = {"SHARD_INDEX": str(i), "SHARD_COUNT": str(jobs), **test_vars}
+        promises.append((build_dir, key, env, c.run(cmd, env={**env, **profile_vars, "BUILD_KEY": key}, asynchronous=True, warn=True, hide=True)))
+    failed_shards = []
+    for i, (build_dir, key, env, promise) in enumerate(promises):
+        result = promise.join()
+        log_file = build_dir / "run.log"
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        log_file.write_text(result.stdout + result.stderr)
+        if result_files[i].is_file():
+            store_build(build_dir, key)
+        if not result.ok:
+            failed_shards.append((build_dir, env))
+        print(f"Shard {i}: {'done' if result.ok else 'FAILED'}, log in {log_file}")
+        if profile:
+            show_profile(build_dir)
+
+    failures = merge_results(result_files, RESULTS_FILE)
+    coverage_files = [fn.parent / COVERAGE_FILE for fn in result_files if (fn.parent / COVERAGE_FILE).is_file()]
+    clear_test_records(SIM_BUILD)
+    if coverage_files:
+        merge_coverage(coverage_files, Path(SIM_BUILD) / COVERAGE_FILE)
+    if failures:
+        if waves == "on-fail" and failed_shards:
+            rerun_with_waves(c, *failed_shards[0], **sim_vars)
+        raise Exit(f"{failures} test(s) failed. See {RESULTS_FILE}.", code=1)
+    print(f"All {jobs} shards passed.")
+
+def merge_coverage(files, output):
+    """Sum the coverage files into output and print the report."""
+    sys.path.insert(0, str(Path.cwd()))
+    try:
+        from sim_utils import merge_coverage_files, write_coverage_file, coverage_report
+    except ImportError:
+        raise Exit("Merging the coverage needs sim_utils.py in the project folder.", code=1)
+    try:
+        runs, items, counts = merge_coverage_files([str(fn) for fn in files])
+    except ValueError as e:
+        raise Exit(str(e), code=1)
+    write_coverage_file(output, runs, items, counts)
+    print(coverage_report(runs, items, counts))
+    print(f"{len(files)} coverage files merged into {output}." if len(files) > 1 else f"Coverage file: {output}")
+
+@task(help={"files": "The coverage files to merge, as glob patterns separated by spaces. "
+                     f"Default to {SIM_BUILD}/{COVERAGE_FILE}, which `run` writes, also with --jobs.",
+            "output": "The merged coverage file."})
+def coverage_merge(c, files="", output=COVERAGE_FILE):
+    """Merge the functional coverage files of many runs and print the coverage report."""
+    patterns = files.split() or [f"{SIM_BUILD}/{COVERAGE_FILE}"]
+    paths = sorted({fn for pattern in patterns for fn in glob.glob(pattern, recursive=True) if Path(fn).is_file()})
+    if not paths:
+        raise Exit(f"No coverage file matches {' '.join(patterns)}.", code=1)
+    merge_coverage(paths, output)
+
+def parse_grid(grid):
+    """Parse a parameter grid like "N=4,8 DEPTH=2,4" into its configurations, each a dict of parameter values."""
+    parameters = (makefile_var("PARAMETERS") or "").split()
+    axes = []
+    for item in grid.split():
+        name, _, values = item.partition("=")
+        if name not in parameters or not values:
+            raise Exit(f"Bad parameter {item} of the grid. Use NAME=VALUE,VALUE,... with NAME one of "
+                       f"PARAMETERS of the Makefile: {' '.join(parameters) or '(none)'}.", code=1)
+        axes.append([(name, value) for value in values.split(",")])
+    return [dict(config) for config in itertools.product(*axes)]
+
+def config_name(config):
+    """The name of the build folder of a configuration, e.g. N8-DEPTH2."""
+    return "-".join(f"{name}{value}" for name, value in config.items()) or "default"
+
+def sweep_result(config, build_dir, result_file, cached):
+    """Read the results of a configuration. Return them as a dict."""
+    result = {**config, "config": config_name(config), "passed": False, "tests": 0, "failures": 0,
+              "test_s": 0.0, "vectors_per_s": 0.0, "cycles_per_s": 0.0, "build": "cached" if cached else "new"}
+    if not Path(result_file).is_file():
+        return result
+    testcases = list(ET.parse(result_file).getroot().iter("testcase"))
+    result["tests"] = len(testcases)
+    result["failures"] = sum(1 for t in testcases if t.find("failure") is not None or t.find("error") is not None)
+    result["passed"] = not result["failures"]
+    # The tests' own time excludes the start of the simulator and of Python.
+    result["test_s"] = test_time = sum(float(t.get("time", 0)) for t in testcases)
+    bench_file = Path(build_dir) / BENCH_FILE
+    counts = json.loads(bench_file.read_text()) if bench_file.is_file() else {}
+    for name in ("vectors", "cycles"):
+        result[f"{name}_per_s"] = counts.get(name, 0) / test_time if test_time else 0.0
+    return result
+
+@task(help={"grid": "The values of the parameters, e.g. \"N=4,8,16 DEPTH=2,4\". Each combination is a configuration. "
+                    "The names are PARAMETERS of the Makefile.",
+            "jobs": "The number of configurations run at once. Default to the CPU cores.",
+            "sim": "The simulator of this run, e.g. verilator. Default to SIM of the Makefile.",
+            "seed": "The random seed of all the configurations. Default to a new one.",
+            "tests": "Run only the tests whose names match this regular expression (COCOTB_TEST_FILTER)."})
+def sweep(c, grid="", jobs=0, sim="", seed=0, tests=""):
+    """Build and run every configuration of a parameter grid, then show the results of all of them."""
+    configs = parse_grid(grid)
+    sim_vars = {"SIM": sim} if sim else {}
+    make_vars = {**WAVES_MODES["off"], **sim_vars}
+    test_vars = {"COCOTB_RANDOM_SEED": random_seed(seed), **({"COCOTB_TEST_FILTER": tests} if tests else {})}
+    print(f"Random seed: {test_vars['COCOTB_RANDOM_SEED']}")
+    jobs = jobs or os.cpu_count() or 1
+
+    # Each configuration has its own build folder, and its image in the build cache. The builds are prepared
+    # one by one, because they may share entries of the build cache, then run `jobs` at a time.
+    results = []
+    running = deque()
+
+    def finish():
+        config, build_dir, result_file, key, cached, promise = running.popleft()
+        result = promise.join()
+        (build_dir / "run.log").write_text(result.stdout + result.stderr)
+        if result_file.is_file():
+            store_build(build_dir, key)
+        results.append(sweep_result(config, build_dir, result_file, cached))
+        print(f"{config_name(config)}: {'passed' if results[-1]['passed'] else 'FAILED'}, log in {build_dir / 'run.log'}")
+
+    for config in configs:
+        if len(running) >= jobs:
+            finish()
+        build_dir = Path(SIM_BUILD) / SWEEP_BUILD / config_name(config)
+        result_file = (build_dir / "results.xml").absolute()
+        result_file.unlink(missing_ok=True)
+        key = prepare_build(c, build_dir, **make_vars, **config)
+        stamp = build_dir / BUILD_STAMP
+        cached = stamp.is_file() and stamp.read_text() == key
+        clear_test_records(build_dir)
+        build_dir.mkdir(parents=True, exist_ok=True)
+        cmd = make_command(result_file, SIM_BUILD=build_dir, COCOTB_RESULTS_FILE=result_file, **make_vars, **config)
+        promise = c.run(cmd, env=test_vars, asynchronous=True, warn=True, hide=True)
+        running.append((config, build_dir, result_file, key, cached, promise))
+    while running:
+        finish()
+
+    lines = [f"{'Configuration':32} {'Result':6} {'Tests':>5} {'Test (s)':>9} {'Vectors/s':>10} {'Cycles/s':>10} {'Build':>6}"]
+    for r in results:
+        lines.append(f"{r['config']:32} {'PASS' if r['passed'] else 'FAIL':6} {r['tests']:5} {r['test_s']:9.2f} "
+                     f"{r['vectors_per_s']:10.0f} {r['cycles_per_s']:10.0f} {r['build']:>6}")
+    print("\n".join(lines))
+    report = Path(SIM_BUILD) / SWEEP_BUILD / SWEEP_REPORT
+    report.write_text(json.dumps({"seed": test_vars["COCOTB_RANDOM_SEED"], "results": results}, indent=2) + "\n")
+    # The CSV summaries of the monitors hold their configuration, so they are concatenated into one table.
+    csv_files = [fn for fn in (Path(SIM_BUILD) / SWEEP_BUILD / r["config"] / METRICS_FILES[1] for r in results) if fn.is_file()]
+    if csv_files:
+        rows = [fn.read_text().splitlines() for fn in csv_files]
+        metrics = Path(SIM_BUILD) / SWEEP_BUILD / METRICS_FILES[1]
+        metrics.write_text("\n".join(rows[0][:1] + [line for lines in rows for line in lines[1:]]) + "\n")
+        print(f"The metrics of the configurations are in {metrics}.")
+    failed = sum(1 for r in results if not r["passed"])
+    if failed:
+        raise Exit(f"{failed} of {len(results)} configurations failed. See {report}.", code=1)
+    print(f"All {len(results)} configurations passed. See {report}.")
+
+@task(help={"output": "The vector file to write.",
+            "width": "The width of the operands.",
+            "start": "The index of the first vector of the file.",
+            "stop": "The index after the last vector of the file. Default to all vectors."})
+def gen_vectors(c, output=VECTOR_FILE, width=8, start=0, stop=-1):
+    """Write the vectors of vector_source() of the test module and their expected outputs into a vector file."""
+    sys.path.insert(0, str(Path.cwd()))
+    module_name = makefile_var("COCOTB_TEST_MODULES") or makefile_var("MODULE", "test_proc")
+    source = getattr(importlib.import_module(module_name), "vector_source", None)
+    if source is None:
+        raise Exit(f"{module_name}.py has no vector_source() to generate the vectors.", code=1)
+    from vector_file import write_vector_file
+    inputs, outputs, blocks = source(width, start, None if stop < 0 else stop)
+    count = write_vector_file(output, inputs, outputs, blocks, start=start)
+    print(f"{count} vectors written to {output}. Run them with `invoke run --vectors {output}`.")
+
+def latest_waveform(*suffixes):
+    """The latest waveform of the top level with one of the suffixes in the build folder, or None.
+
+    It may be dumped by a shard or by the rerun of a failure.
+    """
+    toplevel = makefile_var("TOPLEVEL", "dut")
+    dumps = [fn for suffix in suffixes for fn in Path(SIM_BUILD).rglob(f"{toplevel}{suffix}")]
+    return max(dumps, key=lambda fn: fn.stat().st_mtime, default=None)
+
+@task(help={"file": f"The VCD or FST file. Default to the latest waveform of the top level in {SIM_BUILD}.",
+            "signals": "The signals whose value changes are printed, separated by spaces. A signal is a "
+                       "hierarchical path like top.dut.grant or a suffix of it like grant.",
+            "start": "The start of the time window, in the time unit of the dump or with a unit, e.g. 1.5us.",
+            "end": "The end of the time window. Default to the end of the dump.",
+            "toggles": "Count the value changes and the bit toggles of the signals instead of printing them.",
+            "when": "Find the first time at which a Python expression of the signals holds, e.g. \"popcount(grant) > 1\".",
+            "output": "Write the value changes to this CSV file instead of printing them."})
+def wave_query(c, file="", signals="", start="", end="", toggles=False, when="", output=""):
+    """Query a waveform dump by streaming it, without loading it into memory."""
+    sys.path.insert(0, str(Path.cwd()))
+    try:
+        from wave_query import WaveStream, Condition
+    except ImportError:
+        raise Exit("Querying the waveform needs wave_query.py in the project folder.", code=1)
+    path = Path(file) if file else latest_waveform(".fst", ".vcd", ".vcd.gz")
+    if path is None or not path.is_file():
+        raise Exit(f"No waveform {file or f'found in {SIM_BUILD}'}. Run the test with --waves always or window.", code=1)
+    if not signals and not when:
+        raise Exit("Give the --signals to print or count, or a --when condition.", code=1)
+    try:
+        wave = WaveStream(path)
+    except (FileNotFoundError, ValueError) as e:
+        raise Exit(str(e), code=1)
+    with wave:
+        try:
+            selected = wave.resolve(signals.split())
+            condition = Condition(wave, when) if when else None
+            window = (wave.parse_time(start) or 0, wave.parse_time(end))
+        except (KeyError, ValueError, SyntaxError) as e:
+            raise Exit(e.args[0], code=1)
+        unit = wave.time_unit()
+        print(f"{path}: {len(wave.signals)} signals, time unit {unit}.", file=sys.stderr)
+        write = None
+        out = None
+        if selected and not toggles:
+            out = open(output, "w") if output else sys.stdout
+            out.write("time,signal,value\n")
+            write = lambda time, signal, value: out.write(f"{time},{signal.path},{value}\n")
+        try:
+            result = wave.scan(selected, *window, write=write, condition=condition, toggles=toggles)
+        finally:
+            if output and out is not None:
+                out.close()
+    if toggles:
+        width = max(len("Signal"), *(len(name) for name in result["toggles"]))
+        print(f"{'Signal':<{width}}  {'Changes':>12}  {'Bit toggles':>12}")
+        for name, (changes, bit_toggles) in result["toggles"].items():
+            print(f"{name:<{width}}  {changes:12}  {bit_toggles:12}")
+    if output:
+        print(f"Value changes written to {output}.")
+    if condition is not None:
+        if result["first"] is None:
+            print(f"{when} never holds in the window.")
+        else:
+            time, values = result["first"]
+            print(f"{when} first holds at {time} {unit}: " + ", ".join(f"{name}={value}" for name, value in values.items()))
+
+@task(help={"file": f"The VCD or FST file. Default to the latest waveform of the top level in {SIM_BUILD}.",
+            "signals": "Print the values of these signals at the time of --at, separated by spaces.",
+            "at": "The time of the values, in the time unit of the dump or with a unit, e.g. 1.5us.",
+            "force": "Convert the dump again even if its store is up to date."})
+def wave_store(c, file="", signals="", at="", force=False):
+    """Convert a waveform dump into a columnar store for quick queries, see wave_store.py."""
+    sys.path.insert(0, str(Path.cwd()))
+    try:
+        from wave_store import WaveStore, convert, store_folder, is_up_to_date
+    except ImportError:
+        raise Exit("The waveform store needs wave_store.py and wave_query.py in the project folder.", code=1)
+    path = Path(file) if file else latest_waveform(".fst", ".vcd", ".vcd.gz")
+    if path is None or not path.is_file():
+        raise Exit(f"No waveform {file or f'found in {SIM_BUILD}'}. Run the test with --waves always or window.", code=1)
+    folder = store_folder(path)
+    if force or not is_up_to_date(path, folder):
+        start = time.perf_counter()
+        try:
+            convert(path, folder)
+        except (FileNotFoundError, ValueError) as e:
+            raise Exit(str(e), code=1)
+        size = sum(fn.stat().st_size for fn in folder.iterdir())
+        print(f"{path} converted into {folder} ({size / 2**20:.1f} MiB) in {time.perf_counter() - start:.1f} s.")
+    store = WaveStore(folder)
+    print(f"{folder}: {len(store.signals)} signals, {len(store.times)} time steps, time unit {store.time_unit()}.")
+    if signals:
+        try:
+            for name in signals.split():
+                value = store.value_at(name, at or 0)
+                print(f"{name} = {'x' if value is None else hex(value)} at {at or 0}")
+        except (KeyError, ValueError) as e:
+            raise Exit(e.args[0], code=1)
 
 @task(help={"args": "Additional arguments for waveform viewer"})
 def waveform(c, args=""):
@@ -30,11 +700,15 @@ def waveform(c, args=""):
         print("No waveform viewer found (tried: " + ", ".join(tools.keys()) + ")")
         return
     cmd = found_tools[0]
-    tool_args = tools[cmd].format(fst_file='sim_build/top.fst')
+    fst_file = latest_waveform(".fst")
+    if fst_file is None:
+        print(f"No waveform found in {SIM_BUILD}. Run the test with --waves always or window.")
+        return
+    tool_args = tools[cmd].format(fst_file=fst_file)
     cmd_line = ' '.join([cmd, tool_args, args])
     c.run(cmd_line)
 
 if __name__ == "__main__":
     namespace = Collection.from_module(sys.modules[__name__])
     program = Program(namespace=namespace, version="0.1.0")
-    program.run()
\ No newline at end of file
+    program.run()
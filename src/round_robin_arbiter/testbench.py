@@ -1,36 +1,101 @@
 #!/usr/bin/env python
+import os
 import random
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import ClockCycles
+from cocotb.triggers import ClockCycles, FallingEdge
+from arbiter_model import QueueArbiterModel
+from arbiter_monitor import ArbiterMonitor
+from sim_utils import record_bench, session_test, signal_reader
 
-def count_ones(n):
-    """Helper function to count the number of set bits in an integer."""
-    count = 0
-    n = int(n)
-    while n:
-        count += n & 1
-        n >>= 1
-    return count
+# The clock cycles of test_stress. Override it with the +stress_cycles plusarg or the STRESS_CYCLES environment variable.
+STRESS_CYCLES = 200_000
 
-@cocotb.test()
-async def run_test(dut):
-    """Testbench for round robin arbiter with request queue."""
-    dut._log.info("Starting test...")
-    dut._log.info('Dut: ' + ', '.join(filter(lambda x: not x.startswith('_'), dir(dut))))
+# test_stress changes the request rate of the requesters every PHASE_CYCLES clocks.
+PHASE_CYCLES = 4096
+
+# The clock cycles of each test_burst.
+BURST_CYCLES = 2000
 
-    # Initialize inputs
+async def reset(dut):
+    """Start the clock and reset the DUT."""
     dut.req.value = 0
     dut.clk.value = 0
     dut.rst_n.value = 0
-
-    # Start clock
     Clock(dut.clk, 1, unit="us").start()
-
-    # Wait for reset deassertion
     await ClockCycles(dut.clk, 5)
     dut.rst_n.value = 1
 
+def arbiter_model(dut):
+    """The model of the configuration of the DUT, in its reset state."""
+    return QueueArbiterModel(int(dut.N.value), int(dut.DEPTH.value), int(dut.QUICK_POP.value))
+
+async def run_lockstep(dut, model, traffic, cycles):
+    """Run the DUT and the model in lock-step. Return the number of grants.
+
+    In the falling edge of every clock, grant is checked against the model, then traffic(req, grant) gives the
+    request of the next clock, which the model clocks in as the DUT will at the next rising edge. The request
+    is only written when it changes.
+    """
+    falling = FallingEdge(dut.clk)
+    read_grant = signal_reader(dut.grant)
+    n = model.n
+    req = grants = 0
+    for cycle in range(cycles):
+        await falling
+        grant = int(read_grant(), 2)
+        expected = model.grant(req)
+        assert grant == expected, \
+            f"Clock {cycle}: grant={grant:0{n}b} != model {expected:0{n}b}, req={req:0{n}b}, queue={[f'{entry:0{n}b}' for entry in model.queue]}"
+        assert grant & (grant - 1) == 0, f"Clock {cycle}: multiple grants {grant:0{n}b} for req={req:0{n}b}"
+        grants += grant != 0
+        next_req = traffic(req, grant)
+        if next_req != req:
+            dut.req.value = next_req
+            req = next_req
+        model.clock(req)
+    return grants
+
+class RandomTraffic:
+    """Requesters which raise a request at random, hold it until it is granted and release it some clocks
+    later. A waiting requester sometimes gives up. All of them are drawn at once as bit masks, so a clock
+    costs a few getrandbits() calls whatever N is.
+
+    The chance of a new request is 2**-k per clock, with k drawn again every PHASE_CYCLES clocks, so the
+    load goes from light to saturated and the request queue both drains and fills up. With arrive=k, the
+    chance stays 2**-k.
+    """
+    def __init__(self, n, rng, arrive=None):
+        self.n = n
+        self.rng = rng
+        self.cycle = 0
+        self.fixed = arrive is not None
+        self.arrive = arrive or 1
+
+    def chance(self, k):
+        """A mask whose bits are set with a chance of 2**-k each."""
+        bits = self.rng.getrandbits
+        mask = bits(self.n)
+        for _ in range(k - 1):
+            mask &= bits(self.n)
+        return mask
+
+    def __call__(self, req, grant):
+        if not self.fixed and self.cycle % PHASE_CYCLES == 0:
+            self.arrive = self.rng.randint(1, 4)
+        self.cycle += 1
+        release = grant & self.chance(1)
+        give_up = req & ~grant & self.chance(6)
+        return (req & ~release & ~give_up) | (~req & self.chance(self.arrive))
+
+@cocotb.test()
+@session_test(setup=reset)
+async def run_test(dut):
+    """Testbench for round robin arbiter with request queue."""
+    dut._log.info("Starting test...")
+    dut._log.info('Dut: ' + ', '.join(filter(lambda x: not x.startswith('_'), dir(dut))))
+    model = arbiter_model(dut)
+
     # Test sequence
     request_sequences = [
         # (idx, request, ticks)
@@ -57,11 +122,50 @@ async def run_test(dut):
         (20, 0b0100, 4),
         (21, 0b0000, 4),
     ]
+    steps = iter([(i, req & model.mask) for i, req, ticks in request_sequences for _ in range(ticks)])
 
-    for i, req, ticks in request_sequences:
+    def directed(req, grant):
+        i, req = next(steps, (len(request_sequences), 0))
         dut.dbg_idx.value = i
-        dut.req.value = req
-        await ClockCycles(dut.clk, ticks)
-        assert count_ones(dut.grant.value) <= 1, f"Multiple grants detected for i={i}, req={req:04b}, grant={dut.grant.value:04b}"
+        return req
+
+    # The grants are checked against the model on every clock, one more than the sequence for its last request.
+    cycles = sum(ticks for _, _, ticks in request_sequences)
+    await run_lockstep(dut, model, directed, cycles + 1)
+
+    # Count the vectors and clock cycles for `invoke bench`.
+    record_bench(vectors=len(request_sequences), cycles=5 + cycles)
+
+    dut._log.info("Test completed.")
+
+@cocotb.test()
+@session_test(setup=reset)
+async def test_stress(dut):
+    """Random request traffic for STRESS_CYCLES clocks, checked against the model on every clock."""
+    model = arbiter_model(dut)
+    cycles = int(cocotb.plusargs.get("stress_cycles", os.environ.get("STRESS_CYCLES", STRESS_CYCLES)))
+    dut._log.info(f"N={model.n}, DEPTH={model.depth}, QUICK_POP={model.quick_pop}, {cycles} clocks.")
+    traffic = RandomTraffic(model.n, random.Random(cocotb.RANDOM_SEED))
+    monitor = ArbiterMonitor(dut)
+    monitor.start()
+    grants = await run_lockstep(dut, model, traffic, cycles)
+    monitor.stop()
+    record_bench(vectors=cycles, cycles=5 + cycles)
+    dut._log.info(f"{grants} grants in {cycles} clocks match the model.")
+    metrics = monitor.write()
+    dut._log.info(f"{metrics['grants_per_cycle']} grants per clock, fairness {metrics['fairness']}, worst wait "
+                  f"{metrics['worst_wait']} clocks, mean queue occupancy {metrics['queue_occupancy']['mean']}.")
+
+@cocotb.test()
+@cocotb.parametrize(arrive=(1, 2, 3, 4))
+@session_test(setup=reset)
+async def test_burst(dut, arrive):
+    """Random request traffic at one load for BURST_CYCLES clocks, a short test from reset for each load.
 
-    dut._log.info("Test completed.")
\ No newline at end of file
+    A requester raises a new request with a chance of 2**-arrive per clock, so arrive=1 saturates the arbiter.
+    """
+    model = arbiter_model(dut)
+    traffic = RandomTraffic(model.n, random.Random(cocotb.RANDOM_SEED + arrive), arrive=arrive)
+    grants = await run_lockstep(dut, model, traffic, BURST_CYCLES)
+    record_bench(vectors=BURST_CYCLES, cycles=5 + BURST_CYCLES)
+    dut._log.info(f"{grants} grants in {BURST_CYCLES} clocks match the model.")
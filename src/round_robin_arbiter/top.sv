@@ -1,4 +1,4 @@
-module top #(parameter int N = 4, parameter int DEPTH = 4) (
+module top #(parameter int N = 4, parameter int DEPTH = 4, parameter int QUICK_POP = 1) (
     input logic rst_n,
     input logic clk,
     input logic [N-1:0] req,
@@ -10,7 +10,7 @@ module top #(parameter int N = 4, parameter int DEPTH = 4) (
     input reg dbg2,
     input reg dbg3
 );
-    round_robin_queue_arbiter #(.N(N), .DEPTH(DEPTH)) dut (
+    round_robin_queue_arbiter #(.N(N), .DEPTH(DEPTH), .QUICK_POP(QUICK_POP)) dut (
         .rst_n(rst_n),
         .clk(clk),
         .req(req),
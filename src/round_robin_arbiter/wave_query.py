@@ -0,0 +1,293 @@
+#!python
+# coding: utf-8
+
+"""Queries of VCD and FST waveform dumps which stream the dump instead of loading it. `invoke wave-query` uses it.
+
+The waveform viewers load a whole dump, which takes minutes and gigabytes for a long run. Here the dump is read
+line by line, and only the current values of the queried signals are kept, so the memory stays the same for
+any size of dump. The reading stops at the end of the time window, so a query near the start of a dump is
+quick. An FST file is converted to VCD text on the fly by fst2vcd of GTKWave through a pipe, and a .vcd.gz
+file is decompressed on the fly.
+
+A signal is named by its hierarchical path, e.g. top.dut.grant, or by any dotted suffix of it, e.g. grant,
+which selects the shallowest signal with that suffix.
+
+The queries, all done in one pass over the time window:
+- The value changes of the signals, from their values at the start of the window.
+- The number of value changes and bit toggles of each signal.
+- The first time at which a condition holds, e.g. "popcount(grant) > 1". The condition is a Python expression
+  of the signals, as integers, and the functions of CONDITION_FUNCTIONS. It is checked at the end of every
+  time step in which any of its signals changed. A signal with x or z bits is None, and the condition
+  doesn't hold while it can't be computed.
+
+Usage:
+    with WaveStream("sim_build/top.fst") as wave:
+        result = wave.scan(wave.resolve(["req", "grant"]), start=0, end=10**6,
+                           condition=Condition(wave, "popcount(grant) > 1"), toggles=True)
+"""
+
+import builtins
+import gzip
+import re
+import shutil
+import subprocess
+from collections import namedtuple
+
+# A signal of the dump. Signals with the same code are aliases, which always have the same value.
+Signal = namedtuple("Signal", "path code width")
+
+# The time units of the timescale of a dump, in fs.
+TIME_UNITS = {"s": 10**15, "ms": 10**12, "us": 10**9, "ns": 10**6, "ps": 10**3, "fs": 1}
+
+def popcount(value):
+    return bin(value).count("1")
+
+# The functions which conditions can use besides the Python built-ins.
+CONDITION_FUNCTIONS = {
+    "popcount": popcount,
+    "onehot": lambda value: popcount(value) == 1,           # Exactly one bit set.
+    "onehot0": lambda value: popcount(value) <= 1,          # At most one bit set.
+    "bit": lambda value, i: value >> i & 1,
+}
+
+# The Python keywords which can appear in a condition.
+KEYWORDS = ("and", "or", "not", "in", "is", "if", "else")
+
+def to_int(value):
+    """The integer of a binary VCD value, or None if it has x or z bits."""
+    try:
+        return int(value, 2)
+    except ValueError:
+        return None
+
+def time_unit(timescale):
+    """The time unit of a dump of a (number, unit) timescale, e.g. ps or 10ns."""
+    number, unit = timescale
+    return f"{number}{unit}" if number != 1 else unit
+
+def parse_time(text, timescale):
+    """The time of a text in the units of a dump, e.g. 1500 or "1.5us". None for an empty text."""
+    if text is None or text == "":
+        return None
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-z]*)\s*", str(text))
+    if not match:
+        raise ValueError(f"Bad time {text}. Give a number of {time_unit(timescale)}, or a number and a unit like 1.5us.")
+    number, unit = match.groups()
+    if not unit:
+        return int(number)
+    if unit not in TIME_UNITS:
+        raise ValueError(f"Bad unit {unit} of time {text}. Use one of {', '.join(TIME_UNITS)}.")
+    return round(float(number) * TIME_UNITS[unit] / (timescale[0] * TIME_UNITS[timescale[1]]))
+
+def resolve_signals(signals, names, source):
+    """The signals of the names from the signals of a dump, a dict of path -> Signal. A name is a path, or a
+    dotted suffix of paths, which selects the shallowest of them."""
+    resolved = []
+    for name in names:
+        signal = signals.get(name)
+        if signal is None:
+            matches = [s for path, s in signals.items() if path.endswith("." + name)]
+            if not matches:
+                raise KeyError(f"No signal {name} in {source}.")
+            signal = min(matches, key=lambda s: (s.path.count("."), s.path))
+        resolved.append(signal)
+    return resolved
+
+class WaveStream:
+    """A VCD or FST dump whose header has been read. The value changes are read by scan(), once."""
+    def __init__(self, path):
+        self.path = str(path)
+        self._process = None
+        if self.path.endswith(".fst"):
+            if not shutil.which("fst2vcd"):
+                raise FileNotFoundError("Reading an FST file needs fst2vcd of GTKWave. Install GTKWave, or dump VCD.")
+            self._process = subprocess.Popen(["fst2vcd", "-f", self.path], stdout=subprocess.PIPE, text=True, errors="replace")
+            self._file = self._process.stdout
+        elif self.path.endswith(".gz"):
+            self._file = gzip.open(self.path, "rt", errors="replace")
+        else:
+            self._file = open(self.path, errors="replace")
+        self.signals = {}                       # path -> Signal
+        self.timescale = (1, "s")
+        self._read_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        if self._process is not None:
+            # The query may stop before the end of the dump.
+            self._process.kill()
+            self._process.wait()
+
+    def _header_tokens(self):
+        for line in self._file:
+            yield from line.split()
+
+    def _read_header(self):
+        tokens = self._header_tokens()
+        scopes = []
+        for token in tokens:
+            if token == "$enddefinitions":
+                next(tokens, None)
+                return
+            if token == "$scope":
+                _, name = next(tokens), next(tokens)
+                scopes.append(name)
+            elif token == "$upscope":
+                scopes.pop()
+            elif token == "$var":
+                _, width, code, name = next(tokens), next(tokens), next(tokens), next(tokens)
+                path = ".".join(scopes + [name])
+                self.signals[path] = Signal(path, code, int(width))
+            elif token == "$timescale":
+                text = ""
+                for token in tokens:
+                    if token == "$end":
+                        break
+                    text += token
+                number, unit = re.fullmatch(r"(\d+)\s*([a-z]+)", text).groups()
+                self.timescale = (int(number), unit)
+                continue
+            else:
+                continue
+            # Skip the rest of the declaration, e.g. the bit range of a $var.
+            for token in tokens:
+                if token == "$end":
+                    break
+        raise ValueError(f"{self.path} has no $enddefinitions. Is it a VCD file?")
+
+    def resolve(self, names):
+        """The signals of the names, each a path or a dotted suffix of a path."""
+        return resolve_signals(self.signals, names, self.path)
+
+    def parse_time(self, text):
+        """The time of a text in the units of the dump, e.g. 1500 or "1.5us"."""
+        return parse_time(text, self.timescale)
+
+    def time_unit(self):
+        return time_unit(self.timescale)
+
+    def steps(self, signals, start=0, end=None):
+        """Iterate over the time steps of the window in which the signals changed, as (time, changed), where
+        changed holds the indexes of the changed signals. The current values, as VCD strings, are in
+        self.values. The first step is the start of the window, with all the signals.
+        """
+        index = {}
+        for i, signal in enumerate(signals):
+            index.setdefault(signal.code, []).append(i)
+        values = self.values = ["x"] * len(signals)
+        changed = set()
+        started = False
+        time = 0
+        for line in self._file:
+            head = line[:1]
+            if head == "#":
+                t = int(line[1:])
+                if started:
+                    if changed:
+                        yield time, sorted(changed)
+                        changed = set()
+                elif t > start:
+                    started = True
+                    yield start, list(range(len(signals)))
+                    changed = set()
+                if end is not None and t > end:
+                    return
+                time = t
+                continue
+            if head in "bBrR":
+                value, _, code = line[1:].partition(" ")
+                code = code.strip()
+            elif head in "01xzXZ":
+                value, code = head, line[1:].strip()
+            else:
+                # $dumpvars, $end, $comment and empty lines.
+                continue
+            positions = index.get(code)
+            if positions:
+                for i in positions:
+                    values[i] = value
+                    changed.add(i)
+        if not started:
+            yield start, list(range(len(signals)))
+        elif changed:
+            yield time, sorted(changed)
+
+    def scan(self, signals, start=0, end=None, write=None, condition=None, toggles=False):
+        """Run the queries over the window in one pass. Return a dict of the results.
+
+        write(time, signal, value):  Called with every value change of the signals, the values at start first.
+        condition:                   A Condition to find the first time it holds. Without write and toggles,
+                                     the scan stops there.
+        toggles:                     Count the value changes and the bit toggles of each signal.
+        """
+        signals = list(signals)
+        queried = len(signals)
+        # The signals of the condition are read along with the queried ones, which come first.
+        arguments = []
+        if condition is not None:
+            for signal in condition.signals:
+                if signal not in signals:
+                    signals.append(signal)
+                arguments.append(signals.index(signal))
+        watched = set(arguments)
+        changes = [0] * queried
+        bit_toggles = [0] * queried
+        last = [None] * queried
+        result = {"first": None}
+        first_step = True
+        for time, changed in self.steps(signals, start, end):
+            values = self.values
+            if write is not None:
+                for i in changed:
+                    if i < queried:
+                        write(time, signals[i], values[i])
+            if toggles:
+                for i in changed:
+                    if i < queried:
+                        value = to_int(values[i])
+                        if not first_step:
+                            changes[i] += 1
+                            if value is not None and last[i] is not None:
+                                bit_toggles[i] += popcount(value ^ last[i])
+                        last[i] = value
+            first_step = False
+            if condition is not None and result["first"] is None and not watched.isdisjoint(changed):
+                if condition([to_int(values[i]) for i in arguments]):
+                    result["first"] = (time, {s.path: values[i] for s, i in zip(condition.signals, arguments)})
+                    if write is None and not toggles:
+                        break
+        if toggles:
+            result["toggles"] = {signal.path: (changes[i], bit_toggles[i]) for i, signal in enumerate(signals[:queried])}
+        return result
+
+class Condition:
+    """A Python expression of the signals of a dump, e.g. "popcount(grant) > 1"."""
+    def __init__(self, wave, expression):
+        self.expression = expression
+        names = []
+
+        def replace(match):
+            name = match.group(0)
+            if name in CONDITION_FUNCTIONS or name in KEYWORDS or hasattr(builtins, name):
+                return name
+            if name not in names:
+                names.append(name)
+            return f"_v[{names.index(name)}]"
+
+        # Names are identifiers with dots, but not the attributes or the digits of a number.
+        source = re.sub(r"(?<![\w.])[A-Za-z_][\w$]*(?:\.[A-Za-z_][\w$]*)*", replace, expression)
+        self.signals = wave.resolve(names)
+        self._code = compile(source, "<condition>", "eval")
+
+    def __call__(self, values):
+        """Whether the condition holds for the values of its signals. False if it can't be computed."""
+        try:
+            return bool(eval(self._code, {"__builtins__": builtins, **CONDITION_FUNCTIONS}, {"_v": values}))
+        except (TypeError, ValueError, ArithmeticError):
+            return False
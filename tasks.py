@@ -1,46 +1,42 @@
 #!python
 # coding: utf-8
 
+import json
+import platform
 import re
 import shutil
+import subprocess
 import sys
 import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from invoke import task, Program, Collection
-from textual import on
-from textual.app import App, ComposeResult
-from textual.widgets import Footer, Header, Input, Label, Button, Rule, Select, Checkbox, RichLog
-from textual.containers import HorizontalGroup, Grid, Center
-from textual.validation import Regex, Length, Validator, ValidationResult
-from rich.text import Text
+from invoke import task, Program, Collection, Exit
 from types import SimpleNamespace
 
 COCOTB_TEMPLATE = "./cocotb_template"
 
-CSS = """
-    Screen {
-        align: center middle;
-    }
+# The folder of the projects, and the build folder of `invoke regress`.
+PROJECTS_FOLDER = "./src"
+REGRESS_BUILD = "./regress_build"
 
-    Label {
-        padding: 1 1;
-    }
+# The throughput history of `invoke bench` and its build folder.
+BENCH_HISTORY = "./bench_history.json"
+BENCH_BUILD = "./bench_build"
+BENCH_HISTORY_VERSION = 1
 
-    Input.-valid {
-        border: tall $success 60%;
-    }
-    Input.-valid:focus {
-        border: tall $success;
-    }
+# The simulators which are benchmarked when they are installed: their compiler and the image built by cocotb.
+BENCH_SIMULATORS = {
+    "icarus": ("iverilog", "sim.vvp"),
+    "verilator": ("verilator", "Vtop"),
+}
 
-    .item_grid {
-        grid-size: 2;
-        grid-columns: 1fr 4fr;
-        width: 70%;
-        height: auto;
-        margin: 1 1;
-    }
-"""
+# A benchmark fails when one of these drops by more than the threshold below its baseline.
+BENCH_THROUGHPUT = ("vectors_per_s", "cycles_per_s")
+
+# Tests which run shorter than this (in seconds) are too noisy to be compared with the baseline.
+BENCH_MIN_TEST_TIME = 0.5
 
 SUPPORTED_SIMULATORS = [
     "icarus",
@@ -63,256 +59,369 @@ SUPPORTED_TOP_LANG = {
     "VHDL": "vhdl",
 }
 
-class FolderDontExistCheck(Validator):
-    """A validator for checking if the folder doesn't exist."""
-
-    def validate(self, value: str) -> ValidationResult:
-        """Check if the folder doesn't exist."""
-        folder = Path(value)
-        if folder.exists():
-            if folder.is_dir():
-                return self.failure("Folder already exists.")
-            else:
-                return self.failure("File with the same name already exists.")
-        return self.success()
-
-class FolderExistCheck(Validator):
-    """A validator for checking if the folder exist."""
-
-    def validate(self, value: str) -> ValidationResult:
-        """Check if the folder doesn't exist."""
-        folder = Path(value)
-        if folder.is_dir():
-            return self.success()
-        elif not folder.exists():
-            return self.failure("Folder doesn't exist.")
-        elif folder.is_file():
-            return self.failure("It's a file, not a folder.")
+# The files of the template which are formatted with the fields of the project. The others are copied.
+TEMPLATE_RENDERED = ("makefile", "dut.sv", "test_proc.py")
+
+# The styles of the messages of create_project.
+ERROR_STYLE = "magenta"
+INFO_STYLE = ""
+SUCCESS_STYLE = "green"
+
+def project_defaults():
+    """The fields of a project with their default values, as in the UI of create_project."""
+    return {
+        "project_name": "",
+        "parent_folder": str(Path.cwd() / "src") if (Path.cwd() / "src").is_dir() else str(Path.cwd()),
+        "dut_file": r"$(wildcard *.v) $(wildcard *.sv) $(wildcard *.vhdl)",
+        "dut_module": "dut",
+        "test_proc": "test_proc",
+        "toplevel_lang": "verilog",
+        "compile_args": "",
+        "simulator": SUPPORTED_SIMULATORS[0],
+        "sim_args": "",
+        "waves": 1,
+    }
+
+def check_project(ns, log):
+    """Check the fields of a project before it is created. Log the errors with log(message, style=...) and
+    return their number."""
+    # Pre-check the input values.
+    error_count = 0
+    if not Path(ns.parent_folder).exists():
+        log("Project folder don't exists.", style=ERROR_STYLE)
+        error_count += 1
+    if not re.match(r"^[a-zA-Z0-9_]+$", ns.project_name):
+        log("Project name is invalid.", style=ERROR_STYLE)
+        error_count += 1
+    if not re.match(r"^[a-zA-Z0-9_]+$", ns.dut_module):
+        log("DUT module name is invalid.", style=ERROR_STYLE)
+        error_count += 1
+    if not re.match(r"^[a-zA-Z0-9_]+$", ns.test_proc):
+        log("Test procedure name is invalid.", style=ERROR_STYLE)
+        error_count += 1
+    if ns.toplevel_lang not in SUPPORTED_TOP_LANG.values():
+        log(f"HW language {ns.toplevel_lang} is not one of {', '.join(SUPPORTED_TOP_LANG.values())}.", style=ERROR_STYLE)
+        error_count += 1
+    if ns.simulator not in SUPPORTED_SIMULATORS:
+        log(f"Simulator {ns.simulator} is not supported.", style=ERROR_STYLE)
+        error_count += 1
+    if error_count:
+        return error_count
+    # Pre-check the parameters.
+    if not Path(COCOTB_TEMPLATE).is_dir():
+        log(f"Folder {COCOTB_TEMPLATE} doesn't exist.", style=ERROR_STYLE)
+        error_count += 1
+    target_folder = project_folder(ns)
+    if Path(target_folder).exists():
+        log(f"Folder {target_folder} already exists.", style=ERROR_STYLE)
+        error_count += 1
+    return error_count
+
+def project_folder(ns):
+    return Path(".") / ns.parent_folder / ns.project_name
+
+def render_project(ns, log):
+    """Create the folder of a checked project and fill it from the template. Return the folder, or None."""
+    target_folder = project_folder(ns)
+    log("Creating project...", style=INFO_STYLE)
+
+    os.makedirs(target_folder)
+    if not Path(target_folder).is_dir():
+        log(f"Failed to create folder {target_folder}.", style=ERROR_STYLE)
+        return None
+    log(f"Created folder {target_folder}.", style=INFO_STYLE)
+
+    for fn in os.listdir(COCOTB_TEMPLATE):
+        if fn.lower() in TEMPLATE_RENDERED:
+            with open(Path(target_folder) / fn, "w") as f:
+                content = (Path(COCOTB_TEMPLATE) / fn).read_text()
+                f.write(content.format(**ns.__dict__))
+            log(f"Generated {fn} to {target_folder}", style=INFO_STYLE)
         else:
-            return self.failure("Unknown error.")
-
-
-class CreaterProjectUi(App):
-    CSS = CSS
-    BINDINGS = [("d", "toggle_dark", "Toggle dark mode"), ("q", "quit", "Quit")]
-
-    def compose(self) -> ComposeResult:
-        yield Header("Create Project")
-        yield Footer()
-        with Center():
-            with Grid(classes="item_grid"):
-                yield Label("Project Name:")
-                yield Input(
-                    placeholder="Project Name",
-                    id="project_name",
-                    tooltip="Enter the project name",
-                    validators=[
-                        Regex(
-                            r"^[a-zA-Z0-9_]+$",
-                            failure_description="Only alphanumeric characters and underscores are allowed.",
-                        ),
-                        Length(
-                            minimum=1,
-                            maximum=64,
-                            failure_description="Project name must be between 1 and 64 characters.",
-                        ),
-                        FolderDontExistCheck(),
-                    ],
-                )
-                yield Label("Parent Folder:")
-                yield Input(
-                    placeholder="Parent Folder",
-                    id="parent_folder",
-                    tooltip="Enter the parent folder",
-                    value = str(Path.cwd() / "src") if (Path.cwd() / "src").is_dir() else str(Path.cwd()),
-                    validators=[
-                        Regex(
-                            r"^[a-zA-Z0-9_ /]+$",
-                            failure_description="Only alphanumeric characters and underscores are allowed.",
-                        ),
-                        Length(
-                            minimum=1,
-                            maximum=1024,
-                            failure_description="Project folder must be between 1 and 1024 characters.",
-                        ),
-                        FolderExistCheck(),
-                    ],
-                )
-                yield Label("DUT File:")
-                yield Input(
-                    placeholder="DUT file.",
-                    value=r"$(wildcard *.v) $(wildcard *.sv) $(wildcard *.vhdl)",
-                    id="dut_file",
-                    tooltip="Enter the filename of DUT.",
-                )
-                yield Label("Test Proc:")
-                yield Input(
-                    placeholder="Test procedure name.",
-                    value="test_proc",
-                    id="test_proc",
-                    tooltip="Enter test procedure name.",
-                    validators=[
-                        Regex(
-                            r"^[a-zA-Z0-9_]+$",
-                            failure_description="Only alphanumeric characters and underscores are allowed.",
-                        ),
-                        Length(
-                            minimum=1,
-                            maximum=64,
-                            failure_description="Test procedure name must be between 1 and 64 characters.",
-                        ),
-                    ],
-                )
-                yield Label("DUT module:")
-                yield Input(
-                    placeholder="DUT top module.",
-                    value="dut",
-                    id="dut_module",
-                    tooltip="Enter the top module name of DUT.",
-                    validators=[
-                        Regex(
-                            r"^[a-zA-Z0-9_]+$",
-                            failure_description="Only alphanumeric characters and underscores are allowed.",
-                        ),
-                        Length(
-                            minimum=1,
-                            maximum=64,
-                            failure_description="DUT name must be between 1 and 64 characters.",
-                        ),
-                    ],  
-                )
-                yield Label("HW Language:")
-                yield Select(
-                    options=zip(SUPPORTED_TOP_LANG.keys(), SUPPORTED_TOP_LANG.keys()),
-                    allow_blank=False,
-                    id="toplevel_lang",
-                )
-                yield Label("Compile args:")
-                yield Input(
-                    placeholder="Compile arguments. Eg, -g2012 -D xxx=yyy.",
-                    id="compile_args",
-                    tooltip="Enter the compile arguments",
-                )
-                yield Label("Simulator:")
-                yield Select(
-                    options=zip(SUPPORTED_SIMULATORS, SUPPORTED_SIMULATORS),
-                    allow_blank=False,
-                    id="simulator",
-                )
-                yield Label("Simulation arguments:")
-                yield Input(
-                    placeholder="Simulator arguments. Eg, --vcd=anyname.vcd.",
-                    id="sim_args",
-                    tooltip="Enter the simulator arguments",
-                )
-                yield Label("Waveform:")
-                yield Checkbox("Enable", value=True, id="waves", tooltip="Enable or disable waveform generation.")
-
-        with HorizontalGroup():
-            yield Rule()
-            yield Button("CREATE", id="btn_ok", variant="primary")
-            yield Button("QUIT", id="btn_cancel", variant="default")
-            yield Rule()
-        
-        self._rich_log = RichLog(id="rich_log")
-        yield self._rich_log
-
-    def action_toggle_dark(self) -> None:
-        self.theme = (
-            "textual-dark" if self.theme == "textual-light" else "textual-light"
-        )
-
-    def rich_log(self, *messages, style=None) -> None:
-        if isinstance(messages, str):
-            messages = [messages,]
-        for message in messages:
-            if isinstance(message, str):
-                self._rich_log.write(Text(message, style=style))
-            else:
-                self._rich_log.write(message)
-
-    def action_create_project(self) -> None:
-        ns = SimpleNamespace()
-        ns.project_name = self.get_widget_by_id(f"project_name").value
-        ns.parent_folder = self.get_widget_by_id(f"parent_folder").value
-        ns.dut_file = self.get_widget_by_id("dut_file").value
-        ns.dut_module = self.get_widget_by_id("dut_module").value
-        ns.test_proc = self.get_widget_by_id("test_proc").value
-        ns.toplevel_lang = SUPPORTED_TOP_LANG[self.get_widget_by_id("toplevel_lang").value]
-        ns.compile_args = self.get_widget_by_id("compile_args").value
-        ns.simulator = self.get_widget_by_id("simulator").value
-        ns.sim_args = self.get_widget_by_id("sim_args").value
-        ns.waves = 1 if self.get_widget_by_id("waves").value else 0
-        self.do_create_project(ns)
-        
-    def do_create_project(self, ns):
-        # Pre-check the input values.
-        error_count = 0
-        error_style = "magenta"
-        info_style = ""
-        success_style = "green"
-        if not Path(ns.parent_folder).exists():
-            self.rich_log("Project folder don't exists.", style=error_style)
-            error_count += 1
-        if not re.match(r"^[a-zA-Z0-9_]+$", ns.project_name):
-            self.rich_log("Project name is invalid.", style=error_style)
-            error_count += 1
-        if not re.match(r"^[a-zA-Z0-9_]+$", ns.dut_module):
-            self.rich_log("DUT module name is invalid.", style=error_style)
-            error_count += 1
-        if error_count:
+            shutil.copy(Path(COCOTB_TEMPLATE) / fn, target_folder)
+            log(f"Copied {fn} to {target_folder}", style=INFO_STYLE)
+    log(f"Project {ns.project_name} created successfully.", style=SUCCESS_STYLE)
+    return target_folder
+
+def do_create_project(ns, log):
+    """Check the fields of a project and create it. It is the CREATE button of the UI."""
+    if check_project(ns, log):
+        return None
+    return render_project(ns, log)
+
+def console_log(prefix="", verbose=False):
+    """A log function like the one of the UI, which prints the errors to stderr and the rest to stdout.
+    The progress messages are only printed when verbose."""
+    def log(*messages, style=None):
+        if style == INFO_STYLE and not verbose:
             return
-        # Pre-check the parameters.
-        if not Path(COCOTB_TEMPLATE).is_dir():
-            self.rich_log(f"Folder {COCOTB_TEMPLATE} doesn't exist.", style=error_style)
-            error_count += 1
-        target_folder = Path(".") / ns.parent_folder / ns.project_name 
-        if Path(target_folder).exists():
-            self.rich_log(f"Folder {target_folder} already exists.", style=error_style)
+        for message in messages:
+            print(prefix + message, file=sys.stderr if style == ERROR_STYLE else sys.stdout)
+    return log
+
+def load_project_specs(fn):
+    """The projects of a spec file, as namespaces of the fields of project_defaults().
+
+    The spec is a YAML or JSON file of one project, a list of projects, or a mapping with the list in
+    "projects" and the fields shared by them in "defaults". The missing fields take the defaults of the UI.
+    """
+    path = Path(fn)
+    if not path.is_file():
+        raise Exit(f"No spec file {fn}.", code=1)
+    if path.suffix == ".json":
+        spec = json.loads(path.read_text())
+    else:
+        try:
+            import yaml
+        except ImportError:
+            raise Exit("Reading a YAML spec needs PyYAML. Install it with `pip install pyyaml`, or write the spec in JSON.", code=1)
+        spec = yaml.safe_load(path.read_text())
+    defaults = {}
+    if isinstance(spec, dict) and "projects" in spec:
+        defaults, spec = spec.get("defaults") or {}, spec["projects"]
+    projects = spec if isinstance(spec, list) else [spec]
+    fields = project_defaults()
+    result = []
+    for i, project in enumerate(projects, 1):
+        if not isinstance(project, dict) or not isinstance(defaults, dict):
+            raise Exit(f"Project {i} of {fn} is not a mapping of fields.", code=1)
+        values = {**fields, **defaults, **project}
+        unknown = set(values) - set(fields)
+        if unknown:
+            raise Exit(f"Unknown fields {', '.join(sorted(unknown))} of project {i} of {fn}. The fields are {', '.join(fields)}.", code=1)
+        ns = SimpleNamespace(**{name: "" if value is None else str(value) for name, value in values.items()})
+        # The HW language may be given as in the UI, e.g. VHDL.
+        ns.toplevel_lang = SUPPORTED_TOP_LANG.get(ns.toplevel_lang, ns.toplevel_lang)
+        ns.waves = 1 if values["waves"] not in (0, False, "0", "false", "no", "off") else 0
+        result.append(ns)
+    return result
+
+@task(help={"spec": "A YAML or JSON file of the projects to create without the UI, see README.md.",
+            "verbose": "Print every file copied into the projects of --spec."})
+def create_project(c, spec="", verbose=False):
+    """Create a cocotb project from the template with the UI, or the projects of a spec file."""
+    if not spec:
+        # textual is only imported for the UI, so the other tasks start without it.
+        from create_project_ui import CreaterProjectUi
+        app = CreaterProjectUi(do_create_project, project_defaults(), SUPPORTED_SIMULATORS, SUPPORTED_TOP_LANG)
+        app.run()
+        return
+    projects = load_project_specs(spec)
+    # All the projects are checked before the first one is created, so a bad spec creates nothing.
+    error_count = 0
+    folders = set()
+    for i, ns in enumerate(projects, 1):
+        log = console_log(f"{ns.project_name or f'Project {i}'}: ", verbose)
+        error_count += check_project(ns, log)
+        folder = project_folder(ns).resolve()
+        if folder in folders:
+            log(f"Folder {project_folder(ns)} is given twice.", style=ERROR_STYLE)
             error_count += 1
-        if error_count:
-            return
-                
-        # Create the project.
-        self.rich_log("Creating project...", style=info_style)
+        folders.add(folder)
+    if error_count:
+        raise Exit(f"{error_count} errors in {spec}. No project is created.", code=1)
+    for ns in projects:
+        if render_project(ns, console_log(f"{ns.project_name}: ", verbose)) is None:
+            raise Exit(f"Failed to create {ns.project_name}.", code=1)
+    print(f"Created {len(projects)} projects from {spec}.")
 
-        os.makedirs(target_folder)
-        if not Path(target_folder).is_dir():
-            self.rich_log(f"Failed to create folder {target_folder}.", style=error_style)
-            return
-        self.rich_log(f"Created folder {target_folder}.", style=info_style)
-
-        for fn in os.listdir(COCOTB_TEMPLATE):
-            if fn.lower() in ['makefile', 'dut.sv', 'test_proc.py']:
-                with open(Path(target_folder) / fn, "w") as f:
-                    content = (Path(COCOTB_TEMPLATE) / fn).read_text()
-                    f.write(content.format(**ns.__dict__))
-                self.rich_log(f"Generated {fn} to {target_folder}", style=info_style)
-            else:
-                shutil.copy(Path(COCOTB_TEMPLATE) / fn, target_folder)
-                self.rich_log(f"Copied {fn} to {target_folder}", style=info_style)
-        self.rich_log("Project created succssfully.", style=success_style)
-
-    @on(Input.Changed)
-    def show_invalid_reasons(self, event: Input.Changed) -> None:
-        if event.validation_result and not event.validation_result.is_valid:
-            self.rich_log(event.validation_result.failure_descriptions, style="magenta")
-        else:
-            self._rich_log.clear()
 
-    @on(Button.Pressed, "#btn_cancel")
-    def on_btn_cancel_pressed(self) -> None:
-        self.exit()
+def find_projects(folder=PROJECTS_FOLDER):
+    """Find the projects which have a cocotb Makefile."""
+    return sorted(fn.parent for fn in Path(folder).glob("*/Makefile") if "cocotb-config --makefiles" in fn.read_text())
+
+def sim_time_ns(testcase):
+    """Get the simulation time of a testcase in the results.xml, in ns."""
+    if testcase.get("sim_time_ns") is not None:
+        return float(testcase.get("sim_time_ns"))
+    props = {p.get("name"): p.get("value") for p in testcase.iter("property")}
+    if "sim_time_stop" not in props:
+        return 0.0
+    scale = {"fs": 1e-6, "ps": 1e-3, "ns": 1.0, "us": 1e3, "ms": 1e6, "s": 1e9}.get(props.get("sim_time_unit", "ns"), 1.0)
+    return (float(props["sim_time_stop"]) - float(props.get("sim_time_start", 0))) * scale
+
+def run_project(project, build_root, waves="off", seed=0, shards=1):
+    """Build and run the tests of a project in its own build folder. Return a summary of the run.
+
+    The project is run by `invoke run` of its tasks.py, so that it uses its build cache, and the seed, the waveform
+    mode and the shards are passed on. A project without tasks.py is run by make, with dumping only for "always".
+    """
+    build_dir = (Path(build_root) / project.name).absolute()
+    result_file = build_dir / "results.xml"
+    # The log is kept beside the build folder, since `invoke run` clears the build folder of a stale build.
+    log_file = (Path(build_root) / f"{project.name}.log").absolute()
+    build_dir.mkdir(parents=True, exist_ok=True)
+    result_file.unlink(missing_ok=True)
+    if (project / "tasks.py").is_file():
+        cmd = [sys.executable, "tasks.py", "run", f"--waves={waves}", f"--jobs={shards}", f"--seed={seed}"]
+    else:
+        cmd = ["make", "-f", "Makefile", str(result_file), f"WAVES={int(waves == 'always')}",
+               f"SIM_BUILD={build_dir}", f"COCOTB_RESULTS_FILE={result_file}"]
+    start = time.perf_counter()
+    # Some Makefiles use $(PWD) for the sources, so it has to follow the working folder.
+    env = dict(os.environ, PWD=str(project.absolute()), SIM_BUILD=str(build_dir), RESULTS_FILE=str(result_file))
+    with open(log_file, "w") as log:
+        returncode = subprocess.run(cmd, cwd=project, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+    summary = SimpleNamespace(project=project.name, wall_time=time.perf_counter() - start, sim_time=0.0,
+                              tests=0, failures=0, returncode=returncode, suites=[])
+    if result_file.is_file():
+        for suite in ET.parse(result_file).getroot().iter("testsuite"):
+            suite.set("name", f"{project.name}.{suite.get('name', 'all')}")
+            for testcase in suite.iter("testcase"):
+                summary.tests += 1
+                summary.sim_time += sim_time_ns(testcase)
+                if testcase.find("failure") is not None or testcase.find("error") is not None:
+                    summary.failures += 1
+            summary.suites.append(suite)
+    else:
+        summary.failures += 1
+    return summary
+
+@task(help={
+    "jobs": "Number of projects run at the same time. Default to the number of CPUs.",
+    "output": "The merged JUnit report.",
+    "waves": "Waveform dumping of the projects: off (default), always, on-fail or window, like `invoke run`.",
+    "seed": "The random seed of all the projects. Default to a new one per project, printed in its log.",
+    "shards": "Number of shards of each project, like --jobs of `invoke run`.",
+})
+def regress(c, jobs=0, output=f"{REGRESS_BUILD}/results.xml", waves="off", seed=0, shards=1):
+    """Run the tests of all projects concurrently."""
+    projects = find_projects()
+    if not projects:
+        raise Exit(f"No cocotb project found in {PROJECTS_FOLDER}.", code=1)
+    jobs = jobs or os.cpu_count() or 1
+    print(f"Running {len(projects)} projects, {jobs} at a time...")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        summaries = list(pool.map(lambda project: run_project(project, REGRESS_BUILD, waves, seed, shards), projects))
+
+    merged = ET.Element("testsuites", name="regress")
+    for summary in summaries:
+        merged.extend(summary.suites)
+    ET.indent(merged)
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    ET.ElementTree(merged).write(output, encoding="UTF-8", xml_declaration=True)
+
+    lines = [f"{'Project':24} {'Result':6} {'Tests':>5} {'Wall time (s)':>14} {'Sim time (ns)':>16}"]
+    for s in summaries:
+        result = "PASS" if s.failures == 0 and s.returncode == 0 else "FAIL"
+        lines.append(f"{s.project:24} {result:6} {s.tests:5} {s.wall_time:14.2f} {s.sim_time:16.0f}")
+    table = "\n".join(lines)
+    print(table)
+    (Path(REGRESS_BUILD) / "summary.txt").write_text(table + "\n")
+    print(f"JUnit report: {output}")
+    failed = [s.project for s in summaries if s.failures or s.returncode]
+    if failed:
+        raise Exit(f"Failed projects: {', '.join(failed)}", code=1)
+
+def run_measured(cmd, cwd, env, log):
+    """Run a command. Return its exit code, wall time and the peak RSS in MB of it and its children."""
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    # wait4() reports the peak RSS of the simulator too, since make waits for it.
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, time.perf_counter() - start, usage.ru_maxrss / 1024
+
+def bench_project(project, sim, build_root):
+    """Build and run a project from scratch with a simulator and measure it. Return the metrics as a dict."""
+    build_dir = (Path(build_root) / f"{project.name}.{sim}").absolute()
+    shutil.rmtree(build_dir, ignore_errors=True)
+    build_dir.mkdir(parents=True)
+    result_file = build_dir / "results.xml"
+    make = ["make", "-f", "Makefile", f"SIM={sim}", "WAVES=0", f"SIM_BUILD={build_dir}", f"COCOTB_RESULTS_FILE={result_file}"]
+    env = dict(os.environ, PWD=str(project.absolute()))
+    metrics = {"project": project.name, "sim": sim, "passed": False}
+    with open(build_dir / "run.log", "w") as log:
+        returncode, metrics["build_s"], metrics["build_rss_mb"] = run_measured(make + [str(build_dir / BENCH_SIMULATORS[sim][1])], project, env, log)
+        if returncode:
+            return metrics
+        returncode, run_time, metrics["peak_rss_mb"] = run_measured(make + [str(result_file)], project, env, log)
+    if not result_file.is_file():
+        return metrics
+    testcases = list(ET.parse(result_file).getroot().iter("testcase"))
+    # The tests' own time excludes the start of the simulator and of Python.
+    test_time = sum(float(t.get("time", 0)) for t in testcases)
+    metrics["startup_s"] = run_time - test_time
+    metrics["test_s"] = test_time
+    metrics["passed"] = returncode == 0 and not any(t.find("failure") is not None or t.find("error") is not None for t in testcases)
+    bench_file = build_dir / "bench.json"
+    counts = json.loads(bench_file.read_text()) if bench_file.is_file() else {}
+    for name in ("vectors", "cycles"):
+        metrics[name] = counts.get(name, 0)
+        metrics[f"{name}_per_s"] = counts.get(name, 0) / test_time if test_time else 0.0
+    return metrics
+
+def load_history(fn):
+    if not Path(fn).is_file():
+        return {"version": BENCH_HISTORY_VERSION, "baseline": {}, "runs": []}
+    history = json.loads(Path(fn).read_text())
+    if history.get("version") != BENCH_HISTORY_VERSION:
+        raise Exit(f"{fn} has version {history.get('version')}, but version {BENCH_HISTORY_VERSION} is expected.", code=1)
+    return history
+
+@task(help={
+    "projects": "Comma separated projects to benchmark. Default to all projects.",
+    "sims": "Comma separated simulators. Default to the installed ones of " + ", ".join(BENCH_SIMULATORS) + ".",
+    "threshold": "Fail when the throughput drops by more than this fraction below the baseline.",
+    "repeat": "Run each benchmark this number of times and keep the fastest run.",
+    "history": "The JSON file which keeps the results and the baseline.",
+    "baseline": "Make this run the new baseline.",
+})
+def bench(c, projects="", sims="", threshold=0.1, repeat=1, history=BENCH_HISTORY, baseline=False):
+    """Benchmark the simulation throughput of the projects and compare it with the baseline."""
+    selected = [p for p in find_projects() if not projects or p.name in projects.split(",")]
+    if not selected:
+        raise Exit(f"No project found in {PROJECTS_FOLDER}.", code=1)
+    simulators = sims.split(",") if sims else [sim for sim, (cmd, _) in BENCH_SIMULATORS.items() if shutil.which(cmd)]
+    if not simulators:
+        raise Exit("No simulator installed.", code=1)
+    records = load_history(history)
+
+    results = []
+    for project in selected:
+        for sim in simulators:
+            print(f"Benchmarking {project.name} with {sim}...")
+            runs = [bench_project(project, sim, BENCH_BUILD) for _ in range(max(1, repeat))]
+            results.append(max(runs, key=lambda m: (m["passed"], m.get("cycles_per_s", 0))))
 
-    @on(Button.Pressed, "#btn_ok")
-    def on_btn_ok_pressed(self) -> None:
-        self.action_create_project()
+    lines = [f"{'Project':24} {'Sim':10} {'Result':6} {'Vectors/s':>10} {'Cycles/s':>10} {'Build (s)':>9} "
+             f"{'Startup (s)':>11} {'RSS (MB)':>8} {'vs baseline':>11}"]
+    regressions = []
+    for m in results:
+        key = f"{m['project']}/{m['sim']}"
+        base = records["baseline"].get(key)
+        change = ""
+        if m["passed"] and base and m["test_s"] < BENCH_MIN_TEST_TIME:
+            change = "too short"
+        elif m["passed"] and base:
+            ratios = [m[name] / base[name] for name in BENCH_THROUGHPUT if base.get(name)]
+            if ratios:
+                change = f"{min(ratios) - 1:+.1%}"
+                if min(ratios) < 1 - threshold:
+                    regressions.append(key)
+        if not m["passed"]:
+            lines.append(f"{m['project']:24} {m['sim']:10} {'FAIL':6} See {BENCH_BUILD}/{m['project']}.{m['sim']}/run.log")
+            continue
+        lines.append(f"{m['project']:24} {m['sim']:10} {'PASS':6} {m['vectors_per_s']:10.0f} {m['cycles_per_s']:10.0f} "
+                     f"{m['build_s']:9.2f} {m['startup_s']:11.2f} {m['peak_rss_mb']:8.0f} {change:>11}")
+    print("\n".join(lines))
 
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    records["runs"].append({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "host": platform.node(),
+                            "results": results})
+    # The first passing result of a benchmark becomes its baseline.
+    for m in results:
+        key = f"{m['project']}/{m['sim']}"
+        if m["passed"] and (baseline or key not in records["baseline"]):
+            records["baseline"][key] = m
+    Path(history).write_text(json.dumps(records, indent=2) + "\n")
+    print(f"Results appended to {history}.")
 
-@task
-def create_project(c):
-    app = CreaterProjectUi()
-    app.run()
+    failed = [f"{m['project']}/{m['sim']}" for m in results if not m["passed"]]
+    if failed:
+        raise Exit(f"Failed benchmarks: {', '.join(failed)}", code=1)
+    if regressions and not baseline:
+        raise Exit(f"Throughput dropped by more than {threshold:.0%}: {', '.join(regressions)}", code=1)
 
 
 if __name__ == "__main__":
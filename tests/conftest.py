@@ -0,0 +1,23 @@
+# coding: utf-8
+
+"""The tests of the files of cocotb_template, which are copied into every project. Run them with
+`python -m pytest tests` from the repository folder."""
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "cocotb_template"
+
+def load_template_module(name):
+    """Import a module of cocotb_template under a name of its own, so it isn't mixed up with tasks.py of the
+    repository."""
+    spec = importlib.util.spec_from_file_location(f"template_{name}", TEMPLATE / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope="session")
+def template_tasks():
+    return load_template_module("tasks")
@@ -0,0 +1,40 @@
+# coding: utf-8
+
+"""The build keys of the build folders of `invoke run`: sim_build, the shards and the rerun with dumping."""
+
+import re
+
+import pytest
+from invoke import MockContext, Result
+
+BUILD_DIRS = ("sim_build", "sim_build/shard_0", "sim_build/shard_1", "sim_build/waves")
+
+def make_context(sim, waves):
+    """A context which answers the commands of build_key() like make with cocotb's makefiles of `sim`.
+
+    The generated sources are in the build folder, like cocotb_iverilog_dump.v of Makefile.icarus.
+    """
+    run = {re.compile(r"(iverilog|verilator) -{1,2}[vV]"): Result(f"{sim} 1.0\n")}
+    for build_dir in BUILD_DIRS:
+        values = f"SIM={sim}\nTOPLEVEL=top\nVERILOG_SOURCES=/src/dut.sv {build_dir}/cocotb_iverilog_dump.v\nWAVES={waves}\n"
+        run[re.compile(rf".*print-build-vars.* SIM_BUILD={re.escape(build_dir)}( |$)")] = Result(values)
+    return MockContext(run=run, repeat=True)
+
+def keys(tasks, sim, waves):
+    c = make_context(sim, waves)
+    return [tasks.build_key(c, SIM_BUILD=build_dir, WAVES=waves) for build_dir in BUILD_DIRS]
+
+@pytest.mark.parametrize("sim, waves", [("icarus", 0), ("verilator", 0), ("verilator", 1)])
+def test_shared_key(template_tasks, sim, waves):
+    """The build folders share the image when it doesn't hold a path in its folder."""
+    assert len(set(keys(template_tasks, sim, waves))) == 1
+
+def test_icarus_dump_key(template_tasks):
+    """Icarus compiles the path of the waveform file into the image with WAVES=1, so the shards and the
+    rerun must each build their own."""
+    assert len(set(keys(template_tasks, "icarus", 1))) == len(BUILD_DIRS)
+
+def test_shares_image(template_tasks):
+    assert template_tasks.shares_image("icarus", "0")
+    assert not template_tasks.shares_image("icarus", "1")
+    assert template_tasks.shares_image("verilator", 1)
@@ -0,0 +1,160 @@
+# coding: utf-8
+
+"""The triggers of sim_utils.py, checked in a small design. The pytest test at the bottom builds it with cocotb's
+runner and the first simulator found, and runs the cocotb tests of this module in it."""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "cocotb_template"
+# The simulator imports this module too, with the same sys.path, so sim_utils is found in both.
+sys.path.insert(0, str(TEMPLATE))
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, FallingEdge, ReadOnly, RisingEdge, Timer
+from cocotb.utils import get_sim_time
+
+import sim_utils
+from sim_utils import cycles, negedge, ns, posedge, signal_reader, until_match
+
+# A register, so that q changes at the rising edges of clk.
+DESIGN = """\
+module top(input logic clk, input logic [7:0] d, output logic [7:0] q);
+    always_ff @(posedge clk) q <= d;
+endmodule
+"""
+
+CLOCK_NS = 10
+
+async def start_clock(dut):
+    cocotb.start_soon(Clock(dut.clk, CLOCK_NS, unit="ns").start())
+    await RisingEdge(dut.clk)
+
+@cocotb.test()
+async def edge_operators(dut):
+    """clk@posedge and clk@negedge are cocotb's edge triggers of the signal."""
+    assert dut.clk@posedge is RisingEdge(dut.clk)
+    assert dut.clk@negedge is FallingEdge(dut.clk)
+
+@cocotb.test()
+async def timer_operators(dut):
+    """Every 10@ns is a new Timer, so the tasks which await it at different times each wait 10 ns."""
+    timers = [10@ns, 10@ns]
+    assert timers[0] is not timers[1]
+    assert all(isinstance(timer, Timer) for timer in timers)
+    ends = {}
+
+    async def wait(name, delay):
+        await Timer(delay, unit="ns")
+        start = get_sim_time("ns")
+        await (10@ns)
+        ends[name] = round(get_sim_time("ns") - start)
+
+    tasks = [cocotb.start_soon(wait("first", 1)), cocotb.start_soon(wait("second", 4))]
+    for task in tasks:
+        await task
+    assert ends == {"first": 10, "second": 10}
+
+@cocotb.test()
+async def cycles_operators(dut):
+    """n@cycles(clk) reuses its ClockCycles, which tasks can await at the same time and one after another."""
+    await start_clock(dut)
+    assert 3@cycles(dut.clk) is 3@cycles(dut.clk)
+    assert cycles(dut.clk) is cycles(dut.clk)
+    assert isinstance(3@cycles(dut.clk), ClockCycles)
+    ends = []
+
+    async def wait(n):
+        start = get_sim_time("ns")
+        await (n@cycles(dut.clk))
+        ends.append((n, round(get_sim_time("ns") - start)))
+
+    tasks = [cocotb.start_soon(wait(3)), cocotb.start_soon(wait(3)), cocotb.start_soon(wait(5))]
+    for task in tasks:
+        await task
+    await wait(3)
+    assert sorted(ends) == [(3, 3 * CLOCK_NS)] * 3 + [(5, 5 * CLOCK_NS)]
+
+@cocotb.test()
+async def until_match_register(dut):
+    """A register is seen at the edge it changes on, and the wait returns before the next edge, where the test
+    bench can write the inputs again."""
+    dut.d.value = 0
+    await start_clock(dut)
+    changes = []
+
+    async def watch():
+        await dut.q.value_change
+        changes.append(get_sim_time("ns"))
+
+    cocotb.start_soon(watch())
+    await Timer(3, unit="ns")
+    dut.d.value = 5
+    await until_match(dut.q, 5, clk=dut.clk, timeout=10)
+    now = get_sim_time("ns")
+    assert changes and changes[0] < now < changes[0] + CLOCK_NS
+    dut.d.value = 6
+    await RisingEdge(dut.clk)
+    await Timer(1, unit="ns")
+    assert dut.q.value == 6
+
+@cocotb.test()
+async def until_match_timeout(dut):
+    """A timeout in cycles expires at the edge ClockCycles ends on."""
+    dut.d.value = 0
+    await start_clock(dut)
+    for timeout in (1, 2, 7):
+        await Timer(3, unit="ns")
+        start = get_sim_time("ns")
+        with pytest.raises(TimeoutError):
+            await until_match(dut.q, 1, clk=dut.clk, timeout=timeout)
+        end = get_sim_time("ns")
+        await Timer(3, unit="ns")
+        cycles_start = get_sim_time("ns")
+        await ClockCycles(dut.clk, timeout)
+        assert round(end - start) == round(get_sim_time("ns") - cycles_start)
+
+@cocotb.test()
+async def signal_reader_value(dut):
+    """signal_reader() reads the bits of the signal as str(handle.value) does, with and without the raw read."""
+    raw_read = sim_utils._raw_read
+    try:
+        sim_utils._raw_read = False
+        public = signal_reader(dut.q)
+    finally:
+        sim_utils._raw_read = raw_read
+    readers = (signal_reader(dut.q), public)
+    await start_clock(dut)
+    for value in (0, 5, 0xA5, 0xFF):
+        await FallingEdge(dut.clk)
+        dut.d.value = value
+        await RisingEdge(dut.clk)
+        await ReadOnly()
+        assert str(dut.q.value) == f"{value:08b}"
+        assert [read() for read in readers] == [f"{value:08b}"] * 2
+
+def find_simulator():
+    return next((sim for sim, command in (("verilator", "verilator"), ("icarus", "iverilog")) if shutil.which(command)), None)
+
+def run_module(tmp_path, module):
+    """Build the design and run the cocotb tests of a module in it. Return the number of tests and failures."""
+    runner_module = pytest.importorskip("cocotb_tools.runner")
+    sim = find_simulator()
+    if sim is None:
+        pytest.skip("No simulator (verilator or icarus) found.")
+    source = tmp_path / "top.sv"
+    source.write_text(DESIGN)
+    runner = runner_module.get_runner(sim)
+    build_dir = tmp_path / "sim_build"
+    runner.build(sources=[source], hdl_toplevel="top", build_dir=build_dir, timescale=("1ns", "1ps"))
+    results = runner.test(test_module=module, hdl_toplevel="top", build_dir=build_dir, test_dir=tmp_path,
+                          timescale=("1ns", "1ps"))
+    return runner_module.get_results(results)
+
+def test_triggers(tmp_path):
+    tests, failures = run_module(tmp_path, "test_sim_utils")
+    assert (tests, failures) == (6, 0)